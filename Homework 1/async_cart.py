@@ -0,0 +1,212 @@
+"""
+An asyncio facade over the shopping cart and inventory in cart.py, for
+storefronts that serve many customers from a single event loop.
+"""
+
+from collections import defaultdict
+import asyncio
+from cart import Cart, Inventory, Quantity
+
+
+class AsyncInventory:
+    """
+    An asyncio wrapper around an Inventory. Mutations of an item are
+    serialized with a per-SKU asyncio.Lock, and concurrent stock checks for
+    the same item share a single lookup of the underlying inventory.
+    """
+    def __init__(self, inventory, *, executor=None):
+        """
+        inventory: the Inventory to wrap
+        executor: an optional concurrent.futures executor. If given, every
+        call into the inventory runs on it, so that an inventory shared with
+        other threads can never block the event loop on one of its locks.
+        """
+        if type(inventory) is not Inventory:
+            raise TypeError("Expected Inventory")
+        self._inventory = inventory
+        self._executor = executor
+        self._locks = defaultdict(asyncio.Lock)
+        self._checks = dict()
+
+    def inventory(self):
+        """
+        Getter method for the wrapped Inventory.
+        """
+        return self._inventory
+
+    def lockFor(self, sku):
+        """
+        Returns the asyncio.Lock serializing mutations of the given item.
+        """
+        return self._locks[sku]
+
+    async def validateInStock(self, sku, quantity=1):
+        """
+        Checks that enough of an item is in stock, as Inventory.validateInStock
+        does. Every check of the same item that arrives while one is already
+        in flight waits for that one instead of starting its own.
+        """
+        Quantity.validated(quantity)
+        check = self._checks.get(sku)
+        if check is None:
+            check = asyncio.ensure_future(self._lookupStock(sku))
+            self._checks[sku] = check
+            check.add_done_callback(lambda _: self._finishCheck(sku, check))
+        stock = await asyncio.shield(check)
+        if stock < quantity:
+            raise ValueError("Requested quantity greater than stock")
+        return sku
+
+    async def _lookupStock(self, sku):
+        """
+        Looks up the stock of an item once on behalf of every waiting check,
+        after first yielding so that concurrent checks can join.
+        """
+        await asyncio.sleep(0)
+        return await self._call(self._inventory.lookup, sku)
+
+    def _finishCheck(self, sku, check):
+        """
+        Forgets a finished stock check so that later checks start afresh.
+        """
+        if self._checks.get(sku) is check:
+            del self._checks[sku]
+
+    async def lookup(self, sku):
+        """
+        Returns the current stock of an item.
+        """
+        return await self._call(self._inventory.lookup, sku)
+
+    async def addItem(self, sku, quantity):
+        """
+        Adds an item to the inventory.
+        """
+        async with self._locks[sku]:
+            return await self._call(self._inventory.addItem, sku, quantity)
+
+    async def subtractItem(self, sku, quantity):
+        """
+        Removes a quantity from the current stock of an item.
+        """
+        async with self._locks[sku]:
+            return await self._call(self._inventory.subtractItem, sku, quantity)
+
+    async def setItemStock(self, sku, quantity):
+        """
+        Sets an item's stock to the given quantity.
+        """
+        async with self._locks[sku]:
+            return await self._call(self._inventory.setItemStock, sku, quantity)
+
+    async def removeItem(self, sku):
+        """
+        Removes an item from the inventory.
+        """
+        async with self._locks[sku]:
+            return await self._call(self._inventory.removeItem, sku)
+
+    async def reserve(self, sku, quantity):
+        """
+        Atomically sets aside a quantity of an item, returning a Reservation.
+        """
+        async with self._locks[sku]:
+            return await self._call(self._inventory.reserve, sku, quantity)
+
+    async def commit(self, reservation):
+        """
+        Finalizes a reservation.
+        """
+        async with self._locks[reservation.sku]:
+            return await self._call(self._inventory.commit, reservation)
+
+    async def release(self, reservation):
+        """
+        Cancels a reservation, returning its stock to the inventory.
+        """
+        async with self._locks[reservation.sku]:
+            return await self._call(self._inventory.release, reservation)
+
+    async def _call(self, function, *args):
+        """
+        Calls into the inventory, on the executor if there is one.
+        """
+        if self._executor is None:
+            return function(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+
+class AsyncCart:
+    """
+    An asyncio wrapper around a Cart whose inventory is shared through an
+    AsyncInventory. Stock checks are batched with those of every other cart,
+    and the change itself is then made under the item's lock in the
+    AsyncInventory, so it never interleaves with an inventory mutation of
+    the same item that is still running on the executor. The change runs on
+    the executor too, since it may take the inventory's locks to reserve
+    stock. The batched check replaces the cart's own stock check, and every
+    change to the cart is made under the wrapper's lock, since a Cart is not
+    safe to change from two threads at once. Wrap each Cart only once.
+    """
+    def __init__(self, cart, inventory):
+        """
+        cart: the Cart to wrap
+        inventory: an AsyncInventory wrapping the cart's inventory
+        """
+        if type(cart) is not Cart:
+            raise TypeError("Expected Cart")
+        if type(inventory) is not AsyncInventory:
+            raise TypeError("Expected AsyncInventory")
+        if cart._inventory is not inventory.inventory():
+            raise ValueError("AsyncInventory must wrap the cart's inventory")
+        self._cart = cart
+        self._inventory = inventory
+        self._lock = asyncio.Lock()
+
+    def cart(self):
+        """
+        Getter method for the wrapped Cart.
+        """
+        return self._cart
+
+    def items(self):
+        """
+        Getter method for the cart's current contents.
+        """
+        return self._cart.items()
+
+    def totalCost(self, catalogue):
+        """
+        Calculates the total cost of all items in the cart in the given
+        catalogue.
+        """
+        return self._cart.totalCost(catalogue)
+
+    async def addItems(self, sku, quantity):
+        """
+        Adds one or more instances of an item to the shopping cart.
+        """
+        async with self._lock:
+            await self._inventory.validateInStock(sku)
+            async with self._inventory.lockFor(sku):
+                await self._inventory._call(self._cart._addItems, sku, quantity, True)
+
+    async def updateItemQuantity(self, sku, quantity):
+        """
+        Sets the quantity of an item in the shopping cart. A quantity the
+        cart already holds needs no stock check, as with
+        Cart.updateItemQuantity.
+        """
+        Quantity.validated(quantity)
+        async with self._lock:
+            if not self._cart._holdsEnough(sku, quantity):
+                await self._inventory.validateInStock(sku)
+            async with self._inventory.lockFor(sku):
+                await self._inventory._call(self._cart._updateItemQuantity, sku, quantity, True)
+
+    async def removeItem(self, sku):
+        """
+        Removes an item from the shopping cart.
+        """
+        async with self._lock, self._inventory.lockFor(sku):
+            await self._inventory._call(self._cart.removeItem, sku)
@@ -0,0 +1,148 @@
+import asyncio
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from cart import *
+from async_cart import *
+
+TEST_CUSTOMER_ID = 'ABC12345DE-A'
+TEST_SKU_1 = 'ABC_DEF_12'
+TEST_SKU_2 = 'GHI_JKL_34'
+
+
+class CountingInventory:
+    """
+    Counts how many times the wrapped inventory's stock is looked up.
+    """
+    def __init__(self, inventory):
+        self.lookups = 0
+        self._lookup = inventory.lookup
+        inventory.lookup = self
+
+    def __call__(self, sku):
+        self.lookups += 1
+        return self._lookup(sku)
+
+
+class AsyncInventoryTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.myInventory = Inventory([InventoryItem(TEST_SKU_1, 10)])
+        self.myAsyncInventory = AsyncInventory(self.myInventory)
+
+    async def test_concurrent_checks_share_one_lookup(self):
+        counter = CountingInventory(self.myInventory)
+        results = await asyncio.gather(*(self.myAsyncInventory.validateInStock(TEST_SKU_1) for _ in range(50)))
+        self.assertEqual(results, [TEST_SKU_1] * 50)
+        self.assertEqual(counter.lookups, 1)
+
+    async def test_batched_check_applies_each_quantity(self):
+        results = await asyncio.gather(self.myAsyncInventory.validateInStock(TEST_SKU_1, 5),
+                                       self.myAsyncInventory.validateInStock(TEST_SKU_1, 11),
+                                       return_exceptions=True)
+        self.assertEqual(results[0], TEST_SKU_1)
+        self.assertIsInstance(results[1], ValueError)
+
+    async def test_check_of_missing_item_fails(self):
+        with self.assertRaises(ValueError):
+            await self.myAsyncInventory.validateInStock(TEST_SKU_2)
+
+    async def test_later_checks_see_new_stock(self):
+        await self.myAsyncInventory.validateInStock(TEST_SKU_1, 10)
+        await self.myAsyncInventory.subtractItem(TEST_SKU_1, 5)
+        with self.assertRaises(ValueError):
+            await self.myAsyncInventory.validateInStock(TEST_SKU_1, 10)
+
+    async def test_mutations_on_executor(self):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            myAsyncInventory = AsyncInventory(Inventory([InventoryItem(TEST_SKU_1, 100)], concurrent=True),
+                                              executor=executor)
+            await asyncio.gather(*(myAsyncInventory.subtractItem(TEST_SKU_1, 1) for _ in range(40)))
+            self.assertEqual(await myAsyncInventory.lookup(TEST_SKU_1), 60)
+
+    def test_rejects_invalid_type(self):
+        with self.assertRaises(TypeError):
+            AsyncInventory("This is not an inventory!")
+
+
+class AsyncCartTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.myCatalogue = Catalogue([Item(TEST_SKU_1, "This is an item!", 2.50)])
+        self.myInventory = Inventory([InventoryItem(TEST_SKU_1, 10)])
+        self.myAsyncInventory = AsyncInventory(self.myInventory)
+
+    async def test_add_update_remove(self):
+        myCart = AsyncCart(Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory), self.myAsyncInventory)
+        await myCart.addItems(TEST_SKU_1, 2)
+        await myCart.addItems(TEST_SKU_1, 1)
+        self.assertEqual(myCart.totalCost(self.myCatalogue), 7.50)
+        await myCart.updateItemQuantity(TEST_SKU_1, 4)
+        self.assertEqual(dict(myCart.items()), {TEST_SKU_1: 4})
+        await myCart.removeItem(TEST_SKU_1)
+        self.assertEqual(dict(myCart.items()), {})
+
+    async def test_concurrent_customers_with_holds(self):
+        holds = HoldScheduler(self.myInventory, clock=ManualClock())
+        carts = [AsyncCart(Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory, holds=holds),
+                           self.myAsyncInventory) for _ in range(20)]
+        results = await asyncio.gather(*(myCart.addItems(TEST_SKU_1, 1) for myCart in carts),
+                                       return_exceptions=True)
+        self.assertEqual(sum(result is None for result in results), 10)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results if result is not None))
+
+    async def test_cart_changes_on_executor(self):
+        threads = set()
+        validateHas = self.myCatalogue.validateHas
+
+        def recordThread(*args):
+            threads.add(threading.get_ident())
+            return validateHas(*args)
+
+        self.myCatalogue.validateHas = recordThread
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            myCart = AsyncCart(Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory),
+                               AsyncInventory(self.myInventory, executor=executor))
+            await myCart.addItems(TEST_SKU_1, 2)
+            await myCart.updateItemQuantity(TEST_SKU_1, 3)
+        self.assertEqual(dict(myCart.items()), {TEST_SKU_1: 3})
+        self.assertTrue(threads)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    async def test_batched_check_replaces_cart_check(self):
+        counter = CountingInventory(self.myInventory)
+        checks = []
+        validateInStock = self.myInventory.validateInStock
+        self.myInventory.validateInStock = lambda *args: checks.append(args) or validateInStock(*args)
+        carts = [AsyncCart(Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory), self.myAsyncInventory)
+                 for _ in range(20)]
+        await asyncio.gather(*(myCart.addItems(TEST_SKU_1, 1) for myCart in carts))
+        self.assertEqual(counter.lookups, 1)
+        self.assertEqual(checks, [])
+
+    async def test_lowering_held_quantity_needs_no_stock(self):
+        holds = HoldScheduler(self.myInventory, clock=ManualClock())
+        self.myInventory.setItemStock(TEST_SKU_1, 3)
+        myCart = AsyncCart(Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory, holds=holds),
+                           self.myAsyncInventory)
+        await myCart.addItems(TEST_SKU_1, 3)
+        self.assertEqual(self.myInventory._items[TEST_SKU_1], 0)
+        await myCart.updateItemQuantity(TEST_SKU_1, 2)
+        self.assertEqual(dict(myCart.items()), {TEST_SKU_1: 2})
+        self.assertEqual(self.myInventory._items[TEST_SKU_1], 1)
+
+    async def test_changes_to_one_cart_are_serialized(self):
+        myCatalogue = Catalogue([Item(TEST_SKU_1, "This is an item!", 2.50), Item(TEST_SKU_2, "Another item!", 1.00)])
+        myInventory = Inventory([InventoryItem(TEST_SKU_1, 1000), InventoryItem(TEST_SKU_2, 1000)], concurrent=True)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            myCart = AsyncCart(Cart(TEST_CUSTOMER_ID, myCatalogue, myInventory),
+                               AsyncInventory(myInventory, executor=executor))
+            await asyncio.gather(*(myCart.addItems(sku, 1) for _ in range(100) for sku in (TEST_SKU_1, TEST_SKU_2)))
+        self.assertEqual(myCart.cart().version(), 200)
+        self.assertEqual(myCart.cart()._subtotalCents, 35000)
+
+    def test_rejects_other_inventory(self):
+        with self.assertRaises(ValueError):
+            AsyncCart(Cart(TEST_CUSTOMER_ID, self.myCatalogue, Inventory([])), self.myAsyncInventory)
+
+
+if __name__ == '__main__':
+    unittest.main()
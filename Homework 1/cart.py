@@ -3,14 +3,39 @@ Author: Kieran Ahn
 Last updated: 5/24/2023
 """
 
-from collections import Counter, namedtuple
-from copy import deepcopy
-from uuid import uuid4
+from array import array
+from bisect import bisect_left
+from collections import Counter, deque, namedtuple
+from collections.abc import Mapping, MutableMapping
+from contextlib import nullcontext
+from functools import lru_cache
+from heapq import heappop, heappush
+from itertools import count
+from math import ceil, floor, isclose
+from threading import Event, Lock, Thread
+from time import monotonic
+from uuid import UUID, uuid4
+from weakref import ref
+import csv
+import json
+import mmap
+import os
+import re
 import regex
+import struct
+import sys
+from catalogue_index import PriceIndex, SearchIndex
 
 CatalogItem = namedtuple("CatalogItem", ["sku", "description", "price"])
 InventoryItem = namedtuple("InventoryItem", ["sku", "stock"])
 
+VALIDATION_CACHE_SIZE = 65536
+
+_CUSTOMER_ID_PATTERN = regex.compile(r'^\p{L}{3}\d{5}\p{L}{2}-[AQ]$')
+_SKU_PATTERN = regex.compile(r'^[A-Z]{3}_[A-Z]{3}_\d{2}$')
+_ASCII_SKU_PATTERN = re.compile(r'^[A-Z]{3}_[A-Z]{3}_\d{2}$', re.ASCII)
+_ASCII_SKU_COLUMN_PATTERN = re.compile(r'(?:[A-Z]{3}_[A-Z]{3}_\d{2}\n)*', re.ASCII)
+
 def validatedString(toCheck, *, maxLength=1000):
     """
     Ensures that a given value is a string with a length no greater than
@@ -23,6 +48,14 @@ def validatedString(toCheck, *, maxLength=1000):
     return toCheck
 
 
+def toCents(price):
+    """
+    Converts a price in dollars to a whole number of cents, so that sums of
+    prices can be kept exactly instead of accumulating float error.
+    """
+    return round(price * 100)
+
+
 def validatedNumber(toCheck, *, minimum=1, maximum=float('inf')):
     """
     Ensures that a given value is either an int or float (i.e., a real 
@@ -37,6 +70,8 @@ def validatedNumber(toCheck, *, minimum=1, maximum=float('inf')):
         raise TypeError("Maximum must be a real number")
     if maximum < minimum:
         raise ValueError("Minimum must be less than maximum")
+    if toCheck != toCheck:
+        raise ValueError("Value cannot be NaN")
     if toCheck < minimum:
         raise ValueError(f'Value cannot be any less than {minimum}')
     if toCheck > maximum:
@@ -44,10 +79,75 @@ def validatedNumber(toCheck, *, minimum=1, maximum=float('inf')):
     return toCheck
 
 
+def validatedPrice(toCheck):
+    """
+    Ensures that a given value is a valid price: a real number of dollars
+    within the allowed range that is a whole number of cents, so that
+    toCents converts it exactly. If the value passes the checks, it is
+    returned.
+    """
+    validatedNumber(toCheck, minimum=0.01, maximum=999999999.99)
+    if not _isWholeCents(toCheck):
+        raise ValueError("Price must be a whole number of cents")
+    return toCheck
+
+
+def _isWholeCents(price):
+    """
+    Checks that a price is a whole number of cents, allowing for the float
+    error of prices such as 2.99 + 14 that were worked out in dollars.
+    """
+    return isclose(round(price, 2), price, rel_tol=1e-12)
+
+
+@lru_cache(maxsize=VALIDATION_CACHE_SIZE)
+def _isWellFormedCustomerID(id):
+    """
+    Checks a customer id string against the precompiled customer id pattern.
+    Results are cached, so repeated ids skip the regex engine entirely.
+    """
+    return _CUSTOMER_ID_PATTERN.match(id) is not None
+
+
+@lru_cache(maxsize=VALIDATION_CACHE_SIZE)
+def _isWellFormedSKU(code):
+    """
+    Checks a SKU string against the precompiled SKU pattern. ASCII-only codes
+    are matched with the standard library engine, which is much cheaper than
+    the Unicode-aware one; anything else (e.g. non-ASCII digits) still goes
+    through regex so the accepted format does not change.
+    """
+    if code.isascii():
+        return _ASCII_SKU_PATTERN.match(code) is not None
+    return _SKU_PATTERN.match(code) is not None
+
+
+def validationCacheInfo():
+    """
+    Returns the hit/miss counters and sizes of the customer id and SKU
+    validation caches.
+    """
+    return {
+        "customerId": _isWellFormedCustomerID.cache_info()._asdict(),
+        "sku": _isWellFormedSKU.cache_info()._asdict(),
+    }
+
+
+def clearValidationCaches():
+    """
+    Empties the customer id and SKU validation caches and resets their
+    counters.
+    """
+    _isWellFormedCustomerID.cache_clear()
+    _isWellFormedSKU.cache_clear()
+
+
 class CustomerID:
     """
     A class representing the ID of a customer who owns a shopping cart.
     """
+    __slots__ = ("_id",)
+
     def __init__(self, id):
         """
         id: the customer's id
@@ -61,7 +161,7 @@ class CustomerID:
         """
         if type(id) is not str:
             raise TypeError("Customer ID must be a string")
-        if regex.match(r'^\p{L}{3}\d{5}\p{L}{2}-[AQ]$', id) is None:
+        if not _isWellFormedCustomerID(id):
             raise ValueError("Customer ID must be formatted correctly")
         return id
 
@@ -71,6 +171,8 @@ class SKU:
     A wrapper class containing a stock-keeping unit, which is a unique
     identifier for every distinct item in the catalogue.
     """
+    __slots__ = ("_code",)
+
     def __init__(self, code):
         """
         code: the SKU to be stored
@@ -80,13 +182,15 @@ class SKU:
     @staticmethod
     def validated(code):
         """
-        Validates that a given value is a correctly formatted SKU.
+        Validates that a given value is a correctly formatted SKU. The SKU is
+        returned interned, so that the catalogue, the inventory and every
+        cart holding the item all share one copy of the string.
         """
         if type(code) is not str:
             raise TypeError("SKU must be a string")
-        if regex.match(r'^[A-Z]{3}_[A-Z]{3}_\d{2}$', code) is None:
+        if not _isWellFormedSKU(code):
             raise ValueError("SKU must be formatted correctly")
-        return code
+        return sys.intern(code)
     
     def code(self):
         """
@@ -99,6 +203,8 @@ class Quantity:
     """
     A wrapper class for a quantity, which is any positive integer.
     """
+    __slots__ = ("_value",)
+
     def __init__(self, value):
         """
         value: the quantity to be stored
@@ -127,6 +233,8 @@ class Item:
     """
     An item in an online storefront, containing a SKU, description, and price.
     """
+    __slots__ = ("_sku", "_description", "_price")
+
     def __init__(self, sku, description, price):
         """
         sku: a valid SKU string
@@ -135,7 +243,7 @@ class Item:
         """
         self._sku = SKU.validated(sku)
         self._description = validatedString(description, maxLength=1000)
-        self._price = validatedNumber(price, minimum=0.01, maximum=999999999.99)
+        self._price = validatedPrice(price)
 
     def sku(self):
         """
@@ -156,31 +264,201 @@ class Item:
         return self._price
 
 
+class CartItems(MutableMapping):
+    """
+    A copy-on-write view of a shopping cart's contents, as returned by
+    Cart.items(). Reading through the view costs nothing; the first write to
+    it copies the underlying items, so changes made through the view never
+    reach the cart, and the cart copies its own items before changing them
+    while a view is outstanding.
+
+    The view reads like the Counter that Cart.items() used to return:
+    most_common, elements, total, update, subtract and the Counter
+    operators all work on it, and the operators return Counters.
+    """
+    __slots__ = ("_items", "_owned", "_version")
+
+    def __init__(self, items, version):
+        """
+        items: the cart's Counter of SKU to quantity
+        version: the cart version the items were read at
+        """
+        self._items = items
+        self._owned = False
+        self._version = version
+
+    def version(self):
+        """
+        Getter method for the cart version this view was read at.
+        """
+        return self._version
+
+    def copy(self):
+        """
+        Returns an independent Counter with the same contents as the view.
+        """
+        return Counter(self._items)
+
+    def get(self, sku, default=None):
+        """
+        Returns the quantity of an item in the view, or default if the item
+        is not in it.
+        """
+        return self._items[sku] if sku in self._items else default
+
+    def __getitem__(self, sku):
+        return self._items[sku]
+
+    def __setitem__(self, sku, quantity):
+        self._own()
+        self._items[sku] = quantity
+
+    def __delitem__(self, sku):
+        self._own()
+        del self._items[sku]
+
+    def __contains__(self, sku):
+        return sku in self._items
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def most_common(self, n=None):
+        """
+        Returns the n items in the view with the largest quantities, as
+        Counter.most_common does.
+        """
+        return self._items.most_common(n)
+
+    def elements(self):
+        """
+        Returns an iterator over each SKU in the view repeated as many times
+        as its quantity.
+        """
+        return self._items.elements()
+
+    def total(self):
+        """
+        Returns the sum of the quantities in the view.
+        """
+        return sum(self._items.values())
+
+    def update(self, other=(), **quantities):
+        """
+        Adds quantities to the view, as Counter.update does.
+        """
+        self._own()
+        self._items.update(other, **quantities)
+
+    def subtract(self, other=(), **quantities):
+        """
+        Subtracts quantities from the view, as Counter.subtract does.
+        """
+        self._own()
+        self._items.subtract(other, **quantities)
+
+    def __eq__(self, other):
+        if type(other) is CartItems:
+            other = other._items
+        return self._items == other
+
+    def __add__(self, other):
+        return self._combined(other, Counter.__add__)
+
+    def __sub__(self, other):
+        return self._combined(other, Counter.__sub__)
+
+    def __or__(self, other):
+        return self._combined(other, Counter.__or__)
+
+    def __and__(self, other):
+        return self._combined(other, Counter.__and__)
+
+    def __pos__(self):
+        return +self._items
+
+    def __neg__(self):
+        return -self._items
+
+    def __repr__(self):
+        return f'CartItems({dict(self._items)!r})'
+
+    def _combined(self, other, operator):
+        """
+        Applies a Counter operator to the view and a Counter or another view.
+        """
+        if type(other) is CartItems:
+            other = other._items
+        if not isinstance(other, Counter):
+            return NotImplemented
+        return operator(self._items, other)
+
+    def _own(self):
+        """
+        Detaches the view from the cart's items before its first write.
+        """
+        if not self._owned:
+            self._items = Counter(self._items)
+            self._owned = True
+
+
 class Cart:
     """
-    A shopping cart for an online storefront.
+    A shopping cart for an online storefront. Carts are slotted, since a
+    storefront may keep millions of them in memory at once.
     """
-    def __init__(self, customerId, catalogue, inventory):
+    __slots__ = ("_id", "_customerId", "_items", "_itemsShared", "_version", "_catalogue", "_inventory",
+                 "_holdScheduler", "_holds", "_subtotalCents", "_subtotalStale", "_store", "__weakref__")
+
+    def __init__(self, customerId, catalogue, inventory, *, holds=None):
         """
         customerId: a valid customer ID string
         catalogue: a Catalogue
         inventory: an Inventory
+        holds: an optional HoldScheduler for the inventory. If given, the cart
+        holds the stock of everything in it for a limited time.
         """
-        self._id = uuid4()
+        self._id = uuid4().int
         self._customerId = CustomerID.validated(customerId)
         self._items = Counter()
+        self._itemsShared = False
+        self._version = 0
         if type(catalogue) is not Catalogue:
             raise TypeError("Expected Catalogue")
         if type(inventory) is not Inventory:
             raise TypeError("Expected Inventory")
+        if holds is not None and type(holds) is not HoldScheduler:
+            raise TypeError("Expected HoldScheduler")
+        if holds is not None and holds._inventory is not inventory:
+            raise ValueError("HoldScheduler must belong to the cart's inventory")
         self._catalogue = catalogue
         self._inventory = inventory
+        self._holdScheduler = holds
+        self._holds = dict()
+        self._subtotalCents = 0
+        self._subtotalStale = False
+        self._store = None
+
+    def __del__(self):
+        """
+        Unsubscribes an abandoned cart from the price changes of its items.
+        """
+        try:
+            catalogue = self._catalogue
+            items = self._items
+        except AttributeError:
+            return
+        for sku in items:
+            catalogue._unsubscribe(self, sku)
 
     def id(self):
         """
         Getter method for the shopping cart's unique id.
         """
-        return self._id
+        return UUID(int=self._id)
     
     def customerId(self):
         """
@@ -188,61 +466,715 @@ class Cart:
         """
         return self._customerId
     
+    def version(self):
+        """
+        Getter method for the cart's version, which increases every time its
+        contents change.
+        """
+        return self._version
+
     def items(self):
         """
-        Getter method for the cart's current contents.
+        Getter method for the cart's current contents. The returned CartItems
+        is a copy-on-write view, so it is cheap to take and writing to it does
+        not affect the cart.
+        """
+        self._itemsShared = True
+        return CartItems(self._items, self._version)
+
+    def itemsSince(self, version):
+        """
+        Returns the cart's current contents if they have changed since the
+        given version, or None if they have not, so that callers holding an
+        earlier view can skip re-reading an unchanged cart.
         """
-        return deepcopy(self._items)
+        if version == self._version:
+            return None
+        return self.items()
     
     def addItems(self, sku, quantity):
         """
         Adds one or more instances of an item to the shopping cart. The item
         must exist in the given catalogue and be in stock in the given inventory.
         """
-        SKU.validated(sku)
+        self._addItems(sku, quantity)
+
+    def _addItems(self, sku, quantity, stockChecked=False):
+        """
+        Adds instances of an item as addItems does. If stockChecked, the
+        caller has already checked that the item is in stock, as AsyncCart
+        does with its batched checks, and the check is not repeated.
+        """
+        sku = SKU.validated(sku)
         self._catalogue.validateHas(sku)
-        self._inventory.validateInStock(sku)
+        if not stockChecked:
+            self._inventory.validateInStock(sku)
         Quantity.validated(quantity)
-        self._items[sku] += quantity
+        change = self._subtotalChange(sku, quantity)
+        self._placeHolds({sku: self._items[sku] + quantity})
+        self._writableItems()[sku] += quantity
+        self._adjustSubtotal(change)
+        self._catalogue._subscribe(self, sku)
 
     def removeItem(self, sku):
         """
         Removes an item from the shopping cart.
         """
         SKU.validated(sku)
-        del self._items[sku]
+        change = self._subtotalChange(sku, -self._items[sku]) if sku in self._items else 0
+        self._placeHolds({sku: 0})
+        del self._writableItems()[sku]
+        self._adjustSubtotal(change)
+        self._catalogue._unsubscribe(self, sku)
 
     def updateItemQuantity(self, sku, quantity):
         """
         Sets the quantity of an item in the shopping cart. The item must exist
         in the given catalogue and be in stock in the given inventory.
         """
-        SKU.validated(sku)
+        self._updateItemQuantity(sku, quantity)
+
+    def _updateItemQuantity(self, sku, quantity, stockChecked=False):
+        """
+        Sets the quantity of an item as updateItemQuantity does, without
+        checking its stock again if stockChecked.
+        """
+        sku = SKU.validated(sku)
         self._catalogue.validateHas(sku)
-        self._inventory.validateInStock(sku)
         Quantity.validated(quantity)
-        self._items[sku] = quantity
+        if not stockChecked and not self._holdsEnough(sku, quantity):
+            self._inventory.validateInStock(sku)
+        change = self._subtotalChange(sku, quantity - self._items[sku])
+        self._placeHolds({sku: quantity})
+        self._writableItems()[sku] = quantity
+        self._adjustSubtotal(change)
+        self._catalogue._subscribe(self, sku)
+
+    def addItemsBatch(self, lines):
+        """
+        Adds many items to the shopping cart at once. lines is an iterable of
+        (sku, quantity) pairs; a SKU may appear more than once, in which case
+        its quantities are summed. Every line is checked against the catalogue
+        and inventory before any of them is applied, so either the whole batch
+        is added or, if any line is invalid, none of it is.
+        """
+        pending = Counter()
+        for (sku, quantity) in self._validatedLines(lines):
+            pending[sku] += quantity
+        changes = [self._subtotalChange(sku, quantity) for (sku, quantity) in pending.items()]
+        self._placeHolds({sku: self._items[sku] + quantity for (sku, quantity) in pending.items()})
+        self._writableItems().update(pending)
+        for (sku, change) in zip(pending, changes):
+            self._adjustSubtotal(change)
+            self._catalogue._subscribe(self, sku)
+
+    def updateQuantities(self, quantities):
+        """
+        Sets the quantities of many items in the shopping cart at once.
+        quantities is a mapping of SKU to the new quantity. As with
+        addItemsBatch, the update is applied only if every entry is valid.
+        """
+        try:
+            lines = quantities.items()
+        except AttributeError:
+            raise TypeError("Expected mapping")
+        validated = self._validatedLines(lines, replacing=True)
+        changes = [self._subtotalChange(sku, quantity - self._items[sku]) for (sku, quantity) in validated]
+        self._placeHolds(dict(validated))
+        items = self._writableItems()
+        for ((sku, quantity), change) in zip(validated, changes):
+            items[sku] = quantity
+            self._adjustSubtotal(change)
+            self._catalogue._subscribe(self, sku)
+
+    def holds(self):
+        """
+        Returns the reservations the cart currently holds, some of which may
+        have expired. Empty if the cart was not given a HoldScheduler.
+        """
+        return [reservation for reservations in self._holds.values() for reservation in reservations]
+
+    def releaseHolds(self):
+        """
+        Returns all stock held by the cart to the inventory, e.g. when the
+        cart is abandoned. The cart's contents are left unchanged.
+        """
+        if self._holdScheduler is not None:
+            self._placeHolds({sku: 0 for sku in self._holds})
+
+    def _placeHolds(self, quantities):
+        """
+        Adjusts the cart's holds so that each SKU in the given mapping is held
+        in its new quantity. New stock is held for every increase before any
+        hold is given up, so if the inventory cannot cover an increase the
+        error is raised with the cart's holds unchanged.
+        """
+        if self._holdScheduler is None:
+            return
+        placed = []
+        try:
+            for (sku, quantity) in quantities.items():
+                if quantity > self._items[sku]:
+                    placed.append(self._holdScheduler.hold(sku, quantity - self._items[sku]))
+        except ValueError:
+            for reservation in placed:
+                self._holdScheduler.release(reservation)
+            raise
+        for reservation in placed:
+            self._holds.setdefault(reservation.sku, []).append(reservation)
+        for (sku, quantity) in quantities.items():
+            if quantity < self._items[sku] or (quantity == 0 and sku in self._holds):
+                for reservation in self._holds.pop(sku, []):
+                    self._holdScheduler.release(reservation)
+                if quantity > 0:
+                    self._holds[sku] = [self._holdScheduler.hold(sku, quantity)]
+
+    def _writableItems(self):
+        """
+        Returns the cart's items ready to be changed, copying them first if a
+        CartItems view still shares them, and bumps the cart's version. A cart
+        kept in a CartStore is marked to be written back.
+        """
+        if self._itemsShared:
+            self._items = Counter(self._items)
+            self._itemsShared = False
+        if self._store is not None:
+            self._store._markDirty(self)
+        self._version += 1
+        return self._items
+
+    def _subtotalChange(self, sku, quantityChange):
+        """
+        Returns how much the running subtotal changes by when the quantity of
+        an item changes, or None if the item's price is unknown. It is worked
+        out before the cart is changed, so that a price that cannot be read
+        leaves the cart as it was.
+        """
+        if self._subtotalStale:
+            return 0
+        if sku in self._catalogue._items:
+            return quantityChange * self._catalogue._priceInCents(sku)
+        return None
+
+    def _adjustSubtotal(self, change):
+        """
+        Updates the running subtotal by a change from _subtotalChange after
+        the quantity of an item changes. A stale subtotal is left for
+        totalCost to rebuild.
+        """
+        if change is None:
+            self._subtotalStale = True
+        elif not self._subtotalStale:
+            self._subtotalCents += change
+
+    def _repriceLine(self, sku, oldCents, newCents):
+        """
+        Called by the cart's catalogue when the price of an item in the cart
+        changes, so that only that line is re-priced. newCents is None if
+        the item was deleted from the catalogue.
+        """
+        if self._subtotalStale:
+            return
+        if newCents is None:
+            self._subtotalStale = True
+        else:
+            self._subtotalCents += self._items[sku] * (newCents - oldCents)
+
+    def _holdsEnough(self, sku, quantity):
+        """
+        Checks whether the cart already holds the stock for a new quantity of
+        an item, so that lowering a quantity never needs stock the cart's own
+        holds have taken out of the inventory.
+        """
+        return self._holdScheduler is not None and 0 < quantity <= self._items[sku]
+
+    def _validatedLines(self, lines, replacing=False):
+        """
+        Validates an iterable of (sku, quantity) pairs in a single pass against
+        the catalogue and inventory, and returns them as a list. If replacing,
+        the quantities replace those in the cart rather than adding to them.
+        """
+        try:
+            iter(lines)
+        except:
+            raise TypeError("Expected iterable")
+        skuValidated = SKU.validated
+        quantityValidated = Quantity.validated
+        catalogueItems = self._catalogue._items
+        inventoryItems = self._inventory._items
+        validated = []
+        for line in lines:
+            if type(line) is not tuple or len(line) != 2:
+                raise TypeError("Expected (sku, quantity) pairs")
+            (sku, quantity) = line
+            sku = skuValidated(sku)
+            if sku not in catalogueItems:
+                raise ValueError(f'No item with SKU {sku} found in catalogue')
+            quantityValidated(quantity)
+            if not inventoryItems.get(sku) and not (replacing and self._holdsEnough(sku, quantity)):
+                raise ValueError("Item not in stock")
+            validated.append((sku, quantity))
+        return validated
 
     def totalCost(self, catalogue):
         """
         Calculates the total cost of all items in the cart in the 
-        given catalogue.
+        given catalogue. For the cart's own catalogue this is a running
+        subtotal, which the catalogue keeps up to date as prices change.
+        """
+        if catalogue is self._catalogue:
+            if self._subtotalStale:
+                self._subtotalCents = self._totalCents(catalogue)
+                self._subtotalStale = False
+            return self._subtotalCents / 100
+        return self._totalCents(catalogue) / 100
+
+    def _totalCents(self, catalogue):
+        """
+        Sums the cost of every item in the cart in the given catalogue, in
+        cents.
         """
         total = 0
         for (sku, amount_in_cart) in self._items.items():
-            total += catalogue.lookup(sku).price * amount_in_cart
+            total += toCents(catalogue.lookup(sku).price) * amount_in_cart
         return total
 
 
+class ColumnarCatalogItems(MutableMapping):
+    """
+    A compact, column-oriented store of CatalogItems for very large
+    catalogues. Each interned SKU maps to a row number; prices are kept as
+    cents in an array of 64-bit integers, and descriptions are kept UTF-8
+    encoded in one shared buffer addressed by per-row offsets and lengths.
+    CatalogItems are only built when an item is looked up. Prices are stored
+    to the cent.
+
+    Rows of deleted items are reused by the next items added, and once more
+    than half of the description buffer is taken up by descriptions that
+    were replaced or deleted, the buffer is rebuilt without them.
+    """
+    def __init__(self):
+        self._rows = dict()
+        self._prices = array('q')
+        self._offsets = array('q')
+        self._lengths = array('l')
+        self._descriptions = bytearray()
+        self._freeRows = []
+        self._garbage = 0
+
+    def __getitem__(self, sku):
+        row = self._rows[sku]
+        offset = self._offsets[row]
+        description = self._descriptions[offset:offset + self._lengths[row]].decode('utf-8')
+        return CatalogItem(sku, description, self._prices[row] / 100)
+
+    def __setitem__(self, sku, item):
+        encoded = item.description.encode('utf-8')
+        row = self._rows.get(sku)
+        if row is None and not self._freeRows:
+            self._rows[sys.intern(sku)] = len(self._prices)
+            self._prices.append(toCents(item.price))
+            self._offsets.append(len(self._descriptions))
+            self._lengths.append(len(encoded))
+            self._descriptions += encoded
+            return
+        if row is None:
+            row = self._freeRows.pop()
+            self._rows[sys.intern(sku)] = row
+        else:
+            offset = self._offsets[row]
+            if self._descriptions[offset:offset + self._lengths[row]] == encoded:
+                self._prices[row] = toCents(item.price)
+                return
+            self._garbage += self._lengths[row]
+        self._prices[row] = toCents(item.price)
+        self._offsets[row] = len(self._descriptions)
+        self._lengths[row] = len(encoded)
+        self._descriptions += encoded
+        self._compactIfWasteful()
+
+    def __delitem__(self, sku):
+        row = self._rows.pop(sku)
+        self._garbage += self._lengths[row]
+        self._lengths[row] = 0
+        self._freeRows.append(row)
+        self._compactIfWasteful()
+
+    def __contains__(self, sku):
+        return sku in self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def priceInCents(self, sku):
+        """
+        Returns the price of an item in cents without building a CatalogItem.
+        """
+        return self._prices[self._rows[sku]]
+
+    def _compactIfWasteful(self):
+        """
+        Rebuilds the description buffer without the descriptions no row
+        uses any more, once they take up more than half of it.
+        """
+        if self._garbage * 2 <= len(self._descriptions):
+            return
+        descriptions = bytearray()
+        for row in self._rows.values():
+            offset = self._offsets[row]
+            self._offsets[row] = len(descriptions)
+            descriptions += self._descriptions[offset:offset + self._lengths[row]]
+        self._descriptions = descriptions
+        self._garbage = 0
+
+
+CATALOGUE_FILE_MAGIC = b'CATL'
+CATALOGUE_FILE_VERSION = 1
+_CATALOGUE_FILE_HEADER = struct.Struct('<4sIQ')
+_CATALOGUE_FILE_SKU_WIDTH = 16
+
+
+def writeCatalogueFile(path, items):
+    """
+    Writes an iterable of Items or CatalogItem namedtuples to a binary
+    catalogue file that Catalogue.open_mmap can read. The file holds a
+    header, the UTF-8 encoded SKUs in sorted order padded to a fixed width,
+    a column of prices in cents, a column of description offsets, and
+    finally every description back to back.
+    """
+    rows = dict()
+    try:
+        iter(items)
+    except:
+        raise TypeError("Expected iterable")
+    for item in items:
+        if type(item) is Item:
+            item = CatalogItem(item.sku(), item.description(), item.price())
+        elif type(item) is not CatalogItem:
+            raise TypeError("Item or CatalogItem type expected")
+        encodedSKU = SKU.validated(item.sku).encode('utf-8')
+        if len(encodedSKU) > _CATALOGUE_FILE_SKU_WIDTH:
+            raise ValueError(f'SKU {item.sku} is too long to be stored')
+        rows[encodedSKU] = item
+    skus = sorted(rows)
+    prices = array('q', (toCents(rows[sku].price) for sku in skus))
+    offsets = array('q', [0])
+    descriptions = bytearray()
+    for sku in skus:
+        descriptions += rows[sku].description.encode('utf-8')
+        offsets.append(len(descriptions))
+    if sys.byteorder != 'little':
+        prices.byteswap()
+        offsets.byteswap()
+    with open(path, 'wb') as file:
+        file.write(_CATALOGUE_FILE_HEADER.pack(CATALOGUE_FILE_MAGIC, CATALOGUE_FILE_VERSION, len(skus)))
+        for sku in skus:
+            file.write(sku.ljust(_CATALOGUE_FILE_SKU_WIDTH, b'\0'))
+        file.write(prices.tobytes())
+        file.write(offsets.tobytes())
+        file.write(descriptions)
+
+
+class _MappedSKUColumn:
+    """
+    The sorted SKU column of a memory-mapped catalogue file, exposed as a
+    sequence of padded SKUs so that it can be binary searched with bisect.
+    """
+    def __init__(self, buffer, start, count):
+        self._buffer = buffer
+        self._start = start
+        self._count = count
+
+    def __getitem__(self, row):
+        offset = self._start + row * _CATALOGUE_FILE_SKU_WIDTH
+        return self._buffer[offset:offset + _CATALOGUE_FILE_SKU_WIDTH]
+
+    def __len__(self):
+        return self._count
+
+
+class MappedCatalogItems(Mapping):
+    """
+    A read-only store of CatalogItems backed by a memory-mapped catalogue
+    file written by writeCatalogueFile. Nothing is read up front: each lookup
+    binary searches the sorted SKU column and decodes only the row it finds.
+    """
+    def __init__(self, path):
+        """
+        path: the path of the catalogue file
+        """
+        with open(path, 'rb') as file:
+            self._buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._buffer) < _CATALOGUE_FILE_HEADER.size:
+            raise ValueError("Not a catalogue file")
+        (magic, version, count) = _CATALOGUE_FILE_HEADER.unpack_from(self._buffer)
+        if magic != CATALOGUE_FILE_MAGIC or version != CATALOGUE_FILE_VERSION:
+            raise ValueError("Not a catalogue file")
+        self._count = count
+        self._skus = _MappedSKUColumn(self._buffer, _CATALOGUE_FILE_HEADER.size, count)
+        self._pricesStart = _CATALOGUE_FILE_HEADER.size + count * _CATALOGUE_FILE_SKU_WIDTH
+        self._offsetsStart = self._pricesStart + count * 8
+        self._descriptionsStart = self._offsetsStart + (count + 1) * 8
+
+    def close(self):
+        """
+        Unmaps the catalogue file.
+        """
+        self._buffer.close()
+
+    def _row(self, sku):
+        """
+        Returns the row number of a SKU in the file, or None if it is absent.
+        """
+        if type(sku) is not str:
+            return None
+        key = sku.encode('utf-8')
+        if len(key) > _CATALOGUE_FILE_SKU_WIDTH:
+            return None
+        key = key.ljust(_CATALOGUE_FILE_SKU_WIDTH, b'\0')
+        row = bisect_left(self._skus, key)
+        if row < self._count and self._skus[row] == key:
+            return row
+        return None
+
+    def __getitem__(self, sku):
+        row = self._row(sku)
+        if row is None:
+            raise KeyError(sku)
+        (start, end) = struct.unpack_from('<qq', self._buffer, self._offsetsStart + row * 8)
+        description = self._buffer[self._descriptionsStart + start:self._descriptionsStart + end].decode('utf-8')
+        return CatalogItem(sku, description, self.priceInCents(sku, row) / 100)
+
+    def __contains__(self, sku):
+        return self._row(sku) is not None
+
+    def __iter__(self):
+        for row in range(self._count):
+            yield self._skus[row].rstrip(b'\0').decode('utf-8')
+
+    def __len__(self):
+        return self._count
+
+    def priceInCents(self, sku, row=None):
+        """
+        Returns the price of an item in cents without building a CatalogItem.
+        """
+        if row is None:
+            row = self._row(sku)
+            if row is None:
+                raise KeyError(sku)
+        return struct.unpack_from('<q', self._buffer, self._pricesStart + row * 8)[0]
+
+
+LoadError = namedtuple("LoadError", ["row", "message"])
+
+FEED_CHUNK_SIZE = 10000
+
+
+def _feedFormat(path, format):
+    """
+    Returns the format of a feed, taken from its file extension unless it
+    is given explicitly.
+    """
+    if format is None:
+        format = os.path.splitext(path)[1].lstrip('.').lower()
+    if format not in ("csv", "jsonl"):
+        raise ValueError("Feed format must be csv or jsonl")
+    return format
+
+
+def _readFeed(path, columns, format, chunkSize):
+    """
+    Reads a CSV feed with a header row, or a JSONL feed of one object per
+    line, in chunks of at most chunkSize rows. Yields (rows, errors) pairs,
+    where rows is a list of (rowNumber, values) with one value per column and
+    errors is a list of LoadErrors for the rows that could not be parsed,
+    including rows that are not valid UTF-8 and CSV records the csv module
+    rejects, such as those with an oversized field. Row numbers are line
+    numbers in the file.
+    """
+    format = _feedFormat(path, format)
+    chunkSize = Quantity.validated(chunkSize)
+    with open(path, newline='', encoding='utf-8', errors='surrogateescape') as file:
+        if format == "csv":
+            records = csv.reader(file)
+            header = next(records, [])
+            missing = [column for column in columns if column not in header]
+            if missing:
+                raise ValueError(f'Feed is missing columns {", ".join(missing)}')
+            positions = [header.index(column) for column in columns]
+            width = len(header)
+            records = _csvRecords(records)
+        else:
+            records = enumerate(file, start=1)
+        rows = []
+        errors = []
+        for (number, record) in records:
+            if format == "csv":
+                if type(record) is csv.Error:
+                    errors.append(LoadError(number, f'Malformed row: {record}'))
+                elif not _isValidUTF8(''.join(record)):
+                    errors.append(LoadError(number, "Row is not valid UTF-8"))
+                elif len(record) != width:
+                    errors.append(LoadError(number, f'Expected {width} fields'))
+                else:
+                    rows.append((number, [record[position] for position in positions]))
+            elif not record.strip():
+                pass
+            elif not _isValidUTF8(record):
+                errors.append(LoadError(number, "Row is not valid UTF-8"))
+            else:
+                try:
+                    fields = json.loads(record)
+                    rows.append((number, [fields[column] for column in columns]))
+                except (ValueError, TypeError, KeyError) as error:
+                    errors.append(LoadError(number, f'Malformed row: {error}'))
+            if len(rows) + len(errors) >= chunkSize:
+                yield (rows, errors)
+                rows = []
+                errors = []
+        if rows or errors:
+            yield (rows, errors)
+
+
+def _csvRecords(reader):
+    """
+    Yields (rowNumber, record) for every record after the header of a CSV
+    reader. A record the reader cannot parse is yielded as its csv.Error,
+    and reading carries on with the next line.
+    """
+    number = 1
+    while True:
+        number += 1
+        try:
+            record = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as error:
+            record = error
+        yield (number, record)
+
+
+def _isValidUTF8(text):
+    """
+    Checks that text read with errors='surrogateescape' held no bytes that
+    are not valid UTF-8.
+    """
+    if text.isascii():
+        return True
+    try:
+        text.encode('utf-8')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def _validatedFeedRows(rows, columns, errors):
+    """
+    Validates a chunk of feed rows column by column. Each column is a pair
+    of functions: one that checks and converts a whole column at once and
+    returns None if any value in it is bad, and one that validates a single
+    value. Only columns that fail the batch check are validated value by
+    value, to find and report their bad rows. Returns the values of the rows
+    that passed.
+    """
+    values = [row for (_, row) in rows]
+    bad = set()
+    for (position, (batchValidated, validated)) in enumerate(columns):
+        column = batchValidated([row[position] for row in values])
+        if column is None:
+            column = []
+            for (index, row) in enumerate(values):
+                try:
+                    column.append(validated(row[position]))
+                except (TypeError, ValueError) as error:
+                    column.append(None)
+                    if index not in bad:
+                        bad.add(index)
+                        errors.append(LoadError(rows[index][0], str(error)))
+        for (row, value) in zip(values, column):
+            row[position] = value
+    return [row for (index, row) in enumerate(values) if index not in bad]
+
+
+def _batchValidatedSKUs(column):
+    """
+    Checks a whole column of ASCII SKUs with a single regular expression
+    match over the joined column. A value holding a newline could pass as
+    two SKUs, so such columns are left to the per-value check.
+    """
+    if not all(type(code) is str and code.isascii() and '\n' not in code for code in column):
+        return None
+    if _ASCII_SKU_COLUMN_PATTERN.fullmatch('\n'.join(column) + '\n') is None:
+        return None
+    return [sys.intern(code) for code in column]
+
+
+def _batchValidatedStrings(column, maxLength):
+    """
+    Checks that a whole column holds strings no longer than maxLength.
+    """
+    if not all(type(value) is str for value in column) or max(map(len, column), default=0) > maxLength:
+        return None
+    return column
+
+
+def _batchValidatedNumbers(column, convert, types, minimum, maximum):
+    """
+    Converts a whole column of numbers with convert (for CSV text) and checks
+    their types and bounds.
+    """
+    try:
+        column = list(map(convert, column)) if convert is not None else column
+    except (TypeError, ValueError):
+        return None
+    if not all(type(value) in types and value == value for value in column):
+        return None
+    if column and (min(column) < minimum or max(column) > maximum):
+        return None
+    return column
+
+
+def _batchValidatedPrices(column, convert):
+    """
+    Converts and checks a whole column of prices, as validatedPrice does.
+    """
+    column = _batchValidatedNumbers(column, convert, (int, float), 0.01, 999999999.99)
+    if column is None or not all(map(_isWholeCents, column)):
+        return None
+    return column
+
+
+def _convertedFeedNumber(value, convert):
+    """
+    Converts a single CSV field to a number, reporting bad text as a
+    ValueError.
+    """
+    if convert is None:
+        return value
+    try:
+        return convert(value)
+    except ValueError:
+        raise ValueError(f'{value!r} is not a number')
+
+
 class Catalogue:
     """
     An index of every item in the online storefront which possesses an SKU.
     """
-    def __init__(self, items):
+    def __init__(self, items, *, compact=False):
         """
         items: an iterable of Items or CatalogItem namedtuples.
+        compact: whether to keep the items in a ColumnarCatalogItems store
+        instead of a dict, which uses far less memory for large catalogues.
         """
-        self._items = dict()
+        self._items = ColumnarCatalogItems() if compact else dict()
+        self._version = 0
+        self._subscribers = dict()
+        self._indexes = dict()
         try:
             iter(items)
         except:
@@ -251,15 +1183,207 @@ class Catalogue:
             if type(item) is Item:
                 self._items[item.sku()] = CatalogItem(item.sku(), item.description(), item.price())
             elif type(item) is CatalogItem:
-                self._items[item.sku] = CatalogItem(item.sku, item.description, item.price)
+                sku = sys.intern(item.sku) if type(item.sku) is str else item.sku
+                self._items[sku] = CatalogItem(sku, item.description, validatedPrice(item.price))
             else:
                 raise TypeError("Item or CatalogItem type expected")
 
+    @classmethod
+    def open_mmap(cls, path):
+        """
+        Opens a catalogue file written by writeCatalogueFile. Items are read
+        from the memory-mapped file as they are looked up rather than loaded
+        at startup, and the resulting catalogue is read-only.
+        """
+        catalogue = cls(())
+        catalogue._items = MappedCatalogItems(path)
+        return catalogue
+
+    @classmethod
+    def from_file(cls, path, *, format=None, chunkSize=FEED_CHUNK_SIZE, compact=False):
+        """
+        Loads a catalogue from a CSV or JSONL feed with sku, description and
+        price columns, streaming it in chunks so that only one chunk of rows
+        is held in memory at a time. Bad rows are skipped rather than
+        aborting the load. Returns the catalogue and a list of LoadErrors
+        for the skipped rows.
+        """
+        convert = float if _feedFormat(path, format) == "csv" else None
+        columns = [
+            (_batchValidatedSKUs, SKU.validated),
+            (lambda column: _batchValidatedStrings(column, 1000),
+             lambda value: validatedString(value, maxLength=1000)),
+            (lambda column: _batchValidatedPrices(column, convert),
+             lambda value: validatedPrice(_convertedFeedNumber(value, convert))),
+        ]
+        catalogue = cls((), compact=compact)
+        errors = []
+        for (rows, chunkErrors) in _readFeed(path, ("sku", "description", "price"), format, chunkSize):
+            errors += chunkErrors
+            for (sku, description, price) in _validatedFeedRows(rows, columns, errors):
+                catalogue._items[sku] = CatalogItem(sku, description, price)
+        errors.sort()
+        return (catalogue, errors)
+
+    def version(self):
+        """
+        Getter method for the catalogue's version, which increases every time
+        the catalogue changes.
+        """
+        return self._version
+
     def lookup(self, sku):
         """
         Returns an item's sku, description, and price.
         """
         return self._items[self.validateHas(sku)]
+
+    def setPrice(self, sku, price):
+        """
+        Changes the price of an item in the catalogue.
+        """
+        self.apply_delta([self._items[self.validateHas(sku)]._replace(price=price)])
+
+    def apply_delta(self, changes):
+        """
+        Applies a batch of changes to the catalogue in place. Each change is
+        either an Item or CatalogItem, which is added to the catalogue or
+        replaces the item with the same SKU, or a SKU string, which deletes
+        that item. Every change is validated before any is applied. The
+        catalogue's version is bumped once for the whole batch, and only the
+        carts holding an item whose price changed are told to re-price it.
+        Returns the new version.
+        """
+        if not isinstance(self._items, MutableMapping):
+            raise TypeError("Catalogue is read-only")
+        try:
+            iter(changes)
+        except:
+            raise TypeError("Expected iterable")
+        pending = dict()
+        for change in changes:
+            if type(change) is Item:
+                pending[change.sku()] = CatalogItem(change.sku(), change.description(), change.price())
+            elif type(change) is CatalogItem:
+                sku = SKU.validated(change.sku)
+                pending[sku] = CatalogItem(
+                    sku,
+                    validatedString(change.description, maxLength=1000),
+                    validatedPrice(change.price))
+            elif type(change) is str:
+                if pending.get(change) is None:
+                    self.validateHas(change)
+                pending[change] = None
+            else:
+                raise TypeError("Item, CatalogItem or SKU expected")
+        repriced = []
+        for (sku, item) in pending.items():
+            oldCents = self._priceInCents(sku) if sku in self._items else None
+            if self._indexes:
+                oldItem = self._items[sku] if oldCents is not None else None
+                for index in self._indexes.values():
+                    index.update(sku, oldItem, item)
+            if item is None:
+                if sku in self._items:
+                    del self._items[sku]
+                newCents = None
+            else:
+                self._items[sku] = item
+                newCents = toCents(item.price)
+            if oldCents is not None and oldCents != newCents:
+                repriced.append((sku, oldCents, newCents))
+        self._version += 1
+        for (sku, oldCents, newCents) in repriced:
+            carts = self._subscribers.get(sku, set())
+            for reference in list(carts):
+                cart = reference()
+                if cart is None:
+                    carts.discard(reference)
+                else:
+                    cart._repriceLine(sku, oldCents, newCents)
+            if not carts:
+                self._subscribers.pop(sku, None)
+        return self._version
+
+    def search(self, query, limit=10):
+        """
+        Searches the catalogue as a storefront search box would. A query
+        ending in * (e.g. ABC_*) returns the items whose SKUs start with the
+        rest of the query, in SKU order; any other query returns the items
+        whose descriptions best match its words, best match first.
+        """
+        validatedString(query)
+        Quantity.validated(limit)
+        index = self._index("search", SearchIndex)
+        if query.endswith('*'):
+            skus = index.skusWithPrefix(query[:-1], limit)
+        else:
+            skus = index.search(query, limit)
+        return [self._items[sku] for sku in skus]
+
+    def range(self, minimum, maximum, limit=100, offset=0):
+        """
+        Returns the items priced between minimum and maximum inclusive, in
+        order of price and then SKU, one page at a time: up to `limit` items
+        are returned after skipping the first `offset`. The bounds need not
+        be whole cents, and maximum may be infinite.
+        """
+        validatedNumber(minimum, minimum=0)
+        validatedNumber(maximum, minimum=minimum)
+        Quantity.validated(limit)
+        if type(offset) is not int:
+            raise TypeError("Offset must be an integer")
+        if offset < 0:
+            raise ValueError("Offset cannot be negative")
+        index = self._index("price", lambda items: PriceIndex(items, toCents))
+        # Rounding away the float error of the product first keeps a bound
+        # such as 1.10, whose product is 110.00000000000001, on its cent.
+        lowest = ceil(round(minimum * 100, 6))
+        highest = floor(round(min(maximum, 999999999.99) * 100, 6))
+        skus = index.range(lowest, highest, limit, offset)
+        return [self._items[sku] for sku in skus]
+
+    def _index(self, name, build):
+        """
+        Returns the named secondary index, building it from the catalogue's
+        items the first time it is needed. Once built, apply_delta keeps it
+        up to date.
+        """
+        index = self._indexes.get(name)
+        if index is None:
+            index = self._indexes[name] = build(self._items)
+        return index
+
+    def _subscribe(self, cart, sku):
+        """
+        Registers a cart holding an item to be told when its price changes.
+        Carts are held by weak reference, which is one shared object per cart
+        however many items it holds. A collected cart unsubscribes itself,
+        and any dead reference left behind is dropped at the next re-pricing.
+        """
+        carts = self._subscribers.get(sku)
+        if carts is None:
+            carts = self._subscribers[sku] = set()
+        carts.add(ref(cart))
+
+    def _unsubscribe(self, cart, sku):
+        """
+        Stops telling a cart about price changes to an item it no longer
+        holds.
+        """
+        carts = self._subscribers.get(sku)
+        if carts is not None:
+            carts.discard(ref(cart))
+            if not carts:
+                del self._subscribers[sku]
+
+    def _priceInCents(self, sku):
+        """
+        Returns the price of an item in the catalogue in cents.
+        """
+        if type(self._items) is dict:
+            return toCents(self._items[sku].price)
+        return self._items.priceInCents(sku)
     
     def validateHas(self, sku):
         """
@@ -270,15 +1394,56 @@ class Catalogue:
         return sku
 
 
+Reservation = namedtuple("Reservation", ["id", "sku", "quantity"])
+
+_NOT_LOGGED = nullcontext()
+
+
+class _PendingCheckout:
+    """
+    A checkout waiting in an inventory's queue to be applied with the next
+    batch.
+    """
+    __slots__ = ("quantities", "reservations", "done", "error")
+
+    def __init__(self, quantities, reservations):
+        self.quantities = quantities
+        self.reservations = reservations
+        self.done = False
+        self.error = None
+
+
+def _validatedReservation(reservation):
+    """
+    Ensures that a given value is a Reservation.
+    """
+    if type(reservation) is not Reservation:
+        raise TypeError("Expected Reservation")
+    return reservation
+
+
 class Inventory:
     """
     An inventory, which tracks the stock of each item. 
     """
-    def __init__(self, items):
+    def __init__(self, items, *, concurrent=False, stripes=64):
         """
         items: an iterable of InventoryItem namedtuples.
+        concurrent: whether the inventory will be shared between threads. If
+        so, every operation on an item holds one of `stripes` locks chosen by
+        the item's SKU, so that operations on different items rarely contend.
         """
         self._items = Counter()
+        self._reservations = dict()
+        self._reservationIds = count(1)
+        self._log = None
+        self._stripeOf = hash
+        self._checkouts = deque()
+        self._checkoutLock = Lock()
+        if concurrent:
+            self._locks = [Lock() for _ in range(Quantity.validated(stripes))]
+        else:
+            self._locks = [nullcontext()]
         try:
             iter(items)
         except:
@@ -288,37 +1453,86 @@ class Inventory:
                 raise TypeError("InventoryItem type expected")
             self._items[SKU.validated(item.sku)] = Quantity.validated(item.stock)
 
+    @classmethod
+    def from_file(cls, path, *, format=None, chunkSize=FEED_CHUNK_SIZE, concurrent=False):
+        """
+        Loads an inventory from a CSV or JSONL feed with sku and stock
+        columns, in the same streaming way as Catalogue.from_file. Returns the
+        inventory and a list of LoadErrors for the skipped rows.
+        """
+        convert = int if _feedFormat(path, format) == "csv" else None
+        columns = [
+            (_batchValidatedSKUs, SKU.validated),
+            (lambda column: _batchValidatedNumbers(column, convert, (int,), 1, float('inf')),
+             lambda value: Quantity.validated(_convertedFeedNumber(value, convert))),
+        ]
+        inventory = cls((), concurrent=concurrent)
+        errors = []
+        for (rows, chunkErrors) in _readFeed(path, ("sku", "stock"), format, chunkSize):
+            errors += chunkErrors
+            for (sku, stock) in _validatedFeedRows(rows, columns, errors):
+                inventory._items[sku] = stock
+        errors.sort()
+        return (inventory, errors)
+
+    def _lockFor(self, sku):
+        """
+        Returns the lock guarding the stock of the given item.
+        """
+        return self._locks[self._stripeOf(sku) % len(self._locks)]
+
+    def _logged(self, operation, sku, quantity=0, reservationId=0):
+        """
+        Returns a context in which to apply a change to the inventory. If the
+        inventory has an InventoryLog attached, the change is recorded in the
+        log once it has been applied successfully.
+        """
+        if self._log is None:
+            return _NOT_LOGGED
+        return self._log.recording(operation, sku, quantity, reservationId)
+
     def lookup(self, sku):
         """
         Returns the current stock of an item.
         """
-        return self._items[self.validateInStock(sku)]
+        with self._lockFor(sku):
+            return self._items[self._checkInStock(sku, 1)]
     
     def removeItem(self, sku):
         """
         Removes an item from the inventory.
         """
-        del self._items[sku]
+        with self._lockFor(sku):
+            if sku not in self._items:
+                return
+            with self._logged('remove', sku):
+                del self._items[sku]
 
     def addItem(self, sku, quantity):
         """
         Adds an item to the inventory.
         """
-        self._items[SKU.validated(sku)] += Quantity.validated(quantity)
+        sku = SKU.validated(sku)
+        with self._lockFor(sku), self._logged('add', sku, Quantity.validated(quantity)):
+            self._items[sku] += quantity
 
     def subtractItem(self, sku, quantity):
         """
         Removes a quantity from the current stock of an item.
         """
-        if Quantity.validated(quantity) > self._items[SKU.validated(sku)]:
-            raise ValueError("Cannot subtract quantity from item greater than current stock")
-        self._items[sku] -= quantity
+        with self._lockFor(SKU.validated(sku)):
+            if Quantity.validated(quantity) > self._items[sku]:
+                raise ValueError("Cannot subtract quantity from item greater than current stock")
+            with self._logged('subtract', sku, quantity):
+                self._items[sku] -= quantity
 
     def setItemStock(self, sku, quantity):
         """
         Sets an item's stock to the given quantity.
         """
-        self._items[SKU.validated(sku)] = Quantity.validated(quantity)
+        sku = SKU.validated(sku)
+        with self._lockFor(sku), self._logged('set', sku, Quantity.validated(quantity)):
+            self._items[sku] = quantity
 
     def validateInStock(self, sku, quantity=1):
         """
@@ -326,8 +1540,291 @@ class Inventory:
         item in stock that the requested quantity can be added to the user's
         cart.
         """
+        with self._lockFor(sku):
+            return self._checkInStock(sku, quantity)
+
+    def _checkInStock(self, sku, quantity):
+        """
+        The check behind validateInStock, for callers already holding the
+        item's lock.
+        """
         if not (sku in self._items and self._items[sku] != 0):
             raise ValueError("Item not in stock")
         if self._items[sku] < Quantity.validated(quantity):
             raise ValueError("Requested quantity greater than stock")
-        return sku
\ No newline at end of file
+        return sku
+
+    def reserve(self, sku, quantity):
+        """
+        Atomically checks that a quantity of an item is in stock and sets it
+        aside, returning a Reservation. Reserved stock no longer counts as in
+        stock until the reservation is released.
+        """
+        with self._lockFor(SKU.validated(sku)):
+            self._checkInStock(sku, quantity)
+            reservation = Reservation(next(self._reservationIds), sku, quantity)
+            with self._logged('reserve', sku, quantity, reservation.id):
+                self._items[sku] -= quantity
+                self._reservations[reservation.id] = reservation
+        return reservation
+
+    def commit(self, reservation):
+        """
+        Finalizes a reservation, so that its stock is permanently taken out
+        of the inventory.
+        """
+        _validatedReservation(reservation)
+        with self._lockFor(reservation.sku), \
+                self._logged('commit', reservation.sku, reservation.quantity, reservation.id):
+            self._finish(reservation)
+
+    def release(self, reservation):
+        """
+        Cancels a reservation, returning its stock to the inventory.
+        """
+        _validatedReservation(reservation)
+        with self._lockFor(reservation.sku), \
+                self._logged('release', reservation.sku, reservation.quantity, reservation.id):
+            self._finish(reservation)
+            self._items[reservation.sku] += reservation.quantity
+
+    def _checkout(self, quantities, reservations):
+        """
+        Atomically takes the stock of a checked-out cart out of the
+        inventory: either every line is taken or, if any line is short of
+        stock, none is. reservations are the cart's holds; those still
+        outstanding are committed and count towards their line's quantity.
+
+        Concurrent checkouts are combined. Each one is queued, and whichever
+        caller next gets the checkout lock applies everything queued so far
+        as one batch, holding the locks of every item in the batch once
+        rather than once per checkout.
+        """
+        checkout = _PendingCheckout(quantities, reservations)
+        self._checkouts.append(checkout)
+        with self._checkoutLock:
+            if not checkout.done:
+                self._applyCheckouts()
+        if checkout.error is not None:
+            raise checkout.error
+        if not checkout.done:
+            raise RuntimeError("Checkout was not applied")
+
+    def _applyCheckouts(self):
+        """
+        Applies every queued checkout. The caller must hold the checkout lock.
+        Any error is recorded on the checkout it stopped, and an error that
+        stops the whole batch is recorded on every checkout not yet applied,
+        so that no caller takes a checkout that failed for one that succeeded.
+        """
+        batch = []
+        while self._checkouts:
+            batch.append(self._checkouts.popleft())
+        try:
+            stripes = {self._stripeOf(sku) % len(self._locks) for checkout in batch for sku in checkout.quantities}
+            locks = [self._locks[stripe] for stripe in sorted(stripes)]
+            for lock in locks:
+                lock.__enter__()
+            try:
+                for checkout in batch:
+                    try:
+                        self._applyCheckout(checkout.quantities, checkout.reservations)
+                    except Exception as error:
+                        checkout.error = error
+                    checkout.done = True
+            finally:
+                for lock in reversed(locks):
+                    lock.__exit__(None, None, None)
+        except BaseException as error:
+            for checkout in batch:
+                if not checkout.done:
+                    checkout.error = error
+                    checkout.done = True
+            raise
+
+    def _applyCheckout(self, quantities, reservations):
+        """
+        Checks every line of one checkout against stock, then applies them
+        all. The caller must hold the locks of every item in it.
+        """
+        held = dict()
+        outstanding = []
+        for reservation in reservations:
+            if reservation.sku in quantities and self._reservations.get(reservation.id) == reservation:
+                held[reservation.sku] = held.get(reservation.sku, 0) + reservation.quantity
+                outstanding.append(reservation)
+        for (sku, quantity) in quantities.items():
+            if quantity - held.get(sku, 0) > self._items[sku]:
+                raise ValueError(f'Not enough of item {sku} in stock')
+        for reservation in outstanding:
+            with self._logged('commit', reservation.sku, reservation.quantity, reservation.id):
+                self._finish(reservation)
+        for (sku, quantity) in quantities.items():
+            shortfall = quantity - held.get(sku, 0)
+            if shortfall > 0:
+                with self._logged('subtract', sku, shortfall):
+                    self._items[sku] -= shortfall
+            elif shortfall < 0:
+                with self._logged('add', sku, -shortfall):
+                    self._items[sku] -= shortfall
+
+    def reservations(self):
+        """
+        Returns the reservations that have been made but neither committed nor
+        released.
+        """
+        return list(self._reservations.values())
+
+    def _finish(self, reservation):
+        """
+        Marks a reservation as no longer outstanding, ensuring that it is only
+        ever committed or released once. The caller must hold the lock of
+        the reservation's item.
+        """
+        outstanding = self._reservations.pop(reservation.id, None)
+        if outstanding != reservation:
+            if outstanding is not None:
+                self._reservations[reservation.id] = outstanding
+            raise ValueError("Reservation is not outstanding")
+
+
+class HoldScheduler:
+    """
+    Places time-limited holds on the stock of an Inventory and returns the
+    stock of expired holds. Holds are kept in a heap ordered by expiry time,
+    so expiring one costs O(log n) however many carts are open, and holds
+    that were committed or released early are simply skipped when they reach
+    the top of the heap.
+    """
+    def __init__(self, inventory, *, ttl=900, clock=monotonic):
+        """
+        inventory: the Inventory whose stock is held
+        ttl: how long a hold lasts, in seconds
+        clock: a function returning the current time in seconds
+        """
+        if type(inventory) is not Inventory:
+            raise TypeError("Expected Inventory")
+        self._inventory = inventory
+        self._ttl = validatedNumber(ttl, minimum=0)
+        self._clock = clock
+        self._heap = []
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread = None
+
+    def hold(self, sku, quantity):
+        """
+        Reserves a quantity of an item until the hold expires, returning the
+        Reservation.
+        """
+        reservation = self._inventory.reserve(sku, quantity)
+        with self._lock:
+            heappush(self._heap, (self._clock() + self._ttl, reservation))
+        return reservation
+
+    def release(self, reservation):
+        """
+        Returns a hold's stock to the inventory, unless the hold has already
+        expired, been committed, or been released.
+        """
+        try:
+            self._inventory.release(reservation)
+        except ValueError:
+            pass
+
+    def pending(self):
+        """
+        Returns the number of holds waiting in the expiry heap, including
+        holds that finished early and have not yet been skipped.
+        """
+        return len(self._heap)
+
+    def expire(self):
+        """
+        Returns the stock of every hold whose time is up to the inventory and
+        returns how many holds expired.
+        """
+        now = self._clock()
+        expired = 0
+        while True:
+            with self._lock:
+                if not self._heap or self._heap[0][0] > now:
+                    return expired
+                (_, reservation) = heappop(self._heap)
+            try:
+                self._inventory.release(reservation)
+                expired += 1
+            except ValueError:
+                pass
+
+    def start(self, interval=1.0):
+        """
+        Starts a background thread that expires holds every `interval`
+        seconds until stop is called.
+        """
+        if self._thread is not None:
+            raise ValueError("Scheduler already started")
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, args=(validatedNumber(interval, minimum=0.001),), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the background expiry thread.
+        """
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, interval):
+        """
+        The body of the background expiry thread.
+        """
+        while not self._stopped.wait(interval):
+            self.expire()
+
+
+class ManualClock:
+    """
+    A clock that only moves when told to, for deterministic tests and
+    benchmarks of hold expiry.
+    """
+    def __init__(self, now=0.0):
+        """
+        now: the clock's starting time, in seconds
+        """
+        self._now = now
+
+    def __call__(self):
+        return self._now
+
+    def advance(self, seconds):
+        """
+        Moves the clock forward by the given number of seconds.
+        """
+        self._now += validatedNumber(seconds, minimum=0)
+
+
+def checkout(cart):
+    """
+    Checks out a cart, taking the stock of every item in it out of its
+    inventory in one atomic step, and empties the cart. Stock the cart holds
+    through a HoldScheduler is used first. Returns the total cost of the
+    cart. If any item is missing from the catalogue or short of stock,
+    nothing is taken and the cart is left unchanged.
+    """
+    if type(cart) is not Cart:
+        raise TypeError("Expected Cart")
+    if not cart._items:
+        raise ValueError("Cannot check out an empty cart")
+    total = cart.totalCost(cart._catalogue)
+    quantities = dict(cart._items)
+    cart._inventory._checkout(quantities, cart.holds())
+    cart._holds.clear()
+    cart._writableItems().clear()
+    cart._subtotalCents = 0
+    cart._subtotalStale = False
+    for sku in quantities:
+        cart._catalogue._unsubscribe(cart, sku)
+    return total
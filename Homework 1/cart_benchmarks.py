@@ -0,0 +1,825 @@
+"""
+Microbenchmarks for cart.py. Run with `python3 cart_benchmarks.py`.
+"""
+
+from collections import Counter
+from copy import deepcopy
+from threading import Thread
+import asyncio
+import multiprocessing
+import os
+import random
+import regex
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+import uuid
+from cart import *
+from async_cart import AsyncCart, AsyncInventory
+from cart_store import CartManager, CartStore, deserializeCart, serializeCart
+from catalogue_index import tokens
+from instrumentation import disableInstrumentation, enableInstrumentation
+from inventory_log import openInventory, persistInventory
+from shared_inventory import SharedStock
+
+
+def report(name, seconds, calls):
+    """
+    Prints the per-call cost of a benchmark in nanoseconds.
+    """
+    print(f'{name:<48} {seconds / calls * 1e9:>10.1f} ns/call')
+
+
+def skuFor(i):
+    """
+    Returns a distinct, well-formed SKU for every integer in
+    [0, 26 ** 6 * 100).
+    """
+    i, digits = divmod(i, 100)
+    letters = []
+    for _ in range(6):
+        i, letter = divmod(i, 26)
+        letters.append(chr(65 + letter))
+    return f'{"".join(letters[:3])}_{"".join(letters[3:])}_{digits:02d}'
+
+
+def legacySKUValidated(code):
+    """
+    The SKU validator as it was before patterns were precompiled and cached.
+    """
+    if type(code) is not str:
+        raise TypeError("SKU must be a string")
+    if regex.match(r'^[A-Z]{3}_[A-Z]{3}_\d{2}$', code) is None:
+        raise ValueError("SKU must be formatted correctly")
+    return code
+
+
+def legacyCustomerIDValidated(id):
+    """
+    The customer id validator as it was before patterns were precompiled and
+    cached.
+    """
+    if type(id) is not str:
+        raise TypeError("Customer ID must be a string")
+    if regex.match(r'^\p{L}{3}\d{5}\p{L}{2}-[AQ]$', id) is None:
+        raise ValueError("Customer ID must be formatted correctly")
+    return id
+
+
+def benchmarkValidators(calls=200000):
+    """
+    Compares the legacy validators against the cached ones, both for a
+    repeated value (cache hits) and for a stream of distinct values that
+    overflows the cache (cache misses, so only the precompiled patterns and
+    the ASCII fast path help).
+    """
+    print("== Validators ==")
+    sku = 'ABC_DEF_12'
+    customerId = 'ABC12345DE-A'
+    distinctSKUs = [skuFor(i) for i in range(VALIDATION_CACHE_SIZE * 2)]
+
+    report("SKU legacy", timeit.timeit(lambda: legacySKUValidated(sku), number=calls), calls)
+    report("SKU cached (hit)", timeit.timeit(lambda: SKU.validated(sku), number=calls), calls)
+
+    def legacyDistinct():
+        for code in distinctSKUs:
+            legacySKUValidated(code)
+
+    def cachedDistinct():
+        clearValidationCaches()
+        for code in distinctSKUs:
+            SKU.validated(code)
+
+    report("SKU legacy (distinct)", timeit.timeit(legacyDistinct, number=1), len(distinctSKUs))
+    report("SKU cached (distinct, miss)", timeit.timeit(cachedDistinct, number=1), len(distinctSKUs))
+
+    report("CustomerID legacy", timeit.timeit(lambda: legacyCustomerIDValidated(customerId), number=calls), calls)
+    report("CustomerID cached (hit)", timeit.timeit(lambda: CustomerID.validated(customerId), number=calls), calls)
+    print(validationCacheInfo())
+
+
+def benchmarkBatchAdd(lines=10000, repeat=5):
+    """
+    Compares filling a cart one addItems call at a time against a single
+    addItemsBatch call.
+    """
+    print("== Batch add ==")
+    skus = [skuFor(i) for i in range(lines)]
+    catalogue = Catalogue(CatalogItem(sku, "Benchmark item", 1.00) for sku in skus)
+    inventory = Inventory(InventoryItem(sku, 100) for sku in skus)
+    batch = [(sku, 2) for sku in skus]
+
+    def perItem():
+        cart = Cart('ABC12345DE-A', catalogue, inventory)
+        for (sku, quantity) in batch:
+            cart.addItems(sku, quantity)
+
+    def batched():
+        cart = Cart('ABC12345DE-A', catalogue, inventory)
+        cart.addItemsBatch(batch)
+
+    report(f'addItems loop ({lines} lines)', timeit.timeit(perItem, number=repeat), repeat * lines)
+    report(f'addItemsBatch ({lines} lines)', timeit.timeit(batched, number=repeat), repeat * lines)
+
+
+def benchmarkItemsView(lines=1000, calls=2000):
+    """
+    Compares Cart.items() against the deepcopy it used to return, for a
+    cart that is read repeatedly without changing.
+    """
+    print("== Items view ==")
+    skus = [skuFor(i) for i in range(lines)]
+    catalogue = Catalogue(CatalogItem(sku, "Benchmark item", 1.00) for sku in skus)
+    inventory = Inventory(InventoryItem(sku, 100) for sku in skus)
+    cart = Cart('ABC12345DE-A', catalogue, inventory)
+    cart.addItemsBatch((sku, 1) for sku in skus)
+
+    report(f'deepcopy ({lines} lines)', timeit.timeit(lambda: deepcopy(cart._items), number=calls), calls)
+    report(f'items() ({lines} lines)', timeit.timeit(cart.items, number=calls), calls)
+    view = cart.items()
+    report(f'itemsSince() ({lines} lines)', timeit.timeit(lambda: cart.itemsSince(view.version()), number=calls), calls)
+
+
+def benchmarkTotalCost(lines=1000, calls=2000):
+    """
+    Compares the running subtotal against walking every line of the cart.
+    """
+    print("== Total cost ==")
+    skus = [skuFor(i) for i in range(lines)]
+    catalogue = Catalogue(CatalogItem(sku, "Benchmark item", 1.99) for sku in skus)
+    inventory = Inventory(InventoryItem(sku, 100) for sku in skus)
+    cart = Cart('ABC12345DE-A', catalogue, inventory)
+    cart.addItemsBatch((sku, 3) for sku in skus)
+
+    def fullWalk():
+        total = 0
+        for (sku, amount_in_cart) in cart._items.items():
+            total += catalogue.lookup(sku).price * amount_in_cart
+        return total
+
+    report(f'full walk ({lines} lines)', timeit.timeit(fullWalk, number=calls), calls)
+    report(f'totalCost() ({lines} lines)', timeit.timeit(lambda: cart.totalCost(catalogue), number=calls), calls)
+
+
+def benchmarkCatalogueMemory(items=200000):
+    """
+    Compares the memory held by a dict-backed and a compact Catalogue of the
+    same items. SKU strings are created up front and not counted, since in a
+    running storefront they are shared with the inventory and carts.
+    """
+    print("== Catalogue memory ==")
+    skus = [sys.intern(skuFor(i)) for i in range(items)]
+    for compact in (False, True):
+        tracemalloc.start()
+        catalogue = Catalogue((CatalogItem(sku, f'Benchmark item number {i}', 1.99 + i % 100)
+                               for (i, sku) in enumerate(skus)), compact=compact)
+        (current, _) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        name = "compact" if compact else "dict"
+        print(f'{name + f" ({items} items)":<48} {current / items:>10.1f} bytes/item')
+        del catalogue
+
+
+def benchmarkCatalogueStartup(items=500000, lookups=1000):
+    """
+    Compares the time to build a Catalogue from an in-memory iterable
+    against opening the same items from a memory-mapped catalogue file,
+    including a handful of lookups so the mapped file is actually touched.
+    """
+    print("== Catalogue startup ==")
+    catalogItems = [CatalogItem(skuFor(i), f'Benchmark item number {i}', 1.99) for i in range(items)]
+    probes = [catalogItems[i].sku for i in range(0, items, items // lookups)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalogue.bin")
+        start = time.perf_counter()
+        writeCatalogueFile(path, catalogItems)
+        print(f'{"writeCatalogueFile (" + str(items) + " items)":<48} {time.perf_counter() - start:>10.3f} s')
+
+        def startup(opener):
+            start = time.perf_counter()
+            catalogue = opener()
+            for sku in probes:
+                catalogue.lookup(sku)
+            return (time.perf_counter() - start, catalogue)
+
+        for (name, opener) in [("Catalogue(items)", lambda: Catalogue(catalogItems)),
+                             ("Catalogue(items, compact=True)", lambda: Catalogue(catalogItems, compact=True)),
+                             ("Catalogue.open_mmap(path)", lambda: Catalogue.open_mmap(path))]:
+            (seconds, catalogue) = startup(opener)
+            print(f'{name:<48} {seconds:>10.3f} s')
+        catalogue._items.close()
+
+
+def benchmarkConcurrentInventory(items=1000, operations=20000, maxThreads=16):
+    """
+    Reports reserve/commit throughput against a shared concurrent Inventory
+    as the number of threads grows, and checks that nothing was oversold.
+    """
+    print("== Concurrent inventory ==")
+    skus = [skuFor(i) for i in range(items)]
+    threads = 1
+    while threads <= maxThreads:
+        stock = operations // items
+        inventory = Inventory((InventoryItem(sku, stock) for sku in skus), concurrent=True)
+        perThread = operations * 2 // threads
+        soldCounts = [0] * threads
+
+        def customer(index):
+            sold = 0
+            for i in range(perThread):
+                try:
+                    inventory.commit(inventory.reserve(skus[(i * 7919 + index) % items], 1))
+                    sold += 1
+                except ValueError:
+                    pass
+            soldCounts[index] = sold
+
+        workers = [Thread(target=customer, args=(index,)) for index in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        seconds = time.perf_counter() - start
+        if sum(soldCounts) != stock * items or any(inventory._items.values()):
+            raise AssertionError("Inventory was oversold")
+        print(f'{str(threads) + " threads":<48} {perThread * threads / seconds:>10.0f} ops/s')
+        threads *= 2
+
+
+def benchmarkHoldExpiry(holds=300000):
+    """
+    Reports the cost of placing and expiring time-limited holds, one per
+    open cart, and the memory each outstanding hold takes.
+    """
+    print("== Hold expiry ==")
+    skus = [skuFor(i) for i in range(1000)]
+    inventory = Inventory(InventoryItem(sku, holds) for sku in skus)
+    clock = ManualClock()
+    scheduler = HoldScheduler(inventory, ttl=900, clock=clock)
+
+    start = time.perf_counter()
+    for i in range(holds):
+        scheduler.hold(skus[i % len(skus)], 1)
+        if i % 1000 == 0:
+            clock.advance(1)
+    report(f'hold ({holds} holds)', time.perf_counter() - start, holds)
+
+    clock.advance(900)
+    start = time.perf_counter()
+    expired = scheduler.expire()
+    report(f'expire ({expired} holds)', time.perf_counter() - start, expired)
+
+    tracemalloc.start()
+    for i in range(holds):
+        scheduler.hold(skus[i % len(skus)], 1)
+    (current, _) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{"memory per outstanding hold":<48} {current / holds:>10.1f} bytes')
+
+async def simulateCustomers(customers, operations, items=100):
+    """
+    Simulates the given number of customers concurrently filling their
+    carts against one shared Inventory through AsyncCart, and returns the
+    latency of every add, in seconds.
+    """
+    skus = [skuFor(i) for i in range(items)]
+    catalogue = Catalogue(CatalogItem(sku, "Benchmark item", 1.99) for sku in skus)
+    inventory = Inventory(InventoryItem(sku, customers * operations) for sku in skus)
+    asyncInventory = AsyncInventory(inventory)
+    latencies = []
+
+    async def customer(index):
+        cart = AsyncCart(Cart('ABC12345DE-A', catalogue, inventory), asyncInventory)
+        for i in range(operations):
+            start = time.perf_counter()
+            await cart.addItems(skus[(index * 31 + i) % items], 1)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(customer(index) for index in range(customers)))
+    return latencies
+
+
+def benchmarkAsyncLoad(customerCounts=(10, 100, 1000), operations=20):
+    """
+    Reports p50/p99 latency of AsyncCart.addItems as the number of concurrent
+    customers grows.
+    """
+    print("== Async load ==")
+    for customers in customerCounts:
+        start = time.perf_counter()
+        latencies = asyncio.run(simulateCustomers(customers, operations))
+        seconds = time.perf_counter() - start
+        percentiles = statistics.quantiles(latencies, n=100)
+        print(f'{str(customers) + " customers":<48} p50 {percentiles[49] * 1e6:>8.1f} us'
+              f'   p99 {percentiles[98] * 1e6:>8.1f} us   {len(latencies) / seconds:>8.0f} ops/s')
+
+
+def benchmarkInventoryLog(operations=1000000, items=1000):
+    """
+    Compares Inventory mutation throughput with and without an InventoryLog,
+    and reports how long recovery takes after `operations` changes, both from
+    the log alone and with periodic snapshots.
+    """
+    print("== Inventory log ==")
+    skus = [skuFor(i) for i in range(items)]
+
+    def mutate(inventory, count):
+        start = time.perf_counter()
+        for i in range(count):
+            sku = skus[i % items]
+            if (i // items) % 2:
+                inventory.subtractItem(sku, 1)
+            else:
+                inventory.addItem(sku, 2)
+        return time.perf_counter() - start
+
+    inventory = Inventory(InventoryItem(sku, 1) for sku in skus)
+    report("mutation, no log", mutate(inventory, operations // 10), operations // 10)
+    for (name, snapshotEvery) in [("log only", operations * 2), ("log + snapshots", operations // 10)]:
+        with tempfile.TemporaryDirectory() as directory:
+            inventory = Inventory(InventoryItem(sku, 1) for sku in skus)
+            log = persistInventory(inventory, directory, snapshotEvery=snapshotEvery)
+            report(f'mutation, {name}', mutate(inventory, operations), operations)
+            log.close()
+            start = time.perf_counter()
+            openInventory(directory)._log.close()
+            print(f'{"recovery after " + str(operations) + " changes, " + name:<48} '
+                  f'{time.perf_counter() - start:>10.3f} s')
+
+
+def sharedStockWorker(stock, skus, operations, results):
+    """
+    A worker process for benchmarkSharedInventory that checks and takes
+    stock from the shared inventory.
+    """
+    inventory = stock.inventory()
+    for i in range(operations):
+        sku = skus[(i * 7919) % len(skus)]
+        inventory.validateInStock(sku)
+        inventory.subtractItem(sku, 1)
+    stock.close()
+    results.put(operations)
+
+
+def benchmarkSharedInventory(items=1000, operations=100000):
+    """
+    Reports aggregate validateInStock/subtractItem throughput against one
+    SharedStock as the number of worker processes grows from 1 to the number
+    of cores.
+    """
+    print("== Shared inventory ==")
+    skus = [skuFor(i) for i in range(items)]
+    processes = 1
+    while True:
+        stock = SharedStock(InventoryItem(sku, operations * processes) for sku in skus)
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=sharedStockWorker, args=(stock, skus, operations, results))
+                   for _ in range(processes)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        total = sum(results.get() for _ in workers)
+        for worker in workers:
+            worker.join()
+        seconds = time.perf_counter() - start
+        remaining = sum(stock.inventory()._items.values())
+        stock.unlink()
+        if remaining != operations * processes * items - total:
+            raise AssertionError("Shared stock lost an update")
+        print(f'{str(processes) + " processes":<48} {total / seconds:>10.0f} ops/s')
+        if processes >= (os.cpu_count() or 1):
+            break
+        processes = min(processes * 2, os.cpu_count())
+
+
+def writeCatalogueFeed(path, rows):
+    """
+    Writes a generated CSV catalogue feed with the given number of rows,
+    one in every thousand of them invalid.
+    """
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write("sku,description,price\n")
+        for i in range(rows):
+            price = "free" if i % 1000 == 999 else f'{1 + i % 5000}.99'
+            file.write(f'{skuFor(i)},Benchmark item number {i},{price}\n')
+
+
+def benchmarkFeedLoader(rows=5000000, overheadRows=(100000, 1000000)):
+    """
+    Reports Catalogue.from_file throughput on a generated feed, and shows
+    that the loader's own memory overhead (its peak memory less the memory
+    the loaded catalogue keeps) does not grow with the size of the feed.
+    """
+    print("== Feed loader ==")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalogue.csv")
+        writeCatalogueFeed(path, rows)
+        start = time.perf_counter()
+        (catalogue, errors) = Catalogue.from_file(path, compact=True)
+        seconds = time.perf_counter() - start
+        print(f'{"from_file (" + str(rows) + " rows)":<48} {rows / seconds:>10.0f} rows/s'
+              f'   {len(errors)} bad rows')
+        del catalogue
+        for count in overheadRows:
+            writeCatalogueFeed(path, count)
+            tracemalloc.start()
+            (catalogue, errors) = Catalogue.from_file(path, compact=True)
+            (current, peak) = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f'{"loader overhead (" + str(count) + " rows)":<48} {(peak - current) / 2 ** 20:>10.1f} MiB')
+            del catalogue
+
+
+def benchmarkCatalogueDeltas(items=100000, carts=10000, linesPerCart=10, deltaSize=1000, deltas=20):
+    """
+    Reports how many price updates per second apply_delta sustains while
+    many open carts are kept priced, compared with rebuilding the catalogue
+    and re-pricing every cart.
+    """
+    print("== Catalogue deltas ==")
+    skus = [skuFor(i) for i in range(items)]
+    catalogue = Catalogue(CatalogItem(sku, "Benchmark item", 1.99) for sku in skus)
+    inventory = Inventory(InventoryItem(sku, carts * linesPerCart) for sku in skus)
+    openCarts = []
+    for c in range(carts):
+        cart = Cart('ABC12345DE-A', catalogue, inventory)
+        cart.addItemsBatch((skus[(c * linesPerCart + line) * 7919 % items], 1) for line in range(linesPerCart))
+        openCarts.append(cart)
+
+    start = time.perf_counter()
+    for d in range(deltas):
+        catalogue.apply_delta(CatalogItem(skus[(d * deltaSize + i) % items], "Benchmark item", 2.99 + d)
+                              for i in range(deltaSize))
+    seconds = time.perf_counter() - start
+    print(f'{"apply_delta":<48} {deltas * deltaSize / seconds:>10.0f} price updates/s')
+
+    start = time.perf_counter()
+    rebuilt = Catalogue(catalogue._items.values())
+    for cart in openCarts:
+        cart.totalCost(rebuilt)
+    seconds = time.perf_counter() - start
+    print(f'{"rebuild + re-price every cart (one update)":<48} {seconds:>10.3f} s')
+
+
+def searchDescription(i):
+    """
+    Returns a varied product description for the search benchmark.
+    """
+    colours = ("red", "blue", "green", "black", "white", "grey", "yellow", "purple")
+    materials = ("wool", "cotton", "leather", "steel", "oak", "rubber", "glass", "linen", "silk", "nylon")
+    return f'{colours[i % len(colours)]} {materials[i // 8 % len(materials)]} widget{i * 7919 % 20000} series{i % 50000}'
+
+
+def benchmarkCatalogueSearch(items=1000000, queries=200):
+    """
+    Reports the latency of SKU prefix and description searches through the
+    catalogue's search index, compared with a linear scan of every item.
+    """
+    print("== Catalogue search ==")
+    catalogue = Catalogue(CatalogItem(skuFor(i * 7), searchDescription(i), 1.99) for i in range(items))
+    start = time.perf_counter()
+    catalogue.search("warmup")
+    print(f'{"build index":<48} {time.perf_counter() - start:>10.3f} s')
+    prefixes = [skuFor(i * 7919 % items * 7)[:5] + '*' for i in range(queries)]
+    texts = [f'widget{i * 31 % 20000} {("red", "wool", "series" + str(i))[i % 3]}' for i in range(queries)]
+
+    start = time.perf_counter()
+    for prefix in prefixes:
+        catalogue.search(prefix)
+    report("prefix search (indexed)", time.perf_counter() - start, queries)
+    start = time.perf_counter()
+    for text in texts:
+        catalogue.search(text)
+    report("description search (indexed)", time.perf_counter() - start, queries)
+
+    scans = max(queries // 100, 1)
+    start = time.perf_counter()
+    for prefix in prefixes[:scans]:
+        sorted(sku for sku in catalogue._items if sku.startswith(prefix[:-1]))[:10]
+    report("prefix search (linear scan)", time.perf_counter() - start, scans)
+    start = time.perf_counter()
+    for text in texts[:scans]:
+        words = set(tokens(text))
+        [item for item in catalogue._items.values() if words & set(tokens(item.description))][:10]
+    report("description search (linear scan)", time.perf_counter() - start, scans)
+
+
+def benchmarkPriceRange(sizes=(10 ** 4, 10 ** 6, 10 ** 7), queries=1000):
+    """
+    Reports the latency of paginated price-range queries through the
+    catalogue's price index at several catalogue sizes, compared with
+    sorting every item by price for each request.
+    """
+    print("== Catalogue price ranges ==")
+    for size in sizes:
+        catalogue = Catalogue((CatalogItem(skuFor(i), "Benchmark item", (i * 7919 % 100000 + 1) / 100)
+                               for i in range(size)), compact=True)
+        start = time.perf_counter()
+        catalogue.range(1, 1)
+        print(f'{f"build index ({size} items)":<48} {time.perf_counter() - start:>10.3f} s')
+        start = time.perf_counter()
+        for q in range(queries):
+            catalogue.range(10 + q % 100, 50 + q % 100, limit=50, offset=q % 20 * 50)
+        report(f'range, 50 per page ({size} items)', time.perf_counter() - start, queries)
+        start = time.perf_counter()
+        sorted((item for item in catalogue._items.values() if 10 <= item.price <= 50),
+               key=lambda item: (item.price, item.sku))[:50]
+        report(f'sort per request ({size} items)', time.perf_counter() - start, 1)
+        del catalogue
+
+
+class LegacyItem:
+    """
+    Item as it was before it was slotted, holding its fields in a __dict__.
+    """
+    def __init__(self, sku, description, price):
+        self._sku = legacySKUValidated(sku)
+        self._description = description
+        self._price = price
+
+
+class LegacyCart:
+    """
+    The state a Cart held before it was slotted: a __dict__, a UUID object,
+    and SKU keys that were whatever strings the caller passed in.
+    """
+    def __init__(self, customerId, catalogue, inventory):
+        self._id = uuid.uuid4()
+        self._customerId = customerId
+        self._items = Counter()
+        self._itemsShared = False
+        self._version = 0
+        self._catalogue = catalogue
+        self._inventory = inventory
+        self._holdScheduler = None
+        self._holds = dict()
+        self._subtotalCents = 0
+        self._subtotalStale = False
+
+
+def benchmarkObjectMemory(carts=100000, linesPerCart=3, items=100000):
+    """
+    Compares the memory held per cart and per item by the slotted value
+    types with interned SKUs against their previous __dict__-based layout.
+    SKUs reach the carts as freshly built strings, as they would when
+    parsed from requests.
+    """
+    print("== Object memory ==")
+    skus = [skuFor(i) for i in range(items)]
+    catalogue = Catalogue(CatalogItem(sku, "Benchmark item", 1.99) for sku in skus)
+    inventory = Inventory(InventoryItem(sku, carts * linesPerCart) for sku in skus)
+    requested = [[''.join(list(skus[(c * linesPerCart + line) % items])) for line in range(linesPerCart)]
+                 for c in range(carts)]
+
+    for legacy in (True, False):
+        tracemalloc.start()
+        if legacy:
+            objects = [LegacyItem(sku, "Benchmark item", 1.99) for sku in skus]
+        else:
+            objects = [Item(sku, "Benchmark item", 1.99) for sku in skus]
+        (current, _) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        name = "Item (__dict__)" if legacy else "Item (__slots__)"
+        print(f'{name:<48} {current / items:>10.1f} bytes/item')
+        del objects
+
+    layouts = (
+        ("Cart (__dict__, UUID, own SKUs)", LegacyCart, lambda cart, sku: cart._items.update((sku,))),
+        ("Cart (__slots__, int id, interned SKUs)", Cart,
+         lambda cart, sku: cart._items.update((SKU.validated(sku),))),
+        ("Cart via addItems, with price subscriptions", Cart, lambda cart, sku: cart.addItems(sku, 1)),
+    )
+    for (name, cartType, add) in layouts:
+        tracemalloc.start()
+        openCarts = []
+        for lines in requested:
+            cart = cartType('ABC12345DE-A', catalogue, inventory)
+            for sku in lines:
+                add(cart, sku)
+            openCarts.append(cart)
+        (current, _) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'{name:<48} {current / carts:>10.1f} bytes/cart')
+        del openCarts
+
+def benchmarkCartStore(carts=1000000, linesPerCart=3, items=10000):
+    """
+    Reports how many carts per second are serialized, saved to a CartStore
+    and rehydrated from it after a restart.
+    """
+    print("== Cart store ==")
+    skus = [skuFor(i) for i in range(items)]
+    catalogue = Catalogue(CatalogItem(sku, "Benchmark item", 1.99) for sku in skus)
+    inventory = Inventory(InventoryItem(sku, carts * linesPerCart) for sku in skus)
+    openCarts = []
+    for c in range(carts):
+        cart = Cart('ABC12345DE-A', catalogue, inventory)
+        cart.addItemsBatch((skus[(c * linesPerCart + line) * 7919 % items], 1 + line) for line in range(linesPerCart))
+        openCarts.append(cart)
+
+    start = time.perf_counter()
+    serialized = [serializeCart(cart) for cart in openCarts]
+    seconds = time.perf_counter() - start
+    print(f'{"serializeCart":<48} {carts / seconds:>10.0f} carts/s')
+    start = time.perf_counter()
+    for data in serialized:
+        deserializeCart(data, catalogue, inventory)
+    seconds = time.perf_counter() - start
+    print(f'{"deserializeCart":<48} {carts / seconds:>10.0f} carts/s')
+    print(f'{"serialized size":<48} {sum(map(len, serialized)) / carts:>10.1f} bytes/cart')
+    del serialized
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "carts.db")
+        store = CartStore(path, catalogue, inventory)
+        start = time.perf_counter()
+        for cart in openCarts:
+            store.add(cart)
+        store.flush()
+        seconds = time.perf_counter() - start
+        print(f'{"save (batched write-back)":<48} {carts / seconds:>10.0f} carts/s')
+        store.close()
+        ids = [cart.id() for cart in openCarts]
+        del openCarts
+        print(f'{"database size":<48} {os.path.getsize(path) / carts:>10.1f} bytes/cart')
+
+        store = CartStore(path, catalogue, inventory)
+        start = time.perf_counter()
+        for id in ids:
+            store.get(id)
+        seconds = time.perf_counter() - start
+        print(f'{"load (lazy rehydration)":<48} {carts / seconds:>10.0f} carts/s')
+        store.close()
+
+
+def benchmarkCartManager(carts=200000, capacity=10000, operations=200000, items=10000):
+    """
+    Reports the throughput and hit rate of a CartManager under a skewed
+    access pattern, where nine in ten operations go to a hot set of carts
+    half the manager's capacity, and the memory it holds compared with
+    keeping every cart live.
+    """
+    print("== Cart manager ==")
+    skus = [skuFor(i) for i in range(items)]
+    catalogue = Catalogue(CatalogItem(sku, "Benchmark item", 1.99) for sku in skus)
+    inventory = Inventory(InventoryItem(sku, carts * 10) for sku in skus)
+    hot = capacity // 2
+    chooser = random.Random(1)
+    with tempfile.TemporaryDirectory() as directory:
+        for managed in (False, True):
+            tracemalloc.start()
+            if managed:
+                store = CartStore(os.path.join(directory, "carts.db"), catalogue, inventory)
+                manager = CartManager(store, capacity=capacity)
+                ids = [manager.create('ABC12345DE-A') for _ in range(carts)]
+                for (c, id) in enumerate(ids):
+                    manager.addItems(id, skus[c % items], 1)
+                store.flush()
+            else:
+                openCarts = [Cart('ABC12345DE-A', catalogue, inventory) for _ in range(carts)]
+                for (c, cart) in enumerate(openCarts):
+                    cart.addItems(skus[c % items], 1)
+            (current, _) = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            name = f'CartManager, {capacity} live' if managed else "every cart live"
+            print(f'{f"{name} ({carts} carts)":<48} {current / 2 ** 20:>10.1f} MiB')
+        del openCarts
+
+        before = manager.metrics()
+        start = time.perf_counter()
+        for op in range(operations):
+            c = chooser.randrange(hot) if op % 10 else chooser.randrange(carts)
+            if op % 2:
+                manager.addItems(ids[c], skus[op % items], 1)
+            else:
+                manager.totalCost(ids[c])
+        seconds = time.perf_counter() - start
+        metrics = {name: value - before[name] for (name, value) in manager.metrics().items()}
+        print(f'{"skewed addItems/totalCost":<48} {operations / seconds:>10.0f} ops/s')
+        print(f'{"hit rate":<48} {metrics["hits"] / operations:>10.1%}')
+        print(f'{"evictions":<48} {metrics["evictions"]:>10}')
+        store.close()
+
+
+def benchmarkCheckout(workerCounts=(1, 8, 64), checkouts=20000, items=1000, linesPerCart=5):
+    """
+    Reports checkout throughput, latency and batch size against a shared
+    concurrent Inventory with 1, 8 and 64 checkout threads, compared with
+    subtracting each line of a cart on its own.
+    """
+    print("== Checkout ==")
+    skus = [skuFor(i) for i in range(items)]
+    catalogue = Catalogue(CatalogItem(sku, "Benchmark item", 1.99) for sku in skus)
+
+    def openCarts(inventory):
+        carts = []
+        for c in range(checkouts):
+            cart = Cart('ABC12345DE-A', catalogue, inventory)
+            cart.addItemsBatch((skus[(c * linesPerCart + line) * 7919 % items], 1) for line in range(linesPerCart))
+            carts.append(cart)
+        return carts
+
+    inventory = Inventory((InventoryItem(sku, checkouts * linesPerCart) for sku in skus), concurrent=True)
+    carts = openCarts(inventory)
+    start = time.perf_counter()
+    for cart in carts:
+        for (sku, quantity) in cart.items().items():
+            inventory.subtractItem(sku, quantity)
+    seconds = time.perf_counter() - start
+    print(f'{"subtractItem per line (1 thread)":<48} {checkouts / seconds:>10.0f} checkouts/s')
+
+    for workers in workerCounts:
+        inventory = Inventory((InventoryItem(sku, checkouts * linesPerCart) for sku in skus), concurrent=True)
+        carts = openCarts(inventory)
+        batches = [0]
+        applyCheckouts = inventory._applyCheckouts
+
+        def countedApplyCheckouts():
+            batches[0] += 1
+            applyCheckouts()
+
+        inventory._applyCheckouts = countedApplyCheckouts
+        latencies = [[] for _ in range(workers)]
+
+        def worker(index):
+            for cart in carts[index::workers]:
+                begin = time.perf_counter()
+                checkout(cart)
+                latencies[index].append(time.perf_counter() - begin)
+
+        threads = [Thread(target=worker, args=(index,)) for index in range(workers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - start
+        if sum(inventory._items.values()) != (items - 1) * checkouts * linesPerCart:
+            raise AssertionError("Stock does not add up")
+        ordered = sorted(latency for perWorker in latencies for latency in perWorker)
+        median = ordered[len(ordered) // 2] * 1e6
+        tail = ordered[int(len(ordered) * 0.99)] * 1e6
+        print(f'{f"checkout ({workers} workers)":<48} {checkouts / seconds:>10.0f} checkouts/s, '
+              f'p50 {median:.0f}us, p99 {tail:.0f}us, {checkouts / batches[0]:.1f} carts/batch')
+
+
+def benchmarkInstrumentation(calls=1000, repeat=201):
+    """
+    Reports the cost of Cart.addItems and Cart.removeItem with the
+    instrumentation layer never enabled, enabled, and enabled then
+    disabled again. The disabled overhead should be under 2%. Process CPU
+    time is used rather than wall time, so that other load on the machine
+    does not swamp so small a difference.
+    """
+    print("== Instrumentation ==")
+    skus = [skuFor(i) for i in range(100)]
+    catalogue = Catalogue(CatalogItem(sku, "Benchmark item", 1.99) for sku in skus)
+    inventory = Inventory(InventoryItem(sku, 10) for sku in skus)
+    cart = Cart('ABC12345DE-A', catalogue, inventory)
+
+    def workload():
+        for i in range(calls):
+            cart.addItems(skus[i % 100], 1)
+            cart.removeItem(skus[i % 100])
+
+    def measure():
+        return min(timeit.repeat(workload, timer=time.process_time, number=1, repeat=repeat))
+
+    baseline = measure()
+    enableInstrumentation()
+    enabled = measure()
+    disableInstrumentation()
+    if any(hasattr(function, "__wrapped__") for function in (Cart.addItems, Cart.removeItem, SKU.validated)):
+        raise AssertionError("Instrumentation was not removed")
+    disabled = measure()
+    report("addItems + removeItem (never enabled)", baseline, calls)
+    report("addItems + removeItem (enabled)", enabled, calls)
+    report("addItems + removeItem (disabled)", disabled, calls)
+    print(f'{"disabled overhead (limit 2%)":<48} {disabled / baseline - 1:>10.2%}')
+
+
+if __name__ == '__main__':
+    benchmarkValidators()
+    benchmarkBatchAdd()
+    benchmarkItemsView()
+    benchmarkTotalCost()
+    benchmarkCatalogueMemory()
+    benchmarkCatalogueStartup()
+    benchmarkConcurrentInventory()
+    benchmarkHoldExpiry()
+    benchmarkAsyncLoad()
+    benchmarkInventoryLog()
+    benchmarkSharedInventory()
+    benchmarkFeedLoader()
+    benchmarkCatalogueDeltas()
+    benchmarkCatalogueSearch()
+    benchmarkPriceRange()
+    benchmarkObjectMemory()
+    benchmarkCartStore()
+    benchmarkCartManager()
+    benchmarkCheckout()
+    benchmarkInstrumentation()
@@ -0,0 +1,321 @@
+"""
+Optional persistence for shopping carts: a compact binary serialization of
+a cart's contents, and a SQLite-backed store that keeps carts across
+process restarts, with a manager that keeps only the most recently used
+carts in memory.
+
+A serialized cart holds only the cart's id, its customer id and its table
+of SKU to quantity. The catalogue and inventory a cart refers to are given
+again when it is rehydrated, and its subtotal is rebuilt from them. Holds
+are not saved, so a cart that holds stock through a HoldScheduler cannot be
+kept in a store.
+"""
+
+from collections import Counter, OrderedDict
+from uuid import UUID
+from weakref import WeakValueDictionary
+import sqlite3
+import struct
+from cart import Cart, CustomerID, Quantity, SKU
+
+CART_MAGIC = b'CT'
+CART_VERSION = 1
+
+_CART_HEADER = struct.Struct('<2sB16sBI')
+_CART_LINE = struct.Struct('<qB')
+
+
+def serializeCart(cart):
+    """
+    Returns the compact binary form of a cart's id, customer id and items.
+    """
+    if type(cart) is not Cart:
+        raise TypeError("Expected Cart")
+    customerId = cart._customerId.encode('utf-8')
+    data = bytearray(_CART_HEADER.pack(CART_MAGIC, CART_VERSION, cart._id.to_bytes(16, 'big'), len(customerId),
+                                       len(cart._items)))
+    data += customerId
+    for (sku, quantity) in cart._items.items():
+        encodedSKU = sku.encode('utf-8')
+        data += _CART_LINE.pack(quantity, len(encodedSKU))
+        data += encodedSKU
+    return bytes(data)
+
+
+def deserializeCart(data, catalogue, inventory):
+    """
+    Rebuilds a cart serialized by serializeCart against the given catalogue
+    and inventory. The items are restored as they were saved, even if some
+    are no longer in the catalogue or in stock.
+    """
+    if type(data) is not bytes:
+        raise TypeError("Expected bytes")
+    if len(data) < _CART_HEADER.size:
+        raise ValueError("Serialized cart is corrupt")
+    (magic, version, id, customerIdLength, lineCount) = _CART_HEADER.unpack_from(data)
+    if magic != CART_MAGIC or version != CART_VERSION:
+        raise ValueError("Not a serialized cart")
+    offset = _CART_HEADER.size
+    try:
+        customerId = data[offset:offset + customerIdLength].decode('utf-8')
+        offset += customerIdLength
+        items = Counter()
+        for _ in range(lineCount):
+            (quantity, length) = _CART_LINE.unpack_from(data, offset)
+            offset += _CART_LINE.size
+            items[SKU.validated(data[offset:offset + length].decode('utf-8'))] = Quantity.validated(quantity)
+            offset += length
+    except (struct.error, UnicodeDecodeError):
+        raise ValueError("Serialized cart is corrupt")
+    if offset != len(data):
+        raise ValueError("Serialized cart is corrupt")
+    cart = Cart(customerId, catalogue, inventory)
+    cart._id = int.from_bytes(id, 'big')
+    cart._items = items
+    cart._subtotalStale = True
+    for sku in items:
+        catalogue._subscribe(cart, sku)
+    return cart
+
+
+class CartStore:
+    """
+    A store of carts in a SQLite database, keyed by cart id and indexed by
+    customer id. Carts are only read from the database when first asked for,
+    and carts changed since they were last saved are written back in
+    batches: once `batchSize` carts are dirty, all of them are saved in one
+    transaction. Call flush or close to save the rest.
+    """
+    def __init__(self, path, catalogue, inventory, *, batchSize=1000):
+        """
+        path: the SQLite database file, created if it does not exist
+        catalogue, inventory: the Catalogue and Inventory that carts read
+        from the store are rehydrated against
+        batchSize: the number of dirty carts that triggers a write-back
+        """
+        self._catalogue = catalogue
+        self._inventory = inventory
+        self._batchSize = Quantity.validated(batchSize)
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS carts (id BLOB PRIMARY KEY, customerId TEXT NOT NULL, data BLOB NOT NULL)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS cartsByCustomer ON carts (customerId)")
+        self._loaded = WeakValueDictionary()
+        self._dirty = dict()
+
+    def add(self, cart):
+        """
+        Adds a new cart to the store. It is saved with the next batch.
+        """
+        if type(cart) is not Cart:
+            raise TypeError("Expected Cart")
+        if cart._catalogue is not self._catalogue or cart._inventory is not self._inventory:
+            raise ValueError("Cart must use the store's catalogue and inventory")
+        if cart._store is not None:
+            raise ValueError("Cart is already in a store")
+        if cart._holdScheduler is not None:
+            raise ValueError("Carts with holds cannot be stored")
+        self._attach(cart)
+        self._markDirty(cart)
+        return cart
+
+    def get(self, id):
+        """
+        Returns the cart with the given id, rehydrating it from the database
+        if it is not already in memory.
+        """
+        if type(id) is not UUID:
+            raise TypeError("Expected UUID")
+        cart = self._loaded.get(id.int)
+        if cart is not None:
+            return cart
+        row = self._connection.execute("SELECT data FROM carts WHERE id = ?", (id.bytes,)).fetchone()
+        if row is None:
+            raise ValueError(f'No cart with id {id} found in store')
+        return self._attach(deserializeCart(row[0], self._catalogue, self._inventory))
+
+    def forCustomer(self, customerId):
+        """
+        Returns every cart belonging to the given customer.
+        """
+        CustomerID.validated(customerId)
+        ids = {cart._id for cart in self._dirty.values() if cart._customerId == customerId}
+        for (id,) in self._connection.execute("SELECT id FROM carts WHERE customerId = ?", (customerId,)):
+            ids.add(int.from_bytes(id, 'big'))
+        return [self.get(UUID(int=id)) for id in sorted(ids)]
+
+    def delete(self, id):
+        """
+        Removes a cart from the store, e.g. once it has been checked out.
+        """
+        if type(id) is not UUID:
+            raise TypeError("Expected UUID")
+        cart = self._loaded.pop(id.int, None)
+        if cart is not None:
+            cart._store = None
+        self._dirty.pop(id.int, None)
+        with self._connection:
+            self._connection.execute("DELETE FROM carts WHERE id = ?", (id.bytes,))
+
+    def flush(self):
+        """
+        Saves every dirty cart in one transaction.
+        """
+        if not self._dirty:
+            return
+        rows = [(cart._id.to_bytes(16, 'big'), cart._customerId, serializeCart(cart)) for cart in self._dirty.values()]
+        with self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO carts (id, customerId, data) VALUES (?, ?, ?)", rows)
+        self._dirty.clear()
+
+    def _writeBack(self, cart):
+        """
+        Saves one cart straight away if it is dirty, taking it out of the
+        current batch.
+        """
+        if self._dirty.pop(cart._id, None) is None:
+            return
+        with self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO carts (id, customerId, data) VALUES (?, ?, ?)",
+                                     (cart._id.to_bytes(16, 'big'), cart._customerId, serializeCart(cart)))
+
+    def close(self):
+        """
+        Saves every dirty cart, detaches the carts in memory from the store,
+        and closes the database.
+        """
+        self.flush()
+        for cart in list(self._loaded.values()):
+            cart._store = None
+        self._loaded.clear()
+        self._connection.close()
+
+    def _attach(self, cart):
+        """
+        Tracks a cart in memory so that its changes are written back.
+        """
+        cart._store = self
+        self._loaded[cart._id] = cart
+        return cart
+
+    def _markDirty(self, cart):
+        """
+        Called by a cart in the store just before it changes. A full batch is
+        written back before the cart joins the next one, so the batch never
+        holds a cart that is partway through a change.
+        """
+        if cart._id in self._dirty:
+            return
+        if len(self._dirty) >= self._batchSize:
+            self.flush()
+        self._dirty[cart._id] = cart
+
+
+class CartManager:
+    """
+    Keeps only the most recently used carts of a CartStore live in memory.
+    Once more than `capacity` carts are live, the least recently used one is
+    evicted: it is dropped from memory once any change to it has been
+    written back, and faulted back in from the store the next time it is
+    used.
+    """
+    def __init__(self, store, *, capacity=100000):
+        """
+        store: the CartStore holding every cart
+        capacity: the number of carts kept live
+        """
+        if type(store) is not CartStore:
+            raise TypeError("Expected CartStore")
+        self._store = store
+        self._capacity = Quantity.validated(capacity)
+        self._live = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def create(self, customerId):
+        """
+        Opens a new, empty cart for a customer and returns its id.
+        """
+        cart = self._store.add(Cart(customerId, self._store._catalogue, self._store._inventory))
+        self._keep(cart)
+        return cart.id()
+
+    def get(self, id):
+        """
+        Returns the cart with the given id, faulting it in from the store if
+        it is not live.
+        """
+        if type(id) is not UUID:
+            raise TypeError("Expected UUID")
+        cart = self._live.get(id.int)
+        if cart is not None:
+            self._hits += 1
+            self._live.move_to_end(id.int)
+            return cart
+        cart = self._store.get(id)
+        self._misses += 1
+        self._keep(cart)
+        return cart
+
+    def addItems(self, id, sku, quantity):
+        """
+        Adds one or more instances of an item to a cart.
+        """
+        self.get(id).addItems(sku, quantity)
+
+    def updateItemQuantity(self, id, sku, quantity):
+        """
+        Sets the quantity of an item in a cart.
+        """
+        self.get(id).updateItemQuantity(sku, quantity)
+
+    def removeItem(self, id, sku):
+        """
+        Removes an item from a cart.
+        """
+        self.get(id).removeItem(sku)
+
+    def totalCost(self, id):
+        """
+        Calculates the total cost of all items in a cart.
+        """
+        return self.get(id).totalCost(self._store._catalogue)
+
+    def delete(self, id):
+        """
+        Removes a cart from memory and from the store.
+        """
+        if type(id) is not UUID:
+            raise TypeError("Expected UUID")
+        self._live.pop(id.int, None)
+        self._store.delete(id)
+
+    def metrics(self):
+        """
+        Returns the number of cart lookups that found the cart live (hits) or
+        had to fault it in (misses), the number of evictions, and the number
+        of carts currently live.
+        """
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "live": len(self._live),
+        }
+
+    def _keep(self, cart):
+        """
+        Makes a cart the most recently used, evicting the least recently used
+        one if there are now too many live carts. An evicted cart with
+        unsaved changes is written back at once, so the batch of dirty carts
+        never keeps it in memory.
+        """
+        self._live[cart._id] = cart
+        if len(self._live) > self._capacity:
+            (_, evicted) = self._live.popitem(last=False)
+            self._store._writeBack(evicted)
+            self._evictions += 1
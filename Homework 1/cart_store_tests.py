@@ -0,0 +1,222 @@
+import gc
+import os
+import sqlite3
+import tempfile
+import unittest
+from cart import *
+from cart_store import *
+
+TEST_CUSTOMER_ID = 'ABC12345DE-A'
+TEST_OTHER_CUSTOMER_ID = 'XYZ98765FG-Q'
+TEST_SKU_1 = 'ABC_DEF_12'
+TEST_SKU_2 = 'GHI_JKL_34'
+TEST_SKU_3 = 'MNO_PQR_56'
+
+
+class CartSerializationTests(unittest.TestCase):
+    def setUp(self):
+        self.myCatalogue = Catalogue([Item(TEST_SKU_1, "This is an item!", 1.00), Item(TEST_SKU_2, "Another item!", 2.50)])
+        self.myInventory = Inventory([InventoryItem(TEST_SKU_1, 10), InventoryItem(TEST_SKU_2, 10)])
+
+    def test_round_trip(self):
+        myCart = Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory)
+        myCart.addItems(TEST_SKU_1, 3)
+        myCart.addItems(TEST_SKU_2, 2)
+        restored = deserializeCart(serializeCart(myCart), self.myCatalogue, self.myInventory)
+        self.assertEqual(restored.id(), myCart.id())
+        self.assertEqual(restored.customerId(), TEST_CUSTOMER_ID)
+        self.assertEqual(restored.items(), myCart.items())
+        self.assertEqual(restored.totalCost(self.myCatalogue), 8.00)
+        self.myCatalogue.setPrice(TEST_SKU_1, 2.00)
+        self.assertEqual(restored.totalCost(self.myCatalogue), 11.00)
+
+    def test_empty_cart_is_compact(self):
+        myCart = Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory)
+        self.assertEqual(len(serializeCart(myCart)), 24 + len(TEST_CUSTOMER_ID))
+
+    def test_items_no_longer_available_are_restored(self):
+        myCart = Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory)
+        myCart.addItems(TEST_SKU_1, 3)
+        data = serializeCart(myCart)
+        self.myInventory.removeItem(TEST_SKU_1)
+        self.assertEqual(deserializeCart(data, self.myCatalogue, self.myInventory).items()[TEST_SKU_1], 3)
+
+    def test_bad_data(self):
+        myCart = Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory)
+        myCart.addItems(TEST_SKU_1, 3)
+        data = serializeCart(myCart)
+        with self.assertRaises(TypeError):
+            serializeCart("cart")
+        with self.assertRaises(TypeError):
+            deserializeCart(bytearray(data), self.myCatalogue, self.myInventory)
+        with self.assertRaises(ValueError):
+            deserializeCart(b'XX' + data[2:], self.myCatalogue, self.myInventory)
+        with self.assertRaises(ValueError):
+            deserializeCart(data[:-1], self.myCatalogue, self.myInventory)
+        with self.assertRaises(ValueError):
+            deserializeCart(data + b'\0', self.myCatalogue, self.myInventory)
+        with self.assertRaises(ValueError):
+            deserializeCart(data.replace(TEST_SKU_1.encode(), b'abc_def_12'), self.myCatalogue, self.myInventory)
+
+
+class CartStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "carts.db")
+        self.myCatalogue = Catalogue([Item(TEST_SKU_1, "This is an item!", 1.00), Item(TEST_SKU_2, "Another item!", 2.50)])
+        self.myInventory = Inventory([InventoryItem(TEST_SKU_1, 10), InventoryItem(TEST_SKU_2, 10)])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def savedCount(self):
+        connection = sqlite3.connect(self.path)
+        try:
+            return connection.execute("SELECT COUNT(*) FROM carts").fetchone()[0]
+        finally:
+            connection.close()
+
+    def test_carts_survive_a_restart(self):
+        store = CartStore(self.path, self.myCatalogue, self.myInventory)
+        myCart = store.add(Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory))
+        myCart.addItems(TEST_SKU_1, 2)
+        otherCart = store.add(Cart(TEST_OTHER_CUSTOMER_ID, self.myCatalogue, self.myInventory))
+        otherCart.addItems(TEST_SKU_2, 1)
+        store.close()
+        store = CartStore(self.path, self.myCatalogue, self.myInventory)
+        self.assertEqual(len(store._loaded), 0)
+        restored = store.get(myCart.id())
+        self.assertEqual(restored.items(), myCart.items())
+        self.assertIs(store.get(myCart.id()), restored)
+        self.assertEqual([cart.id() for cart in store.forCustomer(TEST_OTHER_CUSTOMER_ID)], [otherCart.id()])
+        store.close()
+
+    def test_dirty_carts_are_written_in_batches(self):
+        store = CartStore(self.path, self.myCatalogue, self.myInventory, batchSize=2)
+        carts = [store.add(Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory)) for _ in range(2)]
+        self.assertEqual(self.savedCount(), 0)
+        carts[0].addItems(TEST_SKU_1, 1)
+        self.assertEqual(self.savedCount(), 0)
+        carts.append(store.add(Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory)))
+        self.assertEqual(self.savedCount(), 2)
+        store.flush()
+        self.assertEqual(self.savedCount(), 3)
+        carts[0].addItems(TEST_SKU_2, 4)
+        store.close()
+        store = CartStore(self.path, self.myCatalogue, self.myInventory)
+        self.assertEqual(store.get(carts[0].id()).items(), Counter({TEST_SKU_1: 1, TEST_SKU_2: 4}))
+        self.assertEqual(len(store.forCustomer(TEST_CUSTOMER_ID)), 3)
+        store.close()
+
+    def test_rehydrated_carts_are_written_back(self):
+        store = CartStore(self.path, self.myCatalogue, self.myInventory)
+        myId = store.add(Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory)).id()
+        store.close()
+        store = CartStore(self.path, self.myCatalogue, self.myInventory)
+        store.get(myId).updateItemQuantity(TEST_SKU_2, 5)
+        store.close()
+        store = CartStore(self.path, self.myCatalogue, self.myInventory)
+        self.assertEqual(store.get(myId).totalCost(self.myCatalogue), 12.50)
+        store.close()
+
+    def test_delete(self):
+        store = CartStore(self.path, self.myCatalogue, self.myInventory)
+        myCart = store.add(Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory))
+        store.flush()
+        store.delete(myCart.id())
+        with self.assertRaises(ValueError):
+            store.get(myCart.id())
+        self.assertEqual(store.forCustomer(TEST_CUSTOMER_ID), [])
+        store.close()
+
+    def test_bad_arguments(self):
+        store = CartStore(self.path, self.myCatalogue, self.myInventory)
+        myCart = Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory)
+        with self.assertRaises(TypeError):
+            store.add("cart")
+        with self.assertRaises(ValueError):
+            store.add(Cart(TEST_CUSTOMER_ID, Catalogue([]), self.myInventory))
+        with self.assertRaises(ValueError):
+            store.add(Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory,
+                           holds=HoldScheduler(self.myInventory, clock=ManualClock())))
+        store.add(myCart)
+        with self.assertRaises(ValueError):
+            store.add(myCart)
+        with self.assertRaises(TypeError):
+            store.get(str(myCart.id()))
+        with self.assertRaises(ValueError):
+            store.forCustomer('not a customer')
+        store.close()
+
+
+class CartManagerTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.myCatalogue = Catalogue([Item(TEST_SKU_1, "This is an item!", 1.00), Item(TEST_SKU_2, "Another item!", 2.50)])
+        self.myInventory = Inventory([InventoryItem(TEST_SKU_1, 10), InventoryItem(TEST_SKU_2, 10)])
+        self.store = CartStore(os.path.join(self.directory.name, "carts.db"), self.myCatalogue, self.myInventory,
+                               batchSize=1)
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def test_keeps_most_recently_used_carts_live(self):
+        manager = CartManager(self.store, capacity=2)
+        ids = [manager.create(TEST_CUSTOMER_ID) for _ in range(3)]
+        self.assertEqual(manager.metrics(), {"hits": 0, "misses": 0, "evictions": 1, "live": 2})
+        manager.addItems(ids[2], TEST_SKU_1, 1)
+        manager.addItems(ids[0], TEST_SKU_1, 1)
+        self.assertEqual(manager.metrics(), {"hits": 1, "misses": 1, "evictions": 2, "live": 2})
+        self.assertEqual(list(manager._live), [ids[2].int, ids[0].int])
+
+    def test_evicted_carts_are_faulted_back_in(self):
+        manager = CartManager(self.store, capacity=1)
+        first = manager.create(TEST_CUSTOMER_ID)
+        manager.addItems(first, TEST_SKU_1, 2)
+        manager.updateItemQuantity(first, TEST_SKU_2, 2)
+        second = manager.create(TEST_CUSTOMER_ID)
+        manager.addItems(second, TEST_SKU_2, 1)
+        gc.collect()
+        self.assertNotIn(first.int, self.store._loaded)
+        self.assertEqual(manager.totalCost(first), 7.00)
+        manager.removeItem(first, TEST_SKU_1)
+        self.assertEqual(manager.totalCost(second), 2.50)
+        self.assertEqual(manager.totalCost(first), 5.00)
+        self.assertEqual(manager.metrics()["misses"], 3)
+
+    def test_evicted_dirty_carts_are_written_back(self):
+        store = CartStore(os.path.join(self.directory.name, "batched.db"), self.myCatalogue, self.myInventory,
+                          batchSize=100)
+        manager = CartManager(store, capacity=1)
+        first = manager.create(TEST_CUSTOMER_ID)
+        manager.addItems(first, TEST_SKU_1, 2)
+        manager.create(TEST_CUSTOMER_ID)
+        self.assertNotIn(first.int, store._dirty)
+        gc.collect()
+        self.assertNotIn(first.int, store._loaded)
+        otherStore = CartStore(os.path.join(self.directory.name, "batched.db"), self.myCatalogue, self.myInventory)
+        self.assertEqual(dict(otherStore.get(first).items()), {TEST_SKU_1: 2})
+        otherStore.close()
+        store.close()
+
+    def test_delete(self):
+        manager = CartManager(self.store, capacity=2)
+        myId = manager.create(TEST_CUSTOMER_ID)
+        manager.delete(myId)
+        self.assertEqual(manager.metrics()["live"], 0)
+        with self.assertRaises(ValueError):
+            manager.get(myId)
+
+    def test_bad_arguments(self):
+        with self.assertRaises(TypeError):
+            CartManager("store")
+        with self.assertRaises(ValueError):
+            CartManager(self.store, capacity=0)
+        manager = CartManager(self.store)
+        with self.assertRaises(TypeError):
+            manager.get(str(manager.create(TEST_CUSTOMER_ID)))
+
+
+if __name__ == '__main__':
+    unittest.main()
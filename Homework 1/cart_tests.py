@@ -1,4 +1,10 @@
+import json
+import os
+import tempfile
+import threading
+import time
 import unittest
+import uuid
 from cart import *
 
 TEST_CUSTOMER_ID = 'ABC12345DE-A'
@@ -30,6 +36,45 @@ class CartTests(unittest.TestCase):
         myItems['1234'] = 10
         self.assertNotEqual(myCart._items, myItems)
 
+    def test_items_view_does_not_follow_cart(self):
+        myCart = Cart(TEST_CUSTOMER_ID, TEST_CATALOGUE, TEST_INVENTORY)
+        myCart.addItems(TEST_SKU_1, 3)
+        myItems = myCart.items()
+        myCart.addItems(TEST_SKU_1, 2)
+        self.assertEqual(myItems[TEST_SKU_1], 3)
+        self.assertEqual(myCart.items()[TEST_SKU_1], 5)
+
+    def test_items_view_reads_like_counter(self):
+        myInventory = Inventory([InventoryItem(TEST_SKU_1, 10), InventoryItem(TEST_SKU_2, 10)])
+        myCart = Cart(TEST_CUSTOMER_ID, TEST_CATALOGUE, myInventory)
+        myCart.addItems(TEST_SKU_1, 3)
+        myCart.addItems(TEST_SKU_2, 1)
+        myItems = myCart.items()
+        self.assertEqual(myItems.most_common(1), [(TEST_SKU_1, 3)])
+        self.assertEqual(sorted(myItems.elements()), [TEST_SKU_1] * 3 + [TEST_SKU_2])
+        self.assertEqual(myItems.total(), 4)
+        self.assertEqual(myItems + Counter({TEST_SKU_2: 1}), Counter({TEST_SKU_1: 3, TEST_SKU_2: 2}))
+        self.assertEqual(myItems - myCart.items(), Counter())
+        self.assertEqual(myItems, Counter({TEST_SKU_1: 3, TEST_SKU_2: 1}))
+        myItems.update({TEST_SKU_1: 2})
+        myItems.subtract({TEST_SKU_2: 1})
+        self.assertEqual(myItems, Counter({TEST_SKU_1: 5, TEST_SKU_2: 0}))
+        self.assertEqual(myCart.items(), Counter({TEST_SKU_1: 3, TEST_SKU_2: 1}))
+
+    def test_items_since_unchanged(self):
+        myCart = Cart(TEST_CUSTOMER_ID, TEST_CATALOGUE, TEST_INVENTORY)
+        myCart.addItems(TEST_SKU_1, 3)
+        myItems = myCart.items()
+        self.assertIsNone(myCart.itemsSince(myItems.version()))
+
+    def test_items_since_changed(self):
+        myCart = Cart(TEST_CUSTOMER_ID, TEST_CATALOGUE, TEST_INVENTORY)
+        myItems = myCart.items()
+        myCart.addItems(TEST_SKU_1, 3)
+        myNewItems = myCart.itemsSince(myItems.version())
+        self.assertEqual(dict(myNewItems), {TEST_SKU_1: 3})
+        self.assertGreater(myNewItems.version(), myItems.version())
+
     def test_add_new_item(self):
         myCart = Cart(TEST_CUSTOMER_ID, TEST_CATALOGUE, TEST_INVENTORY)
         myCart.addItems(TEST_SKU_1, 3)
@@ -53,6 +98,38 @@ class CartTests(unittest.TestCase):
         myCart.updateItemQuantity(TEST_SKU_1, 5)
         self.assertDictEqual(myCart._items, Counter({TEST_SKU_1: 5}))
 
+    def test_add_items_batch(self):
+        myCart = Cart(TEST_CUSTOMER_ID, TEST_CATALOGUE, TEST_INVENTORY)
+        myCart.addItems(TEST_SKU_1, 1)
+        myCart.addItemsBatch([(TEST_SKU_1, 3), (TEST_SKU_1, 2)])
+        self.assertDictEqual(myCart._items, Counter({TEST_SKU_1: 6}))
+
+    def test_add_items_batch_is_all_or_nothing(self):
+        myCart = Cart(TEST_CUSTOMER_ID, TEST_CATALOGUE, TEST_INVENTORY)
+        with self.assertRaises(ValueError):
+            myCart.addItemsBatch([(TEST_SKU_1, 3), (TEST_SKU_2, 1)])
+        self.assertDictEqual(myCart._items, Counter())
+
+    def test_add_items_batch_rejects_malformed_lines(self):
+        myCart = Cart(TEST_CUSTOMER_ID, TEST_CATALOGUE, TEST_INVENTORY)
+        with self.assertRaises(TypeError):
+            myCart.addItemsBatch([TEST_SKU_1])
+        with self.assertRaises(TypeError):
+            myCart.addItemsBatch([(TEST_SKU_1, 1.5)])
+
+    def test_update_quantities(self):
+        myCart = Cart(TEST_CUSTOMER_ID, TEST_CATALOGUE, TEST_INVENTORY)
+        myCart.addItems(TEST_SKU_1, 3)
+        myCart.updateQuantities({TEST_SKU_1: 7})
+        self.assertDictEqual(myCart._items, Counter({TEST_SKU_1: 7}))
+
+    def test_update_quantities_is_all_or_nothing(self):
+        myCart = Cart(TEST_CUSTOMER_ID, TEST_CATALOGUE, TEST_INVENTORY)
+        myCart.addItems(TEST_SKU_1, 3)
+        with self.assertRaises(ValueError):
+            myCart.updateQuantities({TEST_SKU_1: 7, TEST_SKU_3: 1})
+        self.assertDictEqual(myCart._items, Counter({TEST_SKU_1: 3}))
+
     def test_cannot_add_item_not_in_catalogue(self):
         with self.assertRaises(ValueError):
             myCart = Cart(TEST_CUSTOMER_ID, TEST_CATALOGUE, TEST_INVENTORY)
@@ -82,6 +159,47 @@ class CartTests(unittest.TestCase):
         myCart.addItems(TEST_SKU_3, 15)
         self.assertEqual(myCart.totalCost(myCatalogue), 447.35)
 
+    def test_running_total_follows_cart_changes(self):
+        myCatalogue = Catalogue([Item(TEST_SKU_1, "This is an item!", 0.10), Item(TEST_SKU_2, "Another item!", 0.20)])
+        myInventory = Inventory([InventoryItem(TEST_SKU_1, 100), InventoryItem(TEST_SKU_2, 100)])
+        myCart = Cart(TEST_CUSTOMER_ID, myCatalogue, myInventory)
+        myCart.addItems(TEST_SKU_1, 1)
+        myCart.addItems(TEST_SKU_2, 1)
+        self.assertEqual(myCart.totalCost(myCatalogue), 0.30)
+        myCart.updateItemQuantity(TEST_SKU_1, 3)
+        self.assertEqual(myCart.totalCost(myCatalogue), 0.50)
+        myCart.removeItem(TEST_SKU_2)
+        self.assertEqual(myCart.totalCost(myCatalogue), 0.30)
+        myCart.addItemsBatch([(TEST_SKU_2, 2)])
+        self.assertEqual(myCart.totalCost(myCatalogue), 0.70)
+
+    def test_running_total_follows_price_changes(self):
+        myCatalogue = Catalogue([Item(TEST_SKU_1, "This is an item!", 7.99)])
+        myCart = Cart(TEST_CUSTOMER_ID, myCatalogue, TEST_INVENTORY)
+        myCart.addItems(TEST_SKU_1, 2)
+        myCatalogue.setPrice(TEST_SKU_1, 5.00)
+        self.assertEqual(myCart.totalCost(myCatalogue), 10.00)
+        myCart.addItems(TEST_SKU_1, 1)
+        self.assertEqual(myCart.totalCost(myCatalogue), 15.00)
+
+    def test_unreadable_price_leaves_cart_unchanged(self):
+        myCatalogue = Catalogue([Item(TEST_SKU_1, "This is an item!", 1.00)])
+        myCart = Cart(TEST_CUSTOMER_ID, myCatalogue, TEST_INVENTORY)
+        myCart.addItems(TEST_SKU_1, 1)
+        myCatalogue._items[TEST_SKU_1] = CatalogItem(TEST_SKU_1, "This is an item!", float('nan'))
+        with self.assertRaises(ValueError):
+            myCart.addItems(TEST_SKU_1, 1)
+        with self.assertRaises(ValueError):
+            myCart.addItemsBatch([(TEST_SKU_1, 1)])
+        self.assertEqual(dict(myCart.items()), {TEST_SKU_1: 1})
+
+    def test_total_cost_in_other_catalogue(self):
+        otherCatalogue = Catalogue([Item(TEST_SKU_1, "This is an item!", 1.25)])
+        myCart = Cart(TEST_CUSTOMER_ID, TEST_CATALOGUE, TEST_INVENTORY)
+        myCart.addItems(TEST_SKU_1, 2)
+        self.assertEqual(myCart.totalCost(otherCatalogue), 2.50)
+        self.assertEqual(myCart.totalCost(TEST_CATALOGUE), 200.00)
+
 
 class CustomerIDTests(unittest.TestCase):
     def test_init(self):
@@ -119,6 +237,36 @@ class SKUTests(unittest.TestCase):
         self.assertNotEqual(mySKU._code, myCode)
 
 
+class ValidationCacheTests(unittest.TestCase):
+    def setUp(self):
+        clearValidationCaches()
+
+    def test_repeated_sku_hits_cache(self):
+        SKU.validated(TEST_SKU_1)
+        SKU.validated(TEST_SKU_1)
+        info = validationCacheInfo()["sku"]
+        self.assertEqual(info["misses"], 1)
+        self.assertEqual(info["hits"], 1)
+
+    def test_repeated_customer_id_hits_cache(self):
+        CustomerID.validated(TEST_CUSTOMER_ID)
+        CustomerID.validated(TEST_CUSTOMER_ID)
+        info = validationCacheInfo()["customerId"]
+        self.assertEqual(info["misses"], 1)
+        self.assertEqual(info["hits"], 1)
+
+    def test_cached_invalid_sku_still_rejected(self):
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                SKU.validated("this is not a sku!")
+
+    def test_non_ascii_digits_still_accepted(self):
+        self.assertEqual(SKU.validated('ABC_DEF_\u0661\u0662'), 'ABC_DEF_\u0661\u0662')
+
+    def test_cache_is_bounded(self):
+        self.assertEqual(validationCacheInfo()["sku"]["maxsize"], VALIDATION_CACHE_SIZE)
+
+
 class QuantityTests(unittest.TestCase):
     def test_init(self):
         myQuantity = Quantity(1)
@@ -169,6 +317,13 @@ class ItemTests(unittest.TestCase):
         self.assertNotEqual(myItem._description, myDescription)
         self.assertNotEqual(myItem._price, myPrice)
 
+    def test_rejects_fractional_cents(self):
+        with self.assertRaises(ValueError):
+            Item(TEST_SKU_1, TEST_DESCRIPTION, 0.015)
+        with self.assertRaises(ValueError):
+            Item(TEST_SKU_1, TEST_DESCRIPTION, float('nan'))
+        self.assertEqual(Item(TEST_SKU_1, TEST_DESCRIPTION, 2.99 + 14).price(), 2.99 + 14)
+
 
 class ValidatedStringTests(unittest.TestCase):
     def test_rejects_incorrect_type(self):
@@ -208,6 +363,10 @@ class ValidatedNumberTests(unittest.TestCase):
         with self.assertRaises(ValueError):
             validatedNumber(-1, minimum=1)
     
+    def test_rejects_nan(self):
+        with self.assertRaises(ValueError):
+            validatedNumber(float('nan'))
+
     def accepts_valid_number(self):
         self.assertEquals(validatedNumber(5), 5)
 
@@ -245,6 +404,117 @@ class CatalogueTests(unittest.TestCase):
         with self.assertRaises(TypeError):
             Catalogue("This is not an iterable!")
 
+    def test_set_price(self):
+        myCatalogue = Catalogue([Item(TEST_SKU_1, "This is an item!", 7.99)])
+        version = myCatalogue.version()
+        myCatalogue.setPrice(TEST_SKU_1, 8.99)
+        self.assertEqual(myCatalogue.lookup(TEST_SKU_1).price, 8.99)
+        self.assertGreater(myCatalogue.version(), version)
+
+    def test_set_price_rejects_invalid_price(self):
+        myCatalogue = Catalogue([Item(TEST_SKU_1, "This is an item!", 7.99)])
+        with self.assertRaises(ValueError):
+            myCatalogue.setPrice(TEST_SKU_1, 0)
+        with self.assertRaises(ValueError):
+            myCatalogue.setPrice(TEST_SKU_1, 0.015)
+        with self.assertRaises(ValueError):
+            Catalogue([CatalogItem(TEST_SKU_2, "This is an item!", 0.015)])
+
+
+class CompactCatalogueTests(unittest.TestCase):
+    def setUp(self):
+        items = [
+            Item(TEST_SKU_1, "This is an item!", 7.99),
+            CatalogItem(TEST_SKU_2, "This is an expensive item! \U0001F4B8", 39.99),
+        ]
+        self.myCatalogue = Catalogue(items, compact=True)
+
+    def test_init(self):
+        testItems = dict()
+        testItems[TEST_SKU_1] = CatalogItem(TEST_SKU_1, "This is an item!", 7.99)
+        testItems[TEST_SKU_2] = CatalogItem(TEST_SKU_2, "This is an expensive item! \U0001F4B8", 39.99)
+        self.assertIsInstance(self.myCatalogue._items, ColumnarCatalogItems)
+        self.assertDictEqual(dict(self.myCatalogue._items), testItems)
+
+    def test_lookup(self):
+        self.assertEqual(self.myCatalogue.lookup(TEST_SKU_1), CatalogItem(TEST_SKU_1, "This is an item!", 7.99))
+
+    def test_validate_has(self):
+        self.assertEqual(self.myCatalogue.validateHas(TEST_SKU_2), TEST_SKU_2)
+        with self.assertRaises(ValueError):
+            self.myCatalogue.validateHas(TEST_SKU_3)
+
+    def test_set_price(self):
+        self.myCatalogue.setPrice(TEST_SKU_2, 29.99)
+        self.assertEqual(self.myCatalogue.lookup(TEST_SKU_2).price, 29.99)
+        self.assertEqual(self.myCatalogue.lookup(TEST_SKU_2).description, "This is an expensive item! \U0001F4B8")
+
+    def test_cart_total_cost(self):
+        myCart = Cart(TEST_CUSTOMER_ID, self.myCatalogue, TEST_INVENTORY)
+        myCart.addItems(TEST_SKU_1, 5)
+        self.assertEqual(myCart.totalCost(self.myCatalogue), 39.95)
+
+    def test_reclaims_space(self):
+        items = self.myCatalogue._items
+        for price in range(1, 101):
+            self.myCatalogue.apply_delta([CatalogItem(TEST_SKU_1, f'Description number {price}', price),
+                                          CatalogItem(TEST_SKU_3, f'Another description {price}', price)])
+            if price < 100:
+                self.myCatalogue.apply_delta([TEST_SKU_3])
+        self.assertEqual(len(items._prices), 3)
+        self.assertLessEqual(len(items._descriptions), 2 * sum(len(item.description.encode('utf-8'))
+                                                               for item in items.values()))
+        self.assertEqual(self.myCatalogue.lookup(TEST_SKU_1), CatalogItem(TEST_SKU_1, "Description number 100", 100))
+        self.assertEqual(self.myCatalogue.lookup(TEST_SKU_2),
+                         CatalogItem(TEST_SKU_2, "This is an expensive item! \U0001F4B8", 39.99))
+        self.assertEqual(self.myCatalogue.lookup(TEST_SKU_3), CatalogItem(TEST_SKU_3, "Another description 100", 100))
+
+
+class MappedCatalogueTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "catalogue.bin")
+        items = [
+            Item(TEST_SKU_2, "This is an expensive item! \U0001F4B8", 39.99),
+            CatalogItem(TEST_SKU_1, "This is an item!", 7.99),
+            Item('ABC_DEF_\u0661\u0662', "This item has a Unicode SKU!", 0.50),
+        ]
+        writeCatalogueFile(self.path, items)
+        self.myCatalogue = Catalogue.open_mmap(self.path)
+
+    def tearDown(self):
+        self.myCatalogue._items.close()
+        self.directory.cleanup()
+
+    def test_lookup(self):
+        self.assertEqual(self.myCatalogue.lookup(TEST_SKU_1), CatalogItem(TEST_SKU_1, "This is an item!", 7.99))
+        self.assertEqual(self.myCatalogue.lookup(TEST_SKU_2).description, "This is an expensive item! \U0001F4B8")
+        self.assertEqual(self.myCatalogue.lookup('ABC_DEF_\u0661\u0662').price, 0.50)
+
+    def test_validate_has(self):
+        self.assertEqual(self.myCatalogue.validateHas(TEST_SKU_2), TEST_SKU_2)
+        with self.assertRaises(ValueError):
+            self.myCatalogue.validateHas(TEST_SKU_3)
+        with self.assertRaises(ValueError):
+            self.myCatalogue.validateHas(1)
+
+    def test_iteration(self):
+        self.assertEqual(set(self.myCatalogue._items), {TEST_SKU_1, TEST_SKU_2, 'ABC_DEF_\u0661\u0662'})
+
+    def test_is_read_only(self):
+        with self.assertRaises(TypeError):
+            self.myCatalogue.setPrice(TEST_SKU_1, 1.00)
+
+    def test_rejects_other_files(self):
+        with open(self.path, 'wb') as file:
+            file.write(b'This is not a catalogue file!')
+        with self.assertRaises(ValueError):
+            Catalogue.open_mmap(self.path)
+
+    def test_writer_rejects_invalid_type(self):
+        with self.assertRaises(TypeError):
+            writeCatalogueFile(self.path, ["This is not an item!"])
+
 
 class InventoryTests(unittest.TestCase):
     def test_init(self):
@@ -335,5 +605,608 @@ class InventoryTests(unittest.TestCase):
             TEST_INVENTORY.validateInStock(TEST_SKU_1, 100)
 
 
+class ConcurrentInventoryTests(unittest.TestCase):
+    def test_reserve_takes_stock(self):
+        myInventory = Inventory([InventoryItem(TEST_SKU_1, 5)], concurrent=True)
+        reservation = myInventory.reserve(TEST_SKU_1, 3)
+        self.assertEqual(myInventory.lookup(TEST_SKU_1), 2)
+        self.assertEqual(myInventory.reservations(), [reservation])
+
+    def test_reserve_rejects_quantity_greater_than_stock(self):
+        myInventory = Inventory([InventoryItem(TEST_SKU_1, 5)], concurrent=True)
+        with self.assertRaises(ValueError):
+            myInventory.reserve(TEST_SKU_1, 6)
+        self.assertEqual(myInventory.lookup(TEST_SKU_1), 5)
+
+    def test_commit_keeps_stock_taken(self):
+        myInventory = Inventory([InventoryItem(TEST_SKU_1, 5)], concurrent=True)
+        myInventory.commit(myInventory.reserve(TEST_SKU_1, 3))
+        self.assertEqual(myInventory.lookup(TEST_SKU_1), 2)
+        self.assertEqual(myInventory.reservations(), [])
+
+    def test_release_returns_stock(self):
+        myInventory = Inventory([InventoryItem(TEST_SKU_1, 5)], concurrent=True)
+        myInventory.release(myInventory.reserve(TEST_SKU_1, 3))
+        self.assertEqual(myInventory.lookup(TEST_SKU_1), 5)
+
+    def test_reservation_finishes_only_once(self):
+        myInventory = Inventory([InventoryItem(TEST_SKU_1, 5)])
+        reservation = myInventory.reserve(TEST_SKU_1, 3)
+        myInventory.commit(reservation)
+        with self.assertRaises(ValueError):
+            myInventory.release(reservation)
+        with self.assertRaises(ValueError):
+            myInventory.commit(Reservation(reservation.id + 1, TEST_SKU_1, 3))
+        with self.assertRaises(TypeError):
+            myInventory.commit((reservation.id, TEST_SKU_1, 3))
+
+    def test_reservation_finishes_once_under_contention(self):
+        myInventory = Inventory([InventoryItem(TEST_SKU_1, 100)], concurrent=True)
+        reservations = [myInventory.reserve(TEST_SKU_1, 1) for _ in range(50)]
+        finished = []
+        finishedLock = threading.Lock()
+
+        def finish(method):
+            for reservation in reservations:
+                try:
+                    method(reservation)
+                except ValueError:
+                    continue
+                with finishedLock:
+                    finished.append(reservation)
+
+        threads = [threading.Thread(target=finish, args=(method,))
+                   for method in [myInventory.commit, myInventory.release] * 4]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(reservation.id for reservation in finished),
+                         sorted(reservation.id for reservation in reservations))
+        self.assertEqual(myInventory.reservations(), [])
+
+    def test_mismatched_reservation_stays_outstanding(self):
+        myInventory = Inventory([InventoryItem(TEST_SKU_1, 5)])
+        reservation = myInventory.reserve(TEST_SKU_1, 3)
+        with self.assertRaises(ValueError):
+            myInventory.commit(Reservation(reservation.id, TEST_SKU_1, 2))
+        self.assertEqual(myInventory.reservations(), [reservation])
+
+    def test_no_overselling_under_contention(self):
+        stock = 500
+        myInventory = Inventory([InventoryItem(TEST_SKU_1, stock), InventoryItem(TEST_SKU_2, stock)],
+                                concurrent=True, stripes=4)
+        sold = Counter()
+        soldLock = threading.Lock()
+
+        def customer(sku):
+            for _ in range(200):
+                try:
+                    reservation = myInventory.reserve(sku, 1)
+                except ValueError:
+                    continue
+                myInventory.commit(reservation)
+                with soldLock:
+                    sold[sku] += 1
+
+        threads = [threading.Thread(target=customer, args=(sku,)) for sku in [TEST_SKU_1, TEST_SKU_2] * 4]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sold, Counter({TEST_SKU_1: stock, TEST_SKU_2: stock}))
+        self.assertEqual(myInventory._items, Counter({TEST_SKU_1: 0, TEST_SKU_2: 0}))
+
+
+class HoldSchedulerTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = ManualClock()
+        self.myInventory = Inventory([InventoryItem(TEST_SKU_1, 10), InventoryItem(TEST_SKU_2, 10)])
+        self.myCatalogue = Catalogue([Item(TEST_SKU_1, "This is an item!", 1.00), Item(TEST_SKU_2, "Another item!", 2.00)])
+        self.holds = HoldScheduler(self.myInventory, ttl=60, clock=self.clock)
+
+    def test_hold_expires(self):
+        self.holds.hold(TEST_SKU_1, 4)
+        self.clock.advance(59)
+        self.assertEqual(self.holds.expire(), 0)
+        self.assertEqual(self.myInventory.lookup(TEST_SKU_1), 6)
+        self.clock.advance(1)
+        self.assertEqual(self.holds.expire(), 1)
+        self.assertEqual(self.myInventory.lookup(TEST_SKU_1), 10)
+        self.assertEqual(self.holds.pending(), 0)
+
+    def test_committed_hold_does_not_expire(self):
+        self.myInventory.commit(self.holds.hold(TEST_SKU_1, 4))
+        self.clock.advance(60)
+        self.assertEqual(self.holds.expire(), 0)
+        self.assertEqual(self.myInventory.lookup(TEST_SKU_1), 6)
+
+    def test_cart_holds_stock(self):
+        myCart = Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory, holds=self.holds)
+        myCart.addItems(TEST_SKU_1, 3)
+        myCart.addItems(TEST_SKU_1, 2)
+        self.assertEqual(self.myInventory.lookup(TEST_SKU_1), 5)
+        myCart.updateItemQuantity(TEST_SKU_1, 1)
+        self.assertEqual(self.myInventory.lookup(TEST_SKU_1), 9)
+        myCart.removeItem(TEST_SKU_1)
+        self.assertEqual(self.myInventory.lookup(TEST_SKU_1), 10)
+        self.assertEqual(myCart.holds(), [])
+
+    def test_cart_can_lower_quantity_it_holds(self):
+        myInventory = Inventory([InventoryItem(TEST_SKU_1, 5)])
+        holds = HoldScheduler(myInventory, ttl=60, clock=self.clock)
+        myCart = Cart(TEST_CUSTOMER_ID, self.myCatalogue, myInventory, holds=holds)
+        myCart.addItems(TEST_SKU_1, 5)
+        myCart.updateItemQuantity(TEST_SKU_1, 3)
+        self.assertEqual(myInventory.lookup(TEST_SKU_1), 2)
+        myCart.addItems(TEST_SKU_1, 2)
+        myCart.updateQuantities({TEST_SKU_1: 4})
+        self.assertDictEqual(myCart._items, Counter({TEST_SKU_1: 4}))
+        self.assertEqual(myInventory.lookup(TEST_SKU_1), 1)
+        with self.assertRaises(ValueError):
+            myCart.updateItemQuantity(TEST_SKU_1, 6)
+
+    def test_cart_cannot_hold_more_than_stock(self):
+        myCart = Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory, holds=self.holds)
+        with self.assertRaises(ValueError):
+            myCart.addItemsBatch([(TEST_SKU_2, 5), (TEST_SKU_1, 11)])
+        self.assertDictEqual(myCart._items, Counter())
+        self.assertEqual(self.myInventory.lookup(TEST_SKU_2), 10)
+
+    def test_abandoned_cart_holds_expire(self):
+        myCart = Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory, holds=self.holds)
+        myCart.updateQuantities({TEST_SKU_1: 3, TEST_SKU_2: 4})
+        self.clock.advance(60)
+        self.assertEqual(self.holds.expire(), 2)
+        self.assertEqual(self.myInventory.lookup(TEST_SKU_1), 10)
+        self.assertEqual(self.myInventory.lookup(TEST_SKU_2), 10)
+        myCart.removeItem(TEST_SKU_1)
+        self.assertEqual(self.myInventory.lookup(TEST_SKU_1), 10)
+
+    def test_release_holds(self):
+        myCart = Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory, holds=self.holds)
+        myCart.addItems(TEST_SKU_1, 3)
+        myCart.releaseHolds()
+        self.assertEqual(self.myInventory.lookup(TEST_SKU_1), 10)
+        self.assertDictEqual(myCart._items, Counter({TEST_SKU_1: 3}))
+
+    def test_rejects_scheduler_for_other_inventory(self):
+        with self.assertRaises(ValueError):
+            Cart(TEST_CUSTOMER_ID, self.myCatalogue, TEST_INVENTORY, holds=self.holds)
+
+    def test_background_expiry(self):
+        holds = HoldScheduler(self.myInventory, ttl=0)
+        holds.hold(TEST_SKU_1, 4)
+        holds.start(interval=0.01)
+        try:
+            for _ in range(500):
+                if holds.pending() == 0:
+                    break
+                threading.Event().wait(0.01)
+        finally:
+            holds.stop()
+        self.assertEqual(self.myInventory.lookup(TEST_SKU_1), 10)
+
+
+class FeedLoaderTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        return path
+
+    def test_catalogue_from_csv(self):
+        path = self.write("catalogue.csv", f'price,sku,description\n7.99,{TEST_SKU_1},"An item, with a comma"\n'
+                                           f'39.99,{TEST_SKU_2},Another item\n')
+        (myCatalogue, errors) = Catalogue.from_file(path, chunkSize=1)
+        self.assertEqual(errors, [])
+        self.assertEqual(myCatalogue.lookup(TEST_SKU_1), CatalogItem(TEST_SKU_1, "An item, with a comma", 7.99))
+        self.assertEqual(myCatalogue.lookup(TEST_SKU_2).price, 39.99)
+
+    def test_catalogue_from_csv_reports_oversized_and_undecodable_rows(self):
+        path = os.path.join(self.directory.name, "catalogue.csv")
+        with open(path, 'wb') as file:
+            file.write(f'sku,description,price\n{TEST_SKU_1},"{"x" * 200000}",1.00\n'.encode('utf-8'))
+            file.write(f'{TEST_SKU_2},Bad \xff bytes,1.00\n'.encode('latin-1'))
+            file.write(f'{TEST_SKU_3},An item,2.00\n'.encode('utf-8'))
+        (myCatalogue, errors) = Catalogue.from_file(path)
+        self.assertEqual([error.row for error in errors], [2, 3])
+        self.assertEqual(set(myCatalogue._items), {TEST_SKU_3})
+
+    def test_catalogue_from_jsonl_reports_undecodable_rows(self):
+        path = os.path.join(self.directory.name, "catalogue.jsonl")
+        with open(path, 'wb') as file:
+            file.write(b'{"sku": "ABC_DEF_12", "description": "Bad \xff bytes", "price": 1.00}\n')
+            file.write(json.dumps({"sku": TEST_SKU_2, "description": "An item", "price": 2.00}).encode('utf-8'))
+        (myCatalogue, errors) = Catalogue.from_file(path)
+        self.assertEqual([error.row for error in errors], [1])
+        self.assertEqual(set(myCatalogue._items), {TEST_SKU_2})
+
+    def test_catalogue_from_jsonl_reports_bad_rows(self):
+        path = self.write("catalogue.jsonl", "\n".join([
+            json.dumps({"sku": TEST_SKU_1, "description": "An item", "price": 7.99}),
+            json.dumps({"sku": "not a sku", "description": "A bad item", "price": 1.00}),
+            "this is not json",
+            json.dumps({"sku": TEST_SKU_2, "description": "A free item", "price": 0}),
+            json.dumps({"sku": TEST_SKU_3, "description": "An item with no price"}),
+            json.dumps({"sku": TEST_SKU_3, "description": "A cheap item", "price": 0.50}),
+        ]) + "\n")
+        (myCatalogue, errors) = Catalogue.from_file(path, chunkSize=4, compact=True)
+        self.assertEqual([error.row for error in errors], [2, 3, 4, 5])
+        self.assertEqual(set(myCatalogue._items), {TEST_SKU_1, TEST_SKU_3})
+        self.assertEqual(myCatalogue.lookup(TEST_SKU_3).price, 0.50)
+
+    def test_catalogue_from_csv_rejects_embedded_newlines(self):
+        path = self.write("catalogue.csv", f'sku,description,price\n"{TEST_SKU_1}\n{TEST_SKU_2}",Two SKUs,1.00\n'
+                                           f'{TEST_SKU_3},An item,2.00\n')
+        (myCatalogue, errors) = Catalogue.from_file(path)
+        self.assertEqual([error.row for error in errors], [2])
+        self.assertEqual(set(myCatalogue._items), {TEST_SKU_3})
+
+    def test_catalogue_from_csv_rejects_nan_prices(self):
+        path = self.write("catalogue.csv", f'sku,description,price\n{TEST_SKU_1},An item,nan\n'
+                                           f'{TEST_SKU_2},Another item,1.00\n')
+        (myCatalogue, errors) = Catalogue.from_file(path, compact=True)
+        self.assertEqual([error.row for error in errors], [2])
+        self.assertEqual(set(myCatalogue._items), {TEST_SKU_2})
+
+    def test_catalogue_from_csv_rejects_fractional_cents(self):
+        path = self.write("catalogue.csv", f'sku,description,price\n{TEST_SKU_1},An item,0.015\n'
+                                           f'{TEST_SKU_2},Another item,1.00\n')
+        for compact in (False, True):
+            (myCatalogue, errors) = Catalogue.from_file(path, compact=compact)
+            self.assertEqual([error.row for error in errors], [2])
+            self.assertEqual(set(myCatalogue._items), {TEST_SKU_2})
+
+    def test_inventory_from_csv_reports_bad_rows(self):
+        path = self.write("inventory.csv", f'sku,stock\n{TEST_SKU_1},10\n{TEST_SKU_2},lots\n'
+                                           f'{TEST_SKU_3},0\n{TEST_SKU_3},3,extra\nABC_DEF_\u0661\u0662,4\n')
+        (myInventory, errors) = Inventory.from_file(path)
+        self.assertEqual([error.row for error in errors], [3, 4, 5])
+        self.assertEqual(myInventory._items, Counter({TEST_SKU_1: 10, 'ABC_DEF_\u0661\u0662': 4}))
+
+    def test_inventory_from_jsonl(self):
+        path = self.write("stock.feed", json.dumps({"sku": TEST_SKU_1, "stock": 5}) + "\n\n" +
+                          json.dumps({"sku": TEST_SKU_2, "stock": True}) + "\n")
+        (myInventory, errors) = Inventory.from_file(path, format="jsonl")
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(myInventory._items, Counter({TEST_SKU_1: 5}))
+
+    def test_rejects_missing_columns(self):
+        path = self.write("catalogue.csv", f'sku,price\n{TEST_SKU_1},1.00\n')
+        with self.assertRaises(ValueError):
+            Catalogue.from_file(path)
+
+    def test_rejects_unknown_format(self):
+        path = self.write("catalogue.xml", "<catalogue/>")
+        with self.assertRaises(ValueError):
+            Catalogue.from_file(path)
+
+
+class CatalogueDeltaTests(unittest.TestCase):
+    def setUp(self):
+        self.myCatalogue = Catalogue([Item(TEST_SKU_1, "This is an item!", 1.00), Item(TEST_SKU_2, "Another item!", 2.00)])
+        self.myInventory = Inventory([InventoryItem(TEST_SKU_1, 10), InventoryItem(TEST_SKU_2, 10)])
+
+    def test_upserts_and_deletes(self):
+        version = self.myCatalogue.version()
+        newVersion = self.myCatalogue.apply_delta([
+            CatalogItem(TEST_SKU_1, "This is a cheaper item!", 0.75),
+            Item(TEST_SKU_3, "This is a new item!", 3.00),
+            TEST_SKU_2,
+        ])
+        self.assertEqual(newVersion, version + 1)
+        self.assertEqual(self.myCatalogue.lookup(TEST_SKU_1), CatalogItem(TEST_SKU_1, "This is a cheaper item!", 0.75))
+        self.assertEqual(self.myCatalogue.lookup(TEST_SKU_3).price, 3.00)
+        with self.assertRaises(ValueError):
+            self.myCatalogue.validateHas(TEST_SKU_2)
+
+    def test_delta_is_all_or_nothing(self):
+        with self.assertRaises(ValueError):
+            self.myCatalogue.apply_delta([CatalogItem(TEST_SKU_1, "This is an item!", 5.00),
+                                          CatalogItem(TEST_SKU_2, "This is a free item!", 0)])
+        with self.assertRaises(ValueError):
+            self.myCatalogue.apply_delta([CatalogItem(TEST_SKU_1, "This is an item!", 5.00), TEST_SKU_3])
+        with self.assertRaises(TypeError):
+            self.myCatalogue.apply_delta([CatalogItem(TEST_SKU_1, "This is an item!", 5.00), 1])
+        self.assertEqual(self.myCatalogue.lookup(TEST_SKU_1).price, 1.00)
+
+    def test_carts_reprice_changed_lines(self):
+        myCart = Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory)
+        myCart.addItems(TEST_SKU_1, 2)
+        myCart.addItems(TEST_SKU_2, 1)
+        otherCart = Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory)
+        otherCart.addItems(TEST_SKU_2, 3)
+        self.myCatalogue.apply_delta([CatalogItem(TEST_SKU_1, "This is an item!", 1.50)])
+        self.assertEqual(myCart._subtotalCents, 500)
+        self.assertEqual(otherCart._subtotalCents, 600)
+        self.assertEqual(myCart.totalCost(self.myCatalogue), 5.00)
+
+    def test_removed_lines_are_not_repriced(self):
+        myCart = Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory)
+        myCart.addItems(TEST_SKU_1, 2)
+        myCart.removeItem(TEST_SKU_1)
+        self.assertNotIn(TEST_SKU_1, self.myCatalogue._subscribers)
+        self.myCatalogue.apply_delta([CatalogItem(TEST_SKU_1, "This is an item!", 1.50)])
+        self.assertEqual(myCart.totalCost(self.myCatalogue), 0)
+
+    def test_deleted_item_in_cart(self):
+        myCart = Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory)
+        myCart.addItems(TEST_SKU_1, 2)
+        myCart.addItems(TEST_SKU_2, 1)
+        self.myCatalogue.apply_delta([TEST_SKU_1])
+        with self.assertRaises(ValueError):
+            myCart.totalCost(self.myCatalogue)
+        myCart.removeItem(TEST_SKU_1)
+        self.assertEqual(myCart.totalCost(self.myCatalogue), 2.00)
+
+    def test_compact_catalogue_delta(self):
+        myCatalogue = Catalogue([Item(TEST_SKU_1, "This is an item!", 1.00)], compact=True)
+        myCart = Cart(TEST_CUSTOMER_ID, myCatalogue, self.myInventory)
+        myCart.addItems(TEST_SKU_1, 4)
+        myCatalogue.apply_delta([CatalogItem(TEST_SKU_1, "This is a new description!", 0.25)])
+        self.assertEqual(myCatalogue.lookup(TEST_SKU_1).description, "This is a new description!")
+        self.assertEqual(myCart.totalCost(myCatalogue), 1.00)
+
+
+class CatalogueSearchTests(unittest.TestCase):
+    def setUp(self):
+        self.myCatalogue = Catalogue([
+            Item(TEST_SKU_1, "Red wool scarf", 20.00),
+            Item('ABC_XYZ_99', "Blue wool hat with a red pompom", 15.00),
+            Item(TEST_SKU_2, "Red rubber ball", 2.00),
+            Item(TEST_SKU_3, "Garden hose", 30.00),
+        ])
+
+    def test_sku_prefix(self):
+        self.assertEqual([item.sku for item in self.myCatalogue.search("ABC_*")], [TEST_SKU_1, 'ABC_XYZ_99'])
+        self.assertEqual([item.sku for item in self.myCatalogue.search("ABC_*", limit=1)], [TEST_SKU_1])
+        self.assertEqual(self.myCatalogue.search("ZZZ_*"), [])
+        self.assertEqual(len(self.myCatalogue.search("*")), 4)
+
+    def test_description_search_is_ranked(self):
+        self.assertEqual([item.sku for item in self.myCatalogue.search("red wool")], [TEST_SKU_1, 'ABC_XYZ_99'])
+        self.assertEqual([item.sku for item in self.myCatalogue.search("RED")], [TEST_SKU_1, TEST_SKU_2, 'ABC_XYZ_99'])
+        self.assertEqual([item.sku for item in self.myCatalogue.search("wool hose")], [TEST_SKU_3, TEST_SKU_1, 'ABC_XYZ_99'])
+        self.assertEqual(self.myCatalogue.search("lawnmower"), [])
+
+    def test_search_arguments(self):
+        with self.assertRaises(TypeError):
+            self.myCatalogue.search(1)
+        with self.assertRaises(ValueError):
+            self.myCatalogue.search("red", limit=0)
+
+    def test_index_follows_deltas(self):
+        self.myCatalogue.search("red")
+        self.myCatalogue.apply_delta([
+            CatalogItem(TEST_SKU_1, "Green wool scarf", 20.00),
+            Item('ABC_AAA_00', "Red kite", 8.00),
+            TEST_SKU_2,
+        ])
+        self.assertEqual([item.sku for item in self.myCatalogue.search("red")], ['ABC_AAA_00', 'ABC_XYZ_99'])
+        self.assertEqual([item.sku for item in self.myCatalogue.search("green")], [TEST_SKU_1])
+        self.assertEqual([item.sku for item in self.myCatalogue.search("ABC_*")], ['ABC_AAA_00', TEST_SKU_1, 'ABC_XYZ_99'])
+        self.assertEqual(self.myCatalogue.search("GHI_*"), [])
+
+    def test_compact_and_mapped_catalogues(self):
+        items = [Item(TEST_SKU_1, "Red wool scarf", 20.00), Item(TEST_SKU_2, "Red rubber ball", 2.00)]
+        compact = Catalogue(items, compact=True)
+        self.assertEqual(compact.search("scarf"), [CatalogItem(TEST_SKU_1, "Red wool scarf", 20.00)])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "catalogue.bin")
+            writeCatalogueFile(path, items)
+            mapped = Catalogue.open_mmap(path)
+            self.assertEqual([item.sku for item in mapped.search("ball")], [TEST_SKU_2])
+            mapped._items.close()
+
+
+class CataloguePriceRangeTests(unittest.TestCase):
+    def setUp(self):
+        self.myCatalogue = Catalogue([
+            Item(TEST_SKU_1, "Scarf", 20.00),
+            Item('ABC_XYZ_99', "Hat", 15.00),
+            Item(TEST_SKU_2, "Ball", 2.00),
+            Item(TEST_SKU_3, "Hose", 20.00),
+        ])
+
+    def test_range_in_price_order(self):
+        self.assertEqual([item.sku for item in self.myCatalogue.range(10, 50)], ['ABC_XYZ_99', TEST_SKU_1, TEST_SKU_3])
+        self.assertEqual([item.sku for item in self.myCatalogue.range(2, 2)], [TEST_SKU_2])
+        self.assertEqual([item.sku for item in self.myCatalogue.range(0, 1000)], [TEST_SKU_2, 'ABC_XYZ_99', TEST_SKU_1, TEST_SKU_3])
+        self.assertEqual(self.myCatalogue.range(50, 100), [])
+
+    def test_range_bounds_between_cents(self):
+        self.assertEqual([item.sku for item in self.myCatalogue.range(15.004, 20.006)], [TEST_SKU_1, TEST_SKU_3])
+        self.assertEqual([item.sku for item in self.myCatalogue.range(2.001, 19.999)], ['ABC_XYZ_99'])
+        self.assertEqual([item.sku for item in self.myCatalogue.range(14.996, 15.004)], ['ABC_XYZ_99'])
+        self.myCatalogue.setPrice(TEST_SKU_2, 1.10)
+        self.assertEqual([item.sku for item in self.myCatalogue.range(1.10, 1.10)], [TEST_SKU_2])
+
+    def test_range_without_upper_bound(self):
+        self.assertEqual([item.sku for item in self.myCatalogue.range(15, float('inf'))],
+                         ['ABC_XYZ_99', TEST_SKU_1, TEST_SKU_3])
+
+    def test_pagination(self):
+        self.assertEqual([item.sku for item in self.myCatalogue.range(0, 1000, limit=2)], [TEST_SKU_2, 'ABC_XYZ_99'])
+        self.assertEqual([item.sku for item in self.myCatalogue.range(0, 1000, limit=2, offset=2)], [TEST_SKU_1, TEST_SKU_3])
+        self.assertEqual(self.myCatalogue.range(0, 1000, limit=2, offset=4), [])
+
+    def test_range_arguments(self):
+        with self.assertRaises(TypeError):
+            self.myCatalogue.range("1", 5)
+        with self.assertRaises(ValueError):
+            self.myCatalogue.range(5, 1)
+        with self.assertRaises(ValueError):
+            self.myCatalogue.range(1, 5, limit=0)
+        with self.assertRaises(TypeError):
+            self.myCatalogue.range(1, 5, offset=1.0)
+        with self.assertRaises(ValueError):
+            self.myCatalogue.range(1, 5, offset=-1)
+
+    def test_index_follows_deltas(self):
+        self.myCatalogue.range(0, 1000)
+        self.myCatalogue.apply_delta([
+            CatalogItem(TEST_SKU_1, "Scarf", 12.50),
+            Item('ABC_AAA_00', "Kite", 20.00),
+            TEST_SKU_3,
+        ])
+        self.myCatalogue.setPrice(TEST_SKU_2, 30.00)
+        self.assertEqual([item.sku for item in self.myCatalogue.range(10, 50)], [TEST_SKU_1, 'ABC_XYZ_99', 'ABC_AAA_00', TEST_SKU_2])
+        self.assertEqual(self.myCatalogue.range(12.50, 12.50), [CatalogItem(TEST_SKU_1, "Scarf", 12.50)])
+
+    def test_compact_catalogue(self):
+        myCatalogue = Catalogue([Item(TEST_SKU_1, "Scarf", 20.00), Item(TEST_SKU_2, "Ball", 2.00)], compact=True)
+        self.assertEqual([item.sku for item in myCatalogue.range(1, 100)], [TEST_SKU_2, TEST_SKU_1])
+
+
+class CompactValueTests(unittest.TestCase):
+    def test_value_types_are_slotted(self):
+        myCart = Cart(TEST_CUSTOMER_ID, TEST_CATALOGUE, TEST_INVENTORY)
+        for value in (myCart, Item(TEST_SKU_1, TEST_DESCRIPTION, TEST_PRICE), SKU(TEST_SKU_1), Quantity(1),
+                      CustomerID(TEST_CUSTOMER_ID), myCart.items()):
+            self.assertFalse(hasattr(value, "__dict__"))
+            with self.assertRaises(AttributeError):
+                value.extra = 1
+
+    def test_cart_id(self):
+        myCart = Cart(TEST_CUSTOMER_ID, TEST_CATALOGUE, TEST_INVENTORY)
+        self.assertIsInstance(myCart.id(), uuid.UUID)
+        self.assertEqual(myCart.id(), myCart.id())
+        self.assertNotEqual(myCart.id(), Cart(TEST_CUSTOMER_ID, TEST_CATALOGUE, TEST_INVENTORY).id())
+
+    def test_skus_are_shared(self):
+        requested = ''.join(list(TEST_SKU_1))
+        self.assertIsNot(requested, TEST_SKU_1)
+        myCatalogue = Catalogue([CatalogItem(''.join(list(TEST_SKU_1)), TEST_DESCRIPTION, TEST_PRICE)])
+        myInventory = Inventory([InventoryItem(''.join(list(TEST_SKU_1)), 10)])
+        myCart = Cart(TEST_CUSTOMER_ID, myCatalogue, myInventory)
+        myCart.addItems(requested, 1)
+        (catalogueSKU,) = myCatalogue._items
+        (inventorySKU,) = myInventory._items
+        (cartSKU,) = myCart._items
+        self.assertIs(catalogueSKU, inventorySKU)
+        self.assertIs(cartSKU, catalogueSKU)
+
+    def test_abandoned_carts_unsubscribe(self):
+        myCatalogue = Catalogue([Item(TEST_SKU_1, TEST_DESCRIPTION, TEST_PRICE)])
+        myCart = Cart(TEST_CUSTOMER_ID, myCatalogue, Inventory([InventoryItem(TEST_SKU_1, 10)]))
+        myCart.addItems(TEST_SKU_1, 1)
+        self.assertIn(TEST_SKU_1, myCatalogue._subscribers)
+        del myCart
+        self.assertNotIn(TEST_SKU_1, myCatalogue._subscribers)
+
+
+class CheckoutTests(unittest.TestCase):
+    def setUp(self):
+        self.myInventory = Inventory([InventoryItem(TEST_SKU_1, 10), InventoryItem(TEST_SKU_2, 10)])
+        self.myCatalogue = Catalogue([Item(TEST_SKU_1, "This is an item!", 1.00), Item(TEST_SKU_2, "Another item!", 2.00)])
+
+    def test_checkout(self):
+        myCart = Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory)
+        myCart.addItemsBatch([(TEST_SKU_1, 3), (TEST_SKU_2, 10)])
+        self.assertEqual(checkout(myCart), 23.00)
+        self.assertEqual(self.myInventory._items, Counter({TEST_SKU_1: 7, TEST_SKU_2: 0}))
+        self.assertEqual(myCart.items(), Counter())
+        self.assertEqual(myCart.totalCost(self.myCatalogue), 0)
+        self.assertEqual(self.myCatalogue._subscribers, {})
+
+    def test_checkout_is_all_or_nothing(self):
+        myCart = Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory)
+        myCart.addItemsBatch([(TEST_SKU_1, 3), (TEST_SKU_2, 5)])
+        self.myInventory.setItemStock(TEST_SKU_2, 4)
+        with self.assertRaises(ValueError):
+            checkout(myCart)
+        self.assertEqual(self.myInventory._items, Counter({TEST_SKU_1: 10, TEST_SKU_2: 4}))
+        self.assertEqual(myCart.items(), Counter({TEST_SKU_1: 3, TEST_SKU_2: 5}))
+        self.myCatalogue.apply_delta([TEST_SKU_1])
+        with self.assertRaises(ValueError):
+            checkout(myCart)
+        self.assertEqual(self.myInventory._items, Counter({TEST_SKU_1: 10, TEST_SKU_2: 4}))
+
+    def test_batched_checkouts_all_see_log_failure(self):
+        class FailingLog:
+            def recording(self, *args):
+                raise OSError("Log is not writable")
+
+        carts = [Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory) for _ in range(2)]
+        for myCart in carts:
+            myCart.addItems(TEST_SKU_1, 1)
+        self.myInventory._log = FailingLog()
+        errors = []
+
+        def checkoutCart(myCart):
+            try:
+                checkout(myCart)
+            except OSError as error:
+                errors.append(error)
+
+        with self.myInventory._checkoutLock:
+            threads = [threading.Thread(target=checkoutCart, args=(myCart,)) for myCart in carts]
+            for thread in threads:
+                thread.start()
+            while len(self.myInventory._checkouts) < 2:
+                time.sleep(0.001)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(errors), 2)
+        self.assertEqual([dict(myCart.items()) for myCart in carts], [{TEST_SKU_1: 1}] * 2)
+
+    def test_checkout_arguments(self):
+        with self.assertRaises(TypeError):
+            checkout("cart")
+        with self.assertRaises(ValueError):
+            checkout(Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory))
+
+    def test_checkout_commits_holds(self):
+        clock = ManualClock()
+        holds = HoldScheduler(self.myInventory, ttl=60, clock=clock)
+        myCart = Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory, holds=holds)
+        myCart.addItems(TEST_SKU_1, 3)
+        myCart.addItems(TEST_SKU_2, 4)
+        clock.advance(30)
+        myCart.addItems(TEST_SKU_2, 1)
+        clock.advance(30)
+        holds.expire()
+        self.assertEqual(self.myInventory._items, Counter({TEST_SKU_1: 10, TEST_SKU_2: 9}))
+        checkout(myCart)
+        self.assertEqual(self.myInventory._items, Counter({TEST_SKU_1: 7, TEST_SKU_2: 5}))
+        self.assertEqual(self.myInventory.reservations(), [])
+        self.assertEqual(myCart.holds(), [])
+        clock.advance(60)
+        self.assertEqual(holds.expire(), 0)
+        self.assertEqual(self.myInventory._items, Counter({TEST_SKU_1: 7, TEST_SKU_2: 5}))
+
+    def test_concurrent_checkouts_never_oversell(self):
+        myInventory = Inventory([InventoryItem(TEST_SKU_1, 50), InventoryItem(TEST_SKU_2, 1000)], concurrent=True)
+        carts = []
+        for _ in range(100):
+            myCart = Cart(TEST_CUSTOMER_ID, self.myCatalogue, myInventory)
+            myCart.addItemsBatch([(TEST_SKU_1, 1), (TEST_SKU_2, 2)])
+            carts.append(myCart)
+        outcomes = []
+
+        def worker(myCarts):
+            for myCart in myCarts:
+                try:
+                    checkout(myCart)
+                    outcomes.append(True)
+                except ValueError:
+                    outcomes.append(False)
+
+        threads = [threading.Thread(target=worker, args=(carts[i::8],)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(outcomes.count(True), 50)
+        self.assertEqual(myInventory._items, Counter({TEST_SKU_1: 0, TEST_SKU_2: 900}))
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,175 @@
+"""
+Secondary indexes over the items in a Catalogue. A Catalogue builds these
+lazily the first time they are queried and then keeps them up to date as
+its items change, by calling update(sku, oldItem, newItem) on each of them.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from heapq import nsmallest
+from math import log
+import re
+
+_TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokens(text):
+    """
+    Splits text into the lowercase words the search index matches on.
+    """
+    return _TOKEN_PATTERN.findall(text.casefold())
+
+
+class SearchIndex:
+    """
+    An index for the catalogue's search box. SKUs are kept in sorted order,
+    which answers prefix queries such as ABC_* with a binary search followed
+    by a walk over just the matching SKUs, and descriptions are indexed by
+    an inverted index from each word to the SKUs whose descriptions use it.
+    """
+    def __init__(self, items):
+        """
+        items: a mapping of SKU to CatalogItem
+        """
+        self._skus = sorted(items)
+        self._postings = dict()
+        self._lengths = dict()
+        for (sku, item) in items.items():
+            self._addDescription(sku, item.description)
+
+    def update(self, sku, oldItem, newItem):
+        """
+        Brings the index up to date after an item is added (oldItem is None),
+        changed, or deleted (newItem is None).
+        """
+        if oldItem is None and newItem is not None:
+            insort(self._skus, sku)
+        elif oldItem is not None and newItem is None:
+            del self._skus[bisect_left(self._skus, sku)]
+        oldDescription = None if oldItem is None else oldItem.description
+        newDescription = None if newItem is None else newItem.description
+        if oldDescription != newDescription:
+            if oldDescription is not None:
+                self._removeDescription(sku, oldDescription)
+            if newDescription is not None:
+                self._addDescription(sku, newDescription)
+
+    def skusWithPrefix(self, prefix, limit):
+        """
+        Returns up to `limit` SKUs starting with the given prefix, in order.
+        """
+        found = []
+        position = bisect_left(self._skus, prefix)
+        while position < len(self._skus) and len(found) < limit and self._skus[position].startswith(prefix):
+            found.append(self._skus[position])
+            position += 1
+        return found
+
+    def search(self, text, limit):
+        """
+        Returns up to `limit` SKUs whose descriptions match the words of the
+        given text, best match first. Items using every word are preferred;
+        if there are none, items using any of the words are returned. Matches
+        are ranked by the summed rarity of the words they use, then by the
+        length of their description, so short descriptions made of rare query
+        words rank highest.
+        """
+        postings = [self._postings[word] for word in set(tokens(text)) if word in self._postings]
+        if not postings:
+            return []
+        postings.sort(key=len)
+        weights = [(log(1 + len(self._lengths) / len(skus)), skus) for skus in postings]
+
+        def score(sku):
+            return sum(weight for (weight, skus) in weights if sku in skus)
+
+        candidates = postings[0].intersection(*postings[1:])
+        if not candidates:
+            # Take in the postings rarest first, stopping once no item outside
+            # the candidates could outscore the `limit` best of them, so that
+            # one common word does not make every item a candidate.
+            for (position, (_, skus)) in enumerate(weights):
+                if len(candidates) >= limit:
+                    best = nsmallest(limit, (-score(sku) for sku in candidates))
+                    if -best[-1] > sum(weight for (weight, _) in weights[position:]):
+                        break
+                candidates |= skus
+        return nsmallest(limit, candidates, key=lambda sku: (-score(sku), self._lengths[sku], sku))
+
+    def _addDescription(self, sku, description):
+        """
+        Adds the words of an item's description to the inverted index.
+        """
+        words = tokens(description)
+        self._lengths[sku] = len(words)
+        for word in set(words):
+            skus = self._postings.get(word)
+            if skus is None:
+                skus = self._postings[word] = set()
+            skus.add(sku)
+
+    def _removeDescription(self, sku, description):
+        """
+        Removes the words of an item's old description from the inverted
+        index.
+        """
+        del self._lengths[sku]
+        for word in set(tokens(description)):
+            skus = self._postings[word]
+            skus.discard(sku)
+            if not skus:
+                del self._postings[word]
+
+
+class PriceIndex:
+    """
+    An index of the catalogue's items in order of price, for listing pages
+    that show the items in a price range page by page. Prices are kept in
+    cents in one sorted array, and the SKUs in a parallel list in the same
+    order, with items of equal price ordered by SKU.
+    """
+    def __init__(self, items, toCents):
+        """
+        items: a mapping of SKU to CatalogItem
+        toCents: the function converting a price to whole cents
+        """
+        self._toCents = toCents
+        entries = sorted((toCents(item.price), sku) for (sku, item) in items.items())
+        self._cents = array('q', (cents for (cents, _) in entries))
+        self._skus = [sku for (_, sku) in entries]
+
+    def update(self, sku, oldItem, newItem):
+        """
+        Brings the index up to date after an item is added (oldItem is None),
+        changed, or deleted (newItem is None).
+        """
+        oldCents = None if oldItem is None else self._toCents(oldItem.price)
+        newCents = None if newItem is None else self._toCents(newItem.price)
+        if oldCents == newCents:
+            return
+        if oldCents is not None:
+            position = self._position(oldCents, sku)
+            del self._cents[position]
+            del self._skus[position]
+        if newCents is not None:
+            position = self._position(newCents, sku)
+            self._cents.insert(position, newCents)
+            self._skus.insert(position, sku)
+
+    def range(self, minimum, maximum, limit, offset):
+        """
+        Returns the SKUs of up to `limit` items priced between minimum and
+        maximum cents inclusive, in order of price, skipping the first
+        `offset` of them.
+        """
+        start = bisect_left(self._cents, minimum) + offset
+        end = bisect_right(self._cents, maximum)
+        return self._skus[start:min(start + limit, end)]
+
+    def _position(self, cents, sku):
+        """
+        Returns where an item with the given price sits in the index.
+        """
+        low = bisect_left(self._cents, cents)
+        high = bisect_right(self._cents, cents, low)
+        return bisect_left(self._skus, sku, low, high)
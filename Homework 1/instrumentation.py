@@ -0,0 +1,175 @@
+"""
+Opt-in instrumentation of the hot paths in cart.py: per-operation call and
+error counters and latency histograms, exported as a plain dict or in the
+Prometheus text format.
+
+Instrumentation costs nothing while it is disabled, because nothing in
+cart.py is changed: enableInstrumentation swaps timed wrappers in for the
+instrumented functions and methods, and disableInstrumentation puts the
+originals back. Timings are inclusive, so e.g. the time of Cart.addItems
+includes that of the SKU.validated and Inventory.validateInStock calls it
+makes. Functions imported by name from cart before instrumentation is
+enabled (e.g. `from cart import checkout`) keep calling the original.
+"""
+
+from bisect import bisect_left
+from functools import wraps
+from threading import Lock
+from time import perf_counter
+import cart
+
+BUCKET_BOUNDS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2,
+                 5e-2, 1e-1)
+
+_INSTRUMENTED = (
+    (cart, "validatedString", "validatedString"),
+    (cart, "validatedNumber", "validatedNumber"),
+    (cart.CustomerID, "validated", "CustomerID.validated"),
+    (cart.SKU, "validated", "SKU.validated"),
+    (cart.Quantity, "validated", "Quantity.validated"),
+    (cart.Catalogue, "lookup", "Catalogue.lookup"),
+    (cart.Catalogue, "validateHas", "Catalogue.validateHas"),
+    (cart.Inventory, "validateInStock", "Inventory.validateInStock"),
+    (cart.Inventory, "subtractItem", "Inventory.subtractItem"),
+    (cart.Cart, "addItems", "Cart.addItems"),
+    (cart.Cart, "removeItem", "Cart.removeItem"),
+    (cart.Cart, "updateItemQuantity", "Cart.updateItemQuantity"),
+    (cart.Cart, "addItemsBatch", "Cart.addItemsBatch"),
+    (cart.Cart, "updateQuantities", "Cart.updateQuantities"),
+    (cart, "checkout", "checkout"),
+)
+
+_originals = dict()
+
+
+class _Histogram:
+    """
+    The call count, error count and latency histogram of one operation.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Sets every count back to zero.
+        """
+        with self._lock:
+            self.count = 0
+            self.errors = 0
+            self.seconds = 0.0
+            self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+
+    def observe(self, seconds, failed):
+        """
+        Records one call that took the given time.
+        """
+        with self._lock:
+            self.count += 1
+            self.errors += failed
+            self.seconds += seconds
+            self.buckets[bisect_left(BUCKET_BOUNDS, seconds)] += 1
+
+    def snapshot(self):
+        """
+        Returns the counts as a dict, with cumulative bucket counts keyed by
+        their upper bound.
+        """
+        with self._lock:
+            cumulative = 0
+            buckets = dict()
+            for (bound, count) in zip(BUCKET_BOUNDS + (float('inf'),), self.buckets):
+                cumulative += count
+                buckets[bound] = cumulative
+            return {"count": self.count, "errors": self.errors, "seconds": self.seconds, "buckets": buckets}
+
+
+_histograms = {name: _Histogram() for (_, _, name) in _INSTRUMENTED}
+
+
+def _timed(function, histogram):
+    """
+    Wraps a function so that every call to it is recorded in a histogram.
+    """
+    @wraps(function)
+    def timed(*args, **kwargs):
+        start = perf_counter()
+        failed = True
+        try:
+            result = function(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            histogram.observe(perf_counter() - start, failed)
+    return timed
+
+
+def enableInstrumentation():
+    """
+    Starts recording the instrumented operations.
+    """
+    if _originals:
+        return
+    for (owner, attribute, name) in _INSTRUMENTED:
+        original = vars(owner)[attribute]
+        _originals[name] = original
+        if type(original) is staticmethod:
+            setattr(owner, attribute, staticmethod(_timed(original.__func__, _histograms[name])))
+        else:
+            setattr(owner, attribute, _timed(original, _histograms[name]))
+
+
+def disableInstrumentation():
+    """
+    Stops recording, restoring the uninstrumented operations. The recorded
+    metrics are kept.
+    """
+    for (owner, attribute, name) in _INSTRUMENTED:
+        if name in _originals:
+            setattr(owner, attribute, _originals.pop(name))
+
+
+def instrumentationEnabled():
+    """
+    Returns whether the instrumented operations are being recorded.
+    """
+    return bool(_originals)
+
+
+def resetMetrics():
+    """
+    Sets every recorded count back to zero.
+    """
+    for histogram in _histograms.values():
+        histogram.reset()
+
+
+def metrics():
+    """
+    Returns the recorded metrics as a dict of operation name to its call
+    count, error count, total seconds, and cumulative latency buckets keyed
+    by their upper bound in seconds.
+    """
+    return {name: histogram.snapshot() for (name, histogram) in _histograms.items()}
+
+
+def prometheusText():
+    """
+    Returns the recorded metrics in the Prometheus text exposition format.
+    """
+    snapshots = metrics()
+    lines = [
+        "# HELP cart_operation_seconds Latency of instrumented cart.py operations.",
+        "# TYPE cart_operation_seconds histogram",
+    ]
+    for (name, snapshot) in snapshots.items():
+        for (bound, count) in snapshot["buckets"].items():
+            le = "+Inf" if bound == float('inf') else repr(bound)
+            lines.append(f'cart_operation_seconds_bucket{{operation="{name}",le="{le}"}} {count}')
+        lines.append(f'cart_operation_seconds_sum{{operation="{name}"}} {snapshot["seconds"]!r}')
+        lines.append(f'cart_operation_seconds_count{{operation="{name}"}} {snapshot["count"]}')
+    lines.append("# HELP cart_operation_errors_total Calls of instrumented cart.py operations that raised.")
+    lines.append("# TYPE cart_operation_errors_total counter")
+    for (name, snapshot) in snapshots.items():
+        lines.append(f'cart_operation_errors_total{{operation="{name}"}} {snapshot["errors"]}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,78 @@
+import unittest
+import cart
+from cart import *
+from instrumentation import *
+
+TEST_CUSTOMER_ID = 'ABC12345DE-A'
+TEST_SKU_1 = 'ABC_DEF_12'
+TEST_SKU_2 = 'GHI_JKL_34'
+
+
+class InstrumentationTests(unittest.TestCase):
+    def setUp(self):
+        self.myCatalogue = Catalogue([Item(TEST_SKU_1, "This is an item!", 1.00), Item(TEST_SKU_2, "Another item!", 2.00)])
+        self.myInventory = Inventory([InventoryItem(TEST_SKU_1, 10)])
+        resetMetrics()
+
+    def tearDown(self):
+        disableInstrumentation()
+        resetMetrics()
+
+    def test_disabled_by_default(self):
+        self.assertFalse(instrumentationEnabled())
+        self.assertFalse(hasattr(Cart.addItems, "__wrapped__"))
+        myCart = Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory)
+        myCart.addItems(TEST_SKU_1, 1)
+        self.assertEqual(metrics()["Cart.addItems"]["count"], 0)
+
+    def test_records_operations(self):
+        enableInstrumentation()
+        self.assertTrue(instrumentationEnabled())
+        myCart = Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory)
+        myCart.addItems(TEST_SKU_1, 2)
+        with self.assertRaises(ValueError):
+            myCart.addItems(TEST_SKU_2, 1)
+        cart.checkout(myCart)
+        recorded = metrics()
+        self.assertEqual(recorded["Cart.addItems"]["count"], 2)
+        self.assertEqual(recorded["Cart.addItems"]["errors"], 1)
+        self.assertEqual(recorded["Catalogue.validateHas"]["count"], 2)
+        self.assertEqual(recorded["Inventory.validateInStock"]["count"], 2)
+        self.assertEqual(recorded["Inventory.validateInStock"]["errors"], 1)
+        self.assertEqual(recorded["CustomerID.validated"]["count"], 1)
+        self.assertGreaterEqual(recorded["SKU.validated"]["count"], 2)
+        self.assertEqual(recorded["checkout"]["count"], 1)
+        buckets = recorded["Cart.addItems"]["buckets"]
+        self.assertEqual(buckets[float('inf')], 2)
+        self.assertEqual(list(buckets.values()), sorted(buckets.values()))
+        self.assertGreater(recorded["Cart.addItems"]["seconds"], 0)
+
+    def test_disable_restores_originals(self):
+        original = vars(SKU)["validated"]
+        enableInstrumentation()
+        enableInstrumentation()
+        self.assertTrue(hasattr(Cart.addItems, "__wrapped__"))
+        disableInstrumentation()
+        self.assertIs(vars(SKU)["validated"], original)
+        self.assertFalse(hasattr(Cart.addItems, "__wrapped__"))
+        self.assertFalse(hasattr(cart.checkout, "__wrapped__"))
+        self.assertEqual(SKU.validated(TEST_SKU_1), TEST_SKU_1)
+
+    def test_prometheus_text(self):
+        enableInstrumentation()
+        Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory).addItems(TEST_SKU_1, 1)
+        text = prometheusText()
+        self.assertIn("# TYPE cart_operation_seconds histogram\n", text)
+        self.assertIn('cart_operation_seconds_bucket{operation="Cart.addItems",le="+Inf"} 1\n', text)
+        self.assertIn('cart_operation_seconds_count{operation="Cart.addItems"} 1\n', text)
+        self.assertIn('cart_operation_errors_total{operation="Cart.addItems"} 0\n', text)
+
+    def test_reset(self):
+        enableInstrumentation()
+        Cart(TEST_CUSTOMER_ID, self.myCatalogue, self.myInventory).addItems(TEST_SKU_1, 1)
+        resetMetrics()
+        self.assertTrue(all(snapshot["count"] == 0 for snapshot in metrics().values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,343 @@
+"""
+Optional persistence for an Inventory: an append-only write-ahead log of
+every change to its stock, with group commit and periodic snapshots so that
+the inventory can be recovered quickly after a restart.
+
+A log directory holds one snapshot file and the log of the changes made
+since that snapshot. Each snapshot names the generation of the log that
+follows it, so a crash partway through taking a snapshot never causes a
+change to be replayed twice.
+"""
+
+from threading import Event, Lock, Thread
+from time import monotonic
+from zlib import crc32
+import os
+import struct
+from cart import Inventory, Quantity, Reservation, validatedNumber
+
+SNAPSHOT_FILE = "snapshot"
+SNAPSHOT_MAGIC = b'INVS'
+SNAPSHOT_VERSION = 1
+
+_OPERATIONS = {
+    'add': 1,
+    'subtract': 2,
+    'set': 3,
+    'remove': 4,
+    'reserve': 5,
+    'commit': 6,
+    'release': 7,
+}
+_OPERATION_NAMES = {code: name for (name, code) in _OPERATIONS.items()}
+
+_RECORD_BODY = struct.Struct('<BqqH')
+_SNAPSHOT_HEADER = struct.Struct('<4sIQQQ')
+_SNAPSHOT_ITEM = struct.Struct('<qH')
+_SNAPSHOT_RESERVATION = struct.Struct('<qqH')
+_CHECKSUM = struct.Struct('<I')
+
+
+def _logFile(directory, generation):
+    """
+    Returns the path of the log file of the given generation.
+    """
+    return os.path.join(directory, f'log.{generation}')
+
+
+def _syncDirectory(directory):
+    """
+    Makes renames and file creations in a directory durable.
+    """
+    if hasattr(os, 'O_DIRECTORY'):
+        descriptor = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+
+class _Recording:
+    """
+    The context in which one change is applied to a logged inventory. The
+    log's lock is held while the change is applied, and the change is only
+    appended to the log if it is applied without error.
+    """
+    def __init__(self, log, operation, sku, quantity, reservationId):
+        self._log = log
+        self._operation = operation
+        self._sku = sku
+        self._quantity = quantity
+        self._reservationId = reservationId
+
+    def __enter__(self):
+        self._log._lock.acquire()
+        if self._log._changesSinceSnapshot >= self._log._snapshotEvery:
+            self._log._snapshot()
+        return self
+
+    def __exit__(self, errorType, error, traceback):
+        try:
+            if errorType is None:
+                self._log._append(self._operation, self._sku, self._quantity, self._reservationId)
+        finally:
+            self._log._lock.release()
+        return False
+
+
+class InventoryLog:
+    """
+    A write-ahead log attached to an Inventory. Changes are buffered and
+    written to disk in groups: the buffer is flushed and fsynced once it
+    holds `groupSize` changes or `groupInterval` seconds have passed since
+    the last flush, whichever comes first. A background thread flushes a
+    group that is still waiting once its interval has passed, so a burst of
+    changes followed by a pause is never left unsynced. Every `snapshotEvery` changes the
+    whole inventory is written to a snapshot and the log is started afresh,
+    which bounds the time recovery takes.
+    """
+    def __init__(self, inventory, directory, generation, *, groupSize=256, groupInterval=0.01,
+                 snapshotEvery=1000000):
+        """
+        Use persistInventory or openInventory rather than constructing an
+        InventoryLog directly.
+        """
+        self._inventory = inventory
+        self._directory = directory
+        self._generation = generation
+        self._groupSize = Quantity.validated(groupSize)
+        self._groupInterval = validatedNumber(groupInterval, minimum=0.001)
+        self._snapshotEvery = Quantity.validated(snapshotEvery)
+        self._lock = Lock()
+        self._buffer = bytearray()
+        self._buffered = 0
+        self._lastFlush = monotonic()
+        self._changesSinceSnapshot = 0
+        self._file = open(_logFile(directory, generation), 'ab')
+        self._closed = Event()
+        self._flusher = Thread(target=self._flushPeriodically, daemon=True)
+        self._flusher.start()
+
+    def recording(self, operation, sku, quantity, reservationId):
+        """
+        Returns the context in which the inventory applies a change, so that
+        the change is logged once it succeeds.
+        """
+        return _Recording(self, operation, sku, quantity, reservationId)
+
+    def flush(self):
+        """
+        Writes every buffered change to the log and fsyncs it.
+        """
+        with self._lock:
+            self._flush()
+
+    def snapshot(self):
+        """
+        Writes the whole inventory to a new snapshot and starts a new log.
+        """
+        with self._lock:
+            self._snapshot()
+
+    def close(self):
+        """
+        Flushes the log and detaches it from its inventory.
+        """
+        with self._lock:
+            self._closed.set()
+            self._flush()
+            self._file.close()
+            self._inventory._log = None
+        self._flusher.join()
+
+    def _append(self, operation, sku, quantity, reservationId):
+        """
+        Adds one change to the buffer, flushing the buffer if its group is
+        complete.
+        """
+        encodedSKU = sku.encode('utf-8')
+        body = _RECORD_BODY.pack(_OPERATIONS[operation], quantity, reservationId, len(encodedSKU)) + encodedSKU
+        self._buffer += _CHECKSUM.pack(crc32(body))
+        self._buffer += body
+        self._buffered += 1
+        self._changesSinceSnapshot += 1
+        if self._buffered >= self._groupSize or monotonic() - self._lastFlush >= self._groupInterval:
+            self._flush()
+
+    def _flushPeriodically(self):
+        """
+        Runs in the background thread, flushing buffered changes once
+        `groupInterval` seconds have passed since the last flush, until the
+        log is closed.
+        """
+        while not self._closed.wait(self._groupInterval):
+            with self._lock:
+                if self._closed.is_set():
+                    return
+                if self._buffer and monotonic() - self._lastFlush >= self._groupInterval:
+                    self._flush()
+
+    def _flush(self):
+        """
+        Writes and fsyncs the buffer. The caller must hold the log's lock.
+        """
+        if self._buffer:
+            self._file.write(self._buffer)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._buffer.clear()
+            self._buffered = 0
+        self._lastFlush = monotonic()
+
+    def _snapshot(self):
+        """
+        Writes a snapshot naming the next log generation, switches to that
+        generation, and deletes the previous log. The caller must hold the
+        log's lock, so no change can be applied while the snapshot is taken.
+        """
+        self._flush()
+        self._file.close()
+        previous = self._generation
+        self._generation += 1
+        self._file = open(_logFile(self._directory, self._generation), 'ab')
+        _writeSnapshot(self._directory, self._inventory, self._generation)
+        os.remove(_logFile(self._directory, previous))
+        self._changesSinceSnapshot = 0
+
+
+def _writeSnapshot(directory, inventory, generation):
+    """
+    Atomically replaces the snapshot in a directory with the current state of
+    an inventory, including its outstanding reservations.
+    """
+    items = list(inventory._items.items())
+    reservations = list(inventory._reservations.values())
+    data = bytearray(_SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, generation, len(items),
+                                           len(reservations)))
+    for (sku, stock) in items:
+        encodedSKU = sku.encode('utf-8')
+        data += _SNAPSHOT_ITEM.pack(stock, len(encodedSKU))
+        data += encodedSKU
+    for reservation in reservations:
+        encodedSKU = reservation.sku.encode('utf-8')
+        data += _SNAPSHOT_RESERVATION.pack(reservation.id, reservation.quantity, len(encodedSKU))
+        data += encodedSKU
+    data += _CHECKSUM.pack(crc32(data))
+    temporary = os.path.join(directory, SNAPSHOT_FILE + ".tmp")
+    with open(temporary, 'wb') as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, os.path.join(directory, SNAPSHOT_FILE))
+    _syncDirectory(directory)
+
+
+def _readSnapshot(directory):
+    """
+    Reads the snapshot in a directory, returning its log generation, its
+    items as a dict of SKU to stock, and its outstanding reservations as a
+    dict of reservation id to Reservation.
+    """
+    with open(os.path.join(directory, SNAPSHOT_FILE), 'rb') as file:
+        data = file.read()
+    if len(data) < _SNAPSHOT_HEADER.size + _CHECKSUM.size:
+        raise ValueError("Snapshot is corrupt")
+    (checksum,) = _CHECKSUM.unpack_from(data, len(data) - _CHECKSUM.size)
+    if crc32(memoryview(data)[:-_CHECKSUM.size]) != checksum:
+        raise ValueError("Snapshot is corrupt")
+    (magic, version, generation, itemCount, reservationCount) = _SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError("Not an inventory snapshot")
+    offset = _SNAPSHOT_HEADER.size
+    items = dict()
+    for _ in range(itemCount):
+        (stock, length) = _SNAPSHOT_ITEM.unpack_from(data, offset)
+        offset += _SNAPSHOT_ITEM.size
+        items[data[offset:offset + length].decode('utf-8')] = stock
+        offset += length
+    reservations = dict()
+    for _ in range(reservationCount):
+        (id, quantity, length) = _SNAPSHOT_RESERVATION.unpack_from(data, offset)
+        offset += _SNAPSHOT_RESERVATION.size
+        reservations[id] = Reservation(id, data[offset:offset + length].decode('utf-8'), quantity)
+        offset += length
+    return (generation, items, reservations)
+
+
+def _replay(path, items, reservations):
+    """
+    Applies the changes in a log file to the given items and reservations.
+    Replay stops at the first incomplete or corrupt record, which can only
+    be the tail of a group that was never fsynced.
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+    offset = 0
+    while offset + _CHECKSUM.size + _RECORD_BODY.size <= len(data):
+        (checksum,) = _CHECKSUM.unpack_from(data, offset)
+        (code, quantity, reservationId, length) = _RECORD_BODY.unpack_from(data, offset + _CHECKSUM.size)
+        end = offset + _CHECKSUM.size + _RECORD_BODY.size + length
+        if end > len(data) or crc32(memoryview(data)[offset + _CHECKSUM.size:end]) != checksum \
+                or code not in _OPERATION_NAMES:
+            break
+        sku = data[end - length:end].decode('utf-8')
+        operation = _OPERATION_NAMES[code]
+        if operation == 'add':
+            items[sku] = items.get(sku, 0) + quantity
+        elif operation == 'subtract' or operation == 'reserve':
+            items[sku] = items.get(sku, 0) - quantity
+        elif operation == 'set':
+            items[sku] = quantity
+        elif operation == 'remove':
+            items.pop(sku, None)
+        elif operation == 'release':
+            items[sku] = items.get(sku, 0) + quantity
+        if operation == 'reserve':
+            reservations[reservationId] = Reservation(reservationId, sku, quantity)
+        elif operation == 'commit' or operation == 'release':
+            reservations.pop(reservationId, None)
+        offset = end
+
+
+def persistInventory(inventory, directory, **options):
+    """
+    Starts logging an existing Inventory to an empty directory, writing an
+    initial snapshot of it, and returns the attached InventoryLog. options
+    are passed on to InventoryLog.
+    """
+    if type(inventory) is not Inventory:
+        raise TypeError("Expected Inventory")
+    if inventory._log is not None:
+        raise ValueError("Inventory is already logged")
+    os.makedirs(directory, exist_ok=True)
+    if os.path.exists(os.path.join(directory, SNAPSHOT_FILE)):
+        raise ValueError(f'{directory} already holds a logged inventory')
+    log = InventoryLog(inventory, directory, 0, **options)
+    _writeSnapshot(directory, inventory, 0)
+    inventory._log = log
+    return log
+
+
+def openInventory(directory, *, concurrent=False, **options):
+    """
+    Recovers an Inventory from the snapshot and log in a directory written by
+    persistInventory, and attaches a fresh InventoryLog to it. Reservations
+    that were outstanding when the inventory was last running are released,
+    as no cart can still be holding them. The recovered state is written to
+    a new snapshot straight away, so the old log is never replayed again.
+    """
+    (generation, items, reservations) = _readSnapshot(directory)
+    path = _logFile(directory, generation)
+    if os.path.exists(path):
+        _replay(path, items, reservations)
+    for reservation in reservations.values():
+        items[reservation.sku] = items.get(reservation.sku, 0) + reservation.quantity
+    inventory = Inventory((), concurrent=concurrent)
+    inventory._items.update(items)
+    generation += 1
+    inventory._log = InventoryLog(inventory, directory, generation, **options)
+    _writeSnapshot(directory, inventory, generation)
+    for name in os.listdir(directory):
+        if name.startswith("log.") and name != f'log.{generation}':
+            os.remove(os.path.join(directory, name))
+    return inventory
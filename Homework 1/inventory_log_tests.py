@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from cart import *
+from inventory_log import *
+
+TEST_SKU_1 = 'ABC_DEF_12'
+TEST_SKU_2 = 'GHI_JKL_34'
+TEST_SKU_3 = 'MNO_PQR_56'
+
+
+class InventoryLogTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_recovers_every_mutation(self):
+        myInventory = Inventory([InventoryItem(TEST_SKU_1, 10), InventoryItem(TEST_SKU_2, 5)])
+        log = persistInventory(myInventory, self.path)
+        myInventory.addItem(TEST_SKU_3, 7)
+        myInventory.subtractItem(TEST_SKU_1, 4)
+        myInventory.setItemStock(TEST_SKU_2, 9)
+        myInventory.removeItem(TEST_SKU_3)
+        log.close()
+        self.assertEqual(openInventory(self.path)._items, Counter({TEST_SKU_1: 6, TEST_SKU_2: 9}))
+
+    def test_failed_mutation_is_not_logged(self):
+        myInventory = Inventory([InventoryItem(TEST_SKU_1, 1)])
+        log = persistInventory(myInventory, self.path)
+        with self.assertRaises(ValueError):
+            myInventory.subtractItem(TEST_SKU_1, 2)
+        log.close()
+        self.assertEqual(openInventory(self.path)._items, Counter({TEST_SKU_1: 1}))
+
+    def test_outstanding_reservations_are_released_on_recovery(self):
+        myInventory = Inventory([InventoryItem(TEST_SKU_1, 10)])
+        log = persistInventory(myInventory, self.path)
+        myInventory.commit(myInventory.reserve(TEST_SKU_1, 2))
+        myInventory.release(myInventory.reserve(TEST_SKU_1, 3))
+        myInventory.reserve(TEST_SKU_1, 4)
+        log.close()
+        self.assertEqual(openInventory(self.path)._items, Counter({TEST_SKU_1: 8}))
+
+    def test_recovers_checkouts(self):
+        myInventory = Inventory([InventoryItem(TEST_SKU_1, 10), InventoryItem(TEST_SKU_2, 5)])
+        myCatalogue = Catalogue([Item(TEST_SKU_1, "This is an item!", 1.00), Item(TEST_SKU_2, "Another item!", 2.00)])
+        log = persistInventory(myInventory, self.path)
+        myCart = Cart('ABC12345DE-A', myCatalogue, myInventory, holds=HoldScheduler(myInventory))
+        myCart.addItemsBatch([(TEST_SKU_1, 4), (TEST_SKU_2, 5)])
+        checkout(myCart)
+        log.close()
+        self.assertEqual(openInventory(self.path)._items, Counter({TEST_SKU_1: 6, TEST_SKU_2: 0}))
+
+    def test_idle_changes_are_durable_after_group_interval(self):
+        myInventory = Inventory([InventoryItem(TEST_SKU_1, 1)])
+        log = persistInventory(myInventory, self.path, groupInterval=0.05)
+        myInventory.addItem(TEST_SKU_1, 4)
+        myInventory.addItem(TEST_SKU_1, 6)
+        time.sleep(0.5)
+        with tempfile.TemporaryDirectory() as copy:
+            for name in os.listdir(self.path):
+                shutil.copy(os.path.join(self.path, name), copy)
+            self.assertEqual(openInventory(copy)._items, Counter({TEST_SKU_1: 11}))
+        log.close()
+
+    def test_snapshots_bound_the_log(self):
+        myInventory = Inventory([InventoryItem(TEST_SKU_1, 1)])
+        log = persistInventory(myInventory, self.path, snapshotEvery=10)
+        for _ in range(25):
+            myInventory.addItem(TEST_SKU_1, 1)
+        myInventory.reserve(TEST_SKU_1, 6)
+        log.close()
+        self.assertEqual(len([name for name in os.listdir(self.path) if name.startswith("log.")]), 1)
+        self.assertEqual(openInventory(self.path)._items, Counter({TEST_SKU_1: 26}))
+
+    def test_recovery_ignores_torn_tail(self):
+        myInventory = Inventory([InventoryItem(TEST_SKU_1, 1)])
+        log = persistInventory(myInventory, self.path)
+        myInventory.addItem(TEST_SKU_1, 1)
+        myInventory.addItem(TEST_SKU_1, 1)
+        log.close()
+        [name] = [name for name in os.listdir(self.path) if name.startswith("log.")]
+        with open(os.path.join(self.path, name), 'r+b') as file:
+            file.truncate(os.path.getsize(os.path.join(self.path, name)) - 3)
+        self.assertEqual(openInventory(self.path)._items, Counter({TEST_SKU_1: 2}))
+
+    def test_reopened_inventory_keeps_logging(self):
+        log = persistInventory(Inventory([InventoryItem(TEST_SKU_1, 1)]), self.path)
+        log.close()
+        myInventory = openInventory(self.path)
+        myInventory.reserve(TEST_SKU_1, 1)
+        myInventory._log.close()
+        myInventory = openInventory(self.path)
+        myInventory.commit(myInventory.reserve(TEST_SKU_1, 1))
+        myInventory._log.close()
+        self.assertEqual(openInventory(self.path)._items, Counter({TEST_SKU_1: 0}))
+
+    def test_rejects_directory_in_use(self):
+        persistInventory(Inventory([]), self.path).close()
+        with self.assertRaises(ValueError):
+            persistInventory(Inventory([]), self.path)
+
+    def test_rejects_invalid_options(self):
+        for options in ({"groupInterval": 0}, {"groupInterval": -1}, {"groupSize": 0}, {"snapshotEvery": 0}):
+            with self.assertRaises(ValueError):
+                persistInventory(Inventory([]), self.path, **options)
+        with self.assertRaises(TypeError):
+            persistInventory(Inventory([]), self.path, groupInterval="0.01")
+
+    def test_rejects_corrupt_snapshot(self):
+        persistInventory(Inventory([InventoryItem(TEST_SKU_1, 1)]), self.path).close()
+        with open(os.path.join(self.path, SNAPSHOT_FILE), 'r+b') as file:
+            file.seek(-1, os.SEEK_END)
+            file.write(b'\0')
+        with self.assertRaises(ValueError):
+            openInventory(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
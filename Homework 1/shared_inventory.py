@@ -0,0 +1,148 @@
+"""
+A shared-memory backend for Inventory, so that several worker processes on
+one host can check and change the same stock counters without an external
+database.
+
+The stock of every SKU lives in one slot of an array of 64-bit counters in
+a multiprocessing.shared_memory block. Slots are split into shards, each
+guarded by its own multiprocessing.Lock, and every Inventory operation on
+an item holds its shard's lock, so a check-then-act such as subtractItem is
+atomic across processes.
+"""
+
+from collections.abc import MutableMapping
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from cart import Inventory, InventoryItem, Quantity, SKU
+
+_ABSENT = -1
+_COUNTER_SIZE = 8
+
+
+class SharedStock:
+    """
+    A block of shared-memory stock counters for a fixed set of SKUs, and the
+    shard locks guarding them. A SharedStock can be passed to worker
+    processes (e.g. as a multiprocessing.Process argument), and each process
+    then calls inventory() to get an Inventory backed by the shared counters.
+    The process that created it must call unlink once every process is done.
+    """
+    def __init__(self, items, *, shards=64, context=None):
+        """
+        items: an iterable of InventoryItem namedtuples. Their SKUs are the
+        only ones the shared inventory can ever hold.
+        shards: the number of locks the counters are split between
+        context: the multiprocessing context the worker processes will be
+        started from, if not the default one
+        """
+        stock = dict()
+        try:
+            iter(items)
+        except:
+            raise TypeError("Expected iterable")
+        for item in items:
+            if type(item) is not InventoryItem:
+                raise TypeError("InventoryItem type expected")
+            stock[SKU.validated(item.sku)] = Quantity.validated(item.stock)
+        self._skus = sorted(stock)
+        context = get_context() if context is None else context
+        self._locks = [context.Lock() for _ in range(Quantity.validated(shards))]
+        self._memory = SharedMemory(create=True, size=max(len(self._skus), 1) * _COUNTER_SIZE)
+        self._owner = True
+        self._attach()
+        for (index, sku) in enumerate(self._skus):
+            self._counters[index] = stock[sku]
+
+    def _attach(self):
+        """
+        Builds the SKU index and the view of the counters for this process.
+        """
+        self._indexes = {sku: index for (index, sku) in enumerate(self._skus)}
+        self._counters = self._memory.buf.cast('q')
+
+    def __getstate__(self):
+        return {"name": self._memory.name, "skus": self._skus, "locks": self._locks}
+
+    def __setstate__(self, state):
+        self._skus = state["skus"]
+        self._locks = state["locks"]
+        self._memory = SharedMemory(name=state["name"])
+        self._owner = False
+        self._attach()
+
+    def inventory(self):
+        """
+        Returns an Inventory for this process whose stock is the shared
+        counters.
+        """
+        inventory = Inventory(())
+        inventory._items = SharedStockCounters(self)
+        inventory._locks = self._locks
+        inventory._stripeOf = self.slotOf
+        return inventory
+
+    def slotOf(self, sku):
+        """
+        Returns the slot of an item's counter, which the Inventory uses to
+        pick the item's shard lock. Unlike hash(sku), it is the same in
+        every process.
+        """
+        return self._indexes.get(sku, 0)
+
+    def close(self):
+        """
+        Detaches this process from the shared counters.
+        """
+        self._counters.release()
+        self._memory.close()
+
+    def unlink(self):
+        """
+        Closes and destroys the shared counters. Only the process that
+        created them may do this.
+        """
+        if not self._owner:
+            raise ValueError("Only the creating process may unlink shared stock")
+        self.close()
+        self._memory.unlink()
+
+
+class SharedStockCounters(MutableMapping):
+    """
+    The stock of a SharedStock, presented with the same semantics as the
+    Counter an Inventory normally keeps: missing items have a stock of 0 and
+    deleting a missing item does nothing. Items outside the SharedStock's
+    fixed set of SKUs cannot be given stock.
+    """
+    def __init__(self, stock):
+        self._indexes = stock._indexes
+        self._counters = stock._counters
+
+    def __getitem__(self, sku):
+        index = self._indexes.get(sku)
+        if index is None:
+            return 0
+        return max(self._counters[index], 0)
+
+    def __setitem__(self, sku, quantity):
+        index = self._indexes.get(sku)
+        if index is None:
+            raise ValueError(f'SKU {sku} has no counter in the shared inventory')
+        self._counters[index] = quantity
+
+    def __delitem__(self, sku):
+        index = self._indexes.get(sku)
+        if index is not None:
+            self._counters[index] = _ABSENT
+
+    def __contains__(self, sku):
+        index = self._indexes.get(sku)
+        return index is not None and self._counters[index] != _ABSENT
+
+    def __iter__(self):
+        for (sku, index) in self._indexes.items():
+            if self._counters[index] != _ABSENT:
+                yield sku
+
+    def __len__(self):
+        return sum(1 for _ in self)
@@ -0,0 +1,80 @@
+import multiprocessing
+import unittest
+from cart import *
+from shared_inventory import *
+
+TEST_SKU_1 = 'ABC_DEF_12'
+TEST_SKU_2 = 'GHI_JKL_34'
+TEST_SKU_3 = 'MNO_PQR_56'
+
+
+def buyEverything(stock, sku, attempts, results):
+    """
+    A worker process that tries to buy one of an item `attempts` times and
+    reports how many purchases succeeded.
+    """
+    myInventory = stock.inventory()
+    bought = 0
+    for _ in range(attempts):
+        try:
+            myInventory.subtractItem(sku, 1)
+            bought += 1
+        except ValueError:
+            pass
+    stock.close()
+    results.put(bought)
+
+
+class SharedInventoryTests(unittest.TestCase):
+    def setUp(self):
+        self.stock = SharedStock([InventoryItem(TEST_SKU_1, 10), InventoryItem(TEST_SKU_2, 5)], shards=2)
+        self.myInventory = self.stock.inventory()
+
+    def tearDown(self):
+        self.stock.unlink()
+
+    def test_init(self):
+        self.assertEqual(dict(self.myInventory._items), {TEST_SKU_1: 10, TEST_SKU_2: 5})
+
+    def test_inventory_operations(self):
+        self.myInventory.subtractItem(TEST_SKU_1, 4)
+        self.myInventory.addItem(TEST_SKU_2, 1)
+        self.assertEqual(self.myInventory.lookup(TEST_SKU_1), 6)
+        self.assertEqual(self.myInventory.lookup(TEST_SKU_2), 6)
+        self.myInventory.removeItem(TEST_SKU_2)
+        with self.assertRaises(ValueError):
+            self.myInventory.validateInStock(TEST_SKU_2)
+        self.myInventory.setItemStock(TEST_SKU_2, 3)
+        self.assertEqual(self.myInventory.lookup(TEST_SKU_2), 3)
+
+    def test_rejects_unknown_sku(self):
+        with self.assertRaises(ValueError):
+            self.myInventory.addItem(TEST_SKU_3, 1)
+        with self.assertRaises(ValueError):
+            self.myInventory.validateInStock(TEST_SKU_3)
+
+    def test_inventories_share_stock(self):
+        self.stock.inventory().subtractItem(TEST_SKU_1, 3)
+        self.assertEqual(self.myInventory.lookup(TEST_SKU_1), 7)
+
+    def test_works_with_carts(self):
+        myCatalogue = Catalogue([Item(TEST_SKU_1, "This is an item!", 1.00)])
+        myCart = Cart('ABC12345DE-A', myCatalogue, self.myInventory)
+        myCart.addItems(TEST_SKU_1, 2)
+        self.assertEqual(myCart.totalCost(myCatalogue), 2.00)
+
+    def test_no_overselling_across_processes(self):
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=buyEverything, args=(self.stock, TEST_SKU_1, 8, results))
+                   for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        bought = sum(results.get() for _ in workers)
+        for worker in workers:
+            worker.join()
+        self.assertEqual(bought, 10)
+        self.assertEqual(self.myInventory._items[TEST_SKU_1], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,43 +2,189 @@
 # A small demonstration of an Auto-Key Vigenère cipher using the ciphertext as
 # the key
 
-cipher = {
-    "A": 0,
-    "B": 1,
-    "C": 2,
-    "D": 3,
-    "E": 4,
-    "F": 5,
-    "G": 6,
-    "H": 7,
-    "I": 8,
-    "J": 9,
-    "K": 10,
-    "L": 11,
-    "M": 12,
-    "N": 13,
-    "O": 14,
-    "P": 15,
-    "Q": 16,
-    "R": 17,
-    "S": 18,
-    "T": 19,
-    "U": 20,
-    "V": 21,
-    "W": 22,
-    "X": 23,
-    "Y": 24,
-    "Z": 25
-}
+from itertools import accumulate, repeat
+from operator import add, mod
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+MAX_ALPHABET_SIZE = 128
+CHUNK_SIZE = 1 << 20
+_INVALID = 255
 
 plaintext = "TAKEACOPYOFYOURPOLICYTONORMAWILCOXONTHETHIRDFLOOR"
 key = "QUARK"
-ciphertext = ""
-for i in range(len(plaintext)):
-    encodedLetter = list(cipher.keys())[
-        (cipher[plaintext[i]] + cipher[key[i]]) % 26]
-    if len(key) < len(plaintext):
-        key += encodedLetter
-    ciphertext += encodedLetter
-print(f'KEY: {key}')
-print(f'CIPHERTEXT: {ciphertext}')
+
+
+class Alphabet:
+    """
+    The symbols a cipher works over, with the translation tables that map
+    between encoded text and the indexes of its symbols. Symbols are single
+    characters encodable in Latin-1, so text is handled as bytes and the
+    tables work with bytes.translate.
+    """
+    __slots__ = ('symbols', 'size', 'toIndexes', 'toSymbols', 'offset', 'reduce')
+
+    def __init__(self, symbols=ALPHABET):
+        """
+        symbols: a string of distinct characters, in order
+        """
+        if type(symbols) is not str:
+            raise TypeError("Alphabet must be a string")
+        if not 2 <= len(symbols) <= MAX_ALPHABET_SIZE or len(set(symbols)) != len(symbols):
+            raise ValueError(f'Alphabet must have 2 to {MAX_ALPHABET_SIZE} distinct symbols')
+        try:
+            encoded = symbols.encode('latin-1')
+        except UnicodeEncodeError:
+            raise ValueError("Alphabet symbols must be encodable in Latin-1")
+        size = len(encoded)
+        toIndexes = bytearray([_INVALID]) * 256
+        for (index, symbol) in enumerate(encoded):
+            toIndexes[symbol] = index
+        self.symbols = symbols
+        self.size = size
+        self.toIndexes = bytes(toIndexes)
+        self.toSymbols = encoded + bytes(256 - size)
+        # Index i maps to i + size, and every value up to 2 * size - 1 maps
+        # back to its remainder, so differences can be taken without borrows.
+        self.offset = bytes(range(size, 2 * size)) + bytes(256 - size)
+        self.reduce = bytes(i % size for i in range(2 * size)) + bytes(256 - 2 * size)
+
+    def indexes(self, text):
+        """
+        Returns the symbol indexes of encoded text.
+        """
+        indexes = text.translate(self.toIndexes)
+        if _INVALID in indexes:
+            raise ValueError("Text contains characters outside the alphabet")
+        return indexes
+
+    def encode(self, text):
+        """
+        Encodes a string for the cipher.
+        """
+        if type(text) is not str:
+            raise TypeError("Expected str")
+        try:
+            return text.encode('latin-1')
+        except UnicodeEncodeError:
+            raise ValueError("Text contains characters outside the alphabet")
+
+
+class AutokeyVigenere:
+    """
+    An autokey Vigenère cipher whose key is a primer followed by the
+    ciphertext itself: the ciphertext symbol at position i is the plaintext
+    symbol shifted by the ciphertext symbol at i - len(primer).
+
+    Decryption only needs the ciphertext, so it is a vectorized subtraction.
+    Encryption makes every ciphertext symbol depend on the one len(primer)
+    positions before it, but that makes each residue class of positions a
+    running sum of its plaintext, which is computed a column at a time.
+    """
+    def __init__(self, primer, alphabet=ALPHABET):
+        """
+        primer: the key the first len(primer) symbols are shifted by
+        alphabet: the symbols of the plaintext, ciphertext and primer
+        """
+        self._alphabet = Alphabet(alphabet)
+        self._primer = self._alphabet.indexes(self._alphabet.encode(primer))
+        if not self._primer:
+            raise ValueError("Primer must not be empty")
+
+    def encrypt(self, text):
+        """
+        Encrypts a string.
+        """
+        return b''.join(self.encryptStream([self._alphabet.encode(text)])).decode('latin-1')
+
+    def decrypt(self, text):
+        """
+        Decrypts a string.
+        """
+        return b''.join(self.decryptStream([self._alphabet.encode(text)])).decode('latin-1')
+
+    def encryptStream(self, chunks):
+        """
+        Encrypts a stream of encoded text chunks of any sizes, yielding the
+        ciphertext of each. The last len(primer) ciphertext symbols are
+        carried over as the key of the next chunk.
+        """
+        alphabet = self._alphabet
+        state = self._primer
+        for chunk in chunks:
+            ciphertext = _runningSums(alphabet.indexes(chunk), state, alphabet.size)
+            state = _nextState(state, ciphertext)
+            yield ciphertext.translate(alphabet.toSymbols)
+
+    def decryptStream(self, chunks):
+        """
+        Decrypts a stream of encoded ciphertext chunks of any sizes, yielding
+        the plaintext of each.
+        """
+        alphabet = self._alphabet
+        state = self._primer
+        for chunk in chunks:
+            ciphertext = alphabet.indexes(chunk)
+            keys = (state + ciphertext[:len(ciphertext) - len(state)])[:len(ciphertext)]
+            state = _nextState(state, ciphertext)
+            yield _differences(ciphertext, keys, alphabet).translate(alphabet.toSymbols)
+
+
+def _runningSums(indexes, state, size):
+    """
+    Returns the ciphertext indexes of a chunk of plaintext indexes, where
+    state holds the key of the chunk's first len(state) positions.
+    """
+    period = len(state)
+    if not indexes:
+        return b''
+    if numpy is not None:
+        rows = -(-len(indexes) // period)
+        grid = numpy.zeros(rows * period, dtype=numpy.int64)
+        grid[:len(indexes)] = numpy.frombuffer(indexes, dtype=numpy.uint8)
+        grid = grid.reshape(rows, period)
+        grid[0] += numpy.frombuffer(state, dtype=numpy.uint8)
+        numpy.cumsum(grid, axis=0, out=grid)
+        grid %= size
+        return grid.astype(numpy.uint8).tobytes()[:len(indexes)]
+    ciphertext = bytearray(len(indexes))
+    for residue in range(min(period, len(indexes))):
+        sums = accumulate(indexes[residue::period], add, initial=state[residue])
+        next(sums)
+        ciphertext[residue::period] = bytes(map(mod, sums, repeat(size)))
+    return bytes(ciphertext)
+
+
+def _differences(ciphertext, keys, alphabet):
+    """
+    Returns the indexes ciphertext - keys modulo the alphabet size. Without
+    NumPy, the offset ciphertext and the keys are read as two big integers
+    and subtracted at once: every offset byte is larger than every key byte,
+    so no byte borrows from its neighbour.
+    """
+    if numpy is not None:
+        difference = numpy.frombuffer(ciphertext, dtype=numpy.uint8) + numpy.uint8(alphabet.size)
+        difference -= numpy.frombuffer(keys, dtype=numpy.uint8)
+        return difference.tobytes().translate(alphabet.reduce)
+    offset = int.from_bytes(ciphertext.translate(alphabet.offset), 'big')
+    difference = offset - int.from_bytes(keys, 'big')
+    return difference.to_bytes(len(ciphertext), 'big').translate(alphabet.reduce)
+
+
+def _nextState(state, ciphertext):
+    """
+    Returns the key of the next chunk's first len(state) positions.
+    """
+    if len(ciphertext) >= len(state):
+        return ciphertext[len(ciphertext) - len(state):]
+    return state[len(ciphertext):] + ciphertext
+
+
+if __name__ == '__main__':
+    ciphertext = AutokeyVigenere(key).encrypt(plaintext)
+    print(f'KEY: {(key + ciphertext)[:len(plaintext)]}')
+    print(f'CIPHERTEXT: {ciphertext}')
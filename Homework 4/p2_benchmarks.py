@@ -0,0 +1,142 @@
+"""
+Benchmarks for p2.py. Run with `python3 p2_benchmarks.py`.
+"""
+
+import importlib
+import inspect
+import os
+import re
+import time
+from p2 import ALPHABET, CHUNK_SIZE, AutokeyVigenere
+from p2_cryptanalysis import solve
+
+CORPUS_MODULES = ('argparse', 'asyncio', 'collections', 'concurrent.futures', 'contextlib', 'csv', 'datetime',
+                  'decimal', 'difflib', 'email.message', 'functools', 'http.client', 'inspect', 'io', 'itertools',
+                  'json', 'logging', 'multiprocessing', 'os', 'pathlib', 'pickle', 'pydoc', 're', 'shutil', 'socket',
+                  'sqlite3', 'ssl', 'statistics', 'subprocess', 'tarfile', 'tempfile', 'textwrap', 'threading',
+                  'typing', 'unittest', 'urllib.parse', 'urllib.request', 'zipfile')
+
+
+def reportThroughput(name, seconds, size):
+    """
+    Prints the throughput of a benchmark in megabytes per second.
+    """
+    print(f'{name:<48} {size / seconds / 1e6:>10.2f} MB/s')
+
+
+def randomText(size, alphabet=ALPHABET):
+    """
+    Returns size bytes of random text over an alphabet.
+    """
+    symbols = alphabet.encode('latin-1')
+    return os.urandom(size).translate(bytes(symbols[i % len(symbols)] for i in range(256)))
+
+
+def legacyEncrypt(plaintext, key):
+    """
+    The encryption loop as it was before the cipher was made a reusable
+    engine.
+    """
+    cipher = {letter: index for (index, letter) in enumerate(ALPHABET)}
+    ciphertext = ""
+    for i in range(len(plaintext)):
+        encodedLetter = list(cipher.keys())[
+            (cipher[plaintext[i]] + cipher[key[i]]) % 26]
+        if len(key) < len(plaintext):
+            key += encodedLetter
+        ciphertext += encodedLetter
+    return ciphertext
+
+
+def chunked(data, size=CHUNK_SIZE):
+    """
+    Yields data in chunks of the given size.
+    """
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def benchmarkLegacy(size=1 << 20):
+    """
+    Compares the original loop with the engine on text small enough for the
+    loop to finish quickly.
+    """
+    text = randomText(size).decode('latin-1')
+    start = time.perf_counter()
+    expected = legacyEncrypt(text, "QUARK")
+    reportThroughput(f'legacy encrypt ({size >> 20} MB)', time.perf_counter() - start, size)
+    cipher = AutokeyVigenere("QUARK")
+    start = time.perf_counter()
+    assert cipher.encrypt(text) == expected
+    reportThroughput(f'AutokeyVigenere.encrypt ({size >> 20} MB)', time.perf_counter() - start, size)
+
+
+def benchmarkStreaming(megabytes=100, primers=("QUARK", "CRYPTOGRAPHY" * 8)):
+    """
+    Encrypts and decrypts a large text chunk by chunk with primers of several
+    lengths, checking the round trip.
+    """
+    text = randomText(megabytes * 1000000)
+    for primer in primers:
+        cipher = AutokeyVigenere(primer)
+        start = time.perf_counter()
+        ciphertext = b''.join(cipher.encryptStream(chunked(text)))
+        reportThroughput(f'encryptStream ({megabytes} MB, primer {len(primer)})', time.perf_counter() - start,
+                         len(text))
+        start = time.perf_counter()
+        decrypted = b''.join(cipher.decryptStream(chunked(ciphertext)))
+        reportThroughput(f'decryptStream ({megabytes} MB, primer {len(primer)})', time.perf_counter() - start,
+                         len(text))
+        assert decrypted == text
+        del ciphertext, decrypted
+
+
+def englishDocstrings():
+    """
+    Returns the distinct docstrings of a set of standard library modules and
+    their members, as a source of English text that needs no download.
+    """
+    docstrings = dict()
+    for name in CORPUS_MODULES:
+        module = importlib.import_module(name)
+        objects = [module]
+        for (_, member) in inspect.getmembers(module):
+            objects.append(member)
+            if inspect.isclass(member):
+                objects.extend(vars(member).values())
+        for member in objects:
+            docstring = getattr(member, '__doc__', None)
+            if type(docstring) is str:
+                docstrings[docstring] = None
+    return ' '.join(docstrings).upper()
+
+
+def benchmarkCryptanalysis(lengths=(1000, 10000, 100000, 1000000), primers=("QUARK", "PROTOCOL", "CRYPTOGRAPHY")):
+    """
+    Encrypts English text of several lengths and reports how long it takes
+    to solve, with a dictionary of the words in the docstrings and the
+    primers being attacked, and whether the primer and the plaintext were
+    recovered.
+    """
+    text = englishDocstrings()
+    words = set(re.findall('[A-Z]+', text)) | set(primers)
+    text = re.sub('[^A-Z]', '', text)
+    print(f'(dictionary of {len(words)} words, {len(text)} letters of text)')
+    for length in lengths:
+        plaintext = (text * (length // len(text) + 1))[:length]
+        for primer in primers:
+            ciphertext = AutokeyVigenere(primer).encrypt(plaintext)
+            start = time.perf_counter()
+            (found, decrypted) = solve(ciphertext, words=words)
+            seconds = time.perf_counter() - start
+            (withoutWords, _) = solve(ciphertext)
+            print(f'{f"solve ({length} letters, primer {primer})":<48} {seconds:>10.3f} s    '
+                  f'primer {"found" if found == primer else "MISSED"}, '
+                  f'plaintext {"found" if decrypted == plaintext else "MISSED"}, '
+                  f'without dictionary {withoutWords}')
+
+
+if __name__ == '__main__':
+    benchmarkLegacy()
+    benchmarkStreaming()
+    benchmarkCryptanalysis()
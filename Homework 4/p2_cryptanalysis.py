@@ -0,0 +1,283 @@
+"""
+Cryptanalysis of the autokey Vigenère cipher in p2.py.
+
+The cipher's key after the primer is the ciphertext itself, so
+c[i] - c[i - k] is the plaintext at every position past a primer of length
+k. Decrypting the ciphertext's tail with its own first k symbols as the
+primer therefore reveals all of the plaintext but its first k symbols, and
+only the right k makes that text read like the language it was written in.
+The primer length is found by scoring every candidate length that way, with
+the index of coincidence and a chi-squared test against the language's
+letter frequencies. The primer is then the key that makes the first k
+symbols most likely under a trigram model of the rest of the plaintext.
+"""
+
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from math import log
+import os
+from p2 import ALPHABET, Alphabet, AutokeyVigenere
+
+ENGLISH_FREQUENCIES = (
+    0.08167, 0.01492, 0.02782, 0.04253, 0.12702, 0.02228, 0.02015, 0.06094, 0.06966, 0.00153, 0.00772, 0.04025,
+    0.02406, 0.06749, 0.07507, 0.01929, 0.00095, 0.05987, 0.06327, 0.09056, 0.02758, 0.00978, 0.02360, 0.00150,
+    0.01974, 0.00074,
+)
+MAX_KEY_LENGTH = 32
+PARALLEL_MIN_WORK = 1 << 22
+BEAM_WIDTH = 2048
+
+_ciphertext = None
+_scoring = None
+
+
+def counts(indexes, size):
+    """
+    Returns how many times each symbol index occurs in a byte string.
+    """
+    return [indexes.count(index) for index in range(size)]
+
+
+def indexOfCoincidence(indexes, size):
+    """
+    Returns the chance that two symbols drawn from the text without
+    replacement are the same, scaled by the alphabet size so that uniformly
+    random text scores about 1 and English about 1.7.
+    """
+    length = len(indexes)
+    if length < 2:
+        return 0.0
+    return size * sum(count * (count - 1) for count in counts(indexes, size)) / (length * (length - 1))
+
+
+def chiSquared(indexes, frequencies):
+    """
+    Returns the chi-squared statistic of the text's symbol counts against
+    the expected frequencies of each symbol. Lower is a better fit.
+    """
+    length = len(indexes)
+    if length == 0:
+        return float('inf')
+    return sum((count - length * frequency) ** 2 / (length * frequency)
+               for (count, frequency) in zip(counts(indexes, len(frequencies)), frequencies))
+
+
+def kasiski(indexes, length=3, maxPeriod=MAX_KEY_LENGTH):
+    """
+    Kasiski examination: finds the distances between repeats of every
+    n-gram of the given length and returns, for each period up to
+    maxPeriod, how many of those distances it divides. A repeating-key
+    Vigenère cipher shows a peak at its key length. The autokey cipher's key
+    never repeats, so its ciphertext shows no peak, which tells the two
+    apart; its primer length is found by rankKeyLengths instead.
+    """
+    lastSeen = dict()
+    votes = defaultdict(int)
+    for position in range(len(indexes) - length + 1):
+        gram = indexes[position:position + length]
+        previous = lastSeen.get(gram)
+        if previous is not None:
+            distance = position - previous
+            for period in range(2, min(distance, maxPeriod) + 1):
+                if distance % period == 0:
+                    votes[period] += 1
+        lastSeen[gram] = position
+    return dict(sorted(votes.items()))
+
+
+def lagDifferences(ciphertext, period, alphabet=ALPHABET):
+    """
+    Returns the symbol indexes of c[i] - c[i - period] for every position
+    past the first `period` of encoded ciphertext, which is the plaintext
+    there if the primer has that length.
+    """
+    if len(ciphertext) <= period:
+        return b''
+    cipher = AutokeyVigenere(ciphertext[:period].decode('latin-1'), alphabet)
+    return Alphabet(alphabet).indexes(b''.join(cipher.decryptStream([ciphertext[period:]])))
+
+
+def scoreKeyLength(period, ciphertext, alphabet=ALPHABET, frequencies=ENGLISH_FREQUENCIES):
+    """
+    Returns (period, index of coincidence, chi-squared) for the plaintext a
+    primer of the given length would give. Without expected frequencies the
+    chi-squared is None.
+    """
+    plaintext = lagDifferences(ciphertext, period, alphabet)
+    size = Alphabet(alphabet).size
+    return (period, indexOfCoincidence(plaintext, size),
+            None if frequencies is None else chiSquared(plaintext, frequencies))
+
+
+def _initializeWorker(ciphertext, alphabet, frequencies):
+    """
+    Keeps the ciphertext in a worker process, so it is pickled once per
+    worker rather than once per candidate length.
+    """
+    global _ciphertext, _scoring
+    _ciphertext = ciphertext
+    _scoring = (alphabet, frequencies)
+
+
+def _scoreInWorker(period):
+    """
+    Scores a candidate length against the worker's ciphertext.
+    """
+    return scoreKeyLength(period, _ciphertext, *_scoring)
+
+
+def rankKeyLengths(ciphertext, alphabet=ALPHABET, frequencies=ENGLISH_FREQUENCIES, *, maxLength=MAX_KEY_LENGTH,
+                   workers=None):
+    """
+    Scores every primer length from 1 to maxLength and returns the scores,
+    best first: by chi-squared when expected frequencies are given,
+    otherwise by index of coincidence. The lengths are scored across a pool
+    of worker processes unless there is too little work to repay starting
+    one.
+    workers: the number of worker processes, by default one per CPU
+    """
+    ciphertext = _encoded(ciphertext, alphabet)
+    if frequencies is not None and len(frequencies) != len(alphabet):
+        raise ValueError("Expected one frequency per alphabet symbol")
+    if frequencies is not None and not all(frequency > 0 for frequency in frequencies):
+        raise ValueError("Every expected frequency must be positive")
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    if type(workers) is not int:
+        raise TypeError("Expected int")
+    if workers < 1:
+        raise ValueError("At least one worker is required")
+    periods = range(1, min(maxLength, len(ciphertext) - 1) + 1)
+    if workers == 1 or len(periods) < 2 or len(ciphertext) * len(periods) < PARALLEL_MIN_WORK:
+        scores = [scoreKeyLength(period, ciphertext, alphabet, frequencies) for period in periods]
+    else:
+        with ProcessPoolExecutor(min(workers, len(periods)), initializer=_initializeWorker,
+                                 initargs=(ciphertext, alphabet, frequencies)) as executor:
+            scores = list(executor.map(_scoreInWorker, periods))
+    if frequencies is None:
+        return sorted(scores, key=lambda score: (-score[1], score[0]))
+    return sorted(scores, key=lambda score: (score[2], score[0]))
+
+
+class _TrigramModel:
+    """
+    Add-one smoothed unigram, bigram and trigram log-probabilities learned
+    from a text of symbol indexes.
+    """
+    def __init__(self, indexes, size):
+        unigrams = counts(indexes, size)
+        bigrams = [0] * size ** 2
+        trigrams = [0] * size ** 3
+        for position in range(len(indexes) - 1):
+            bigrams[indexes[position] * size + indexes[position + 1]] += 1
+        for position in range(len(indexes) - 2):
+            trigrams[(indexes[position] * size + indexes[position + 1]) * size + indexes[position + 2]] += 1
+        total = len(indexes)
+        self.size = size
+        self.unigram = [log((count + 1) / (total + size)) for count in unigrams]
+        self.bigram = [log((bigrams[pair] + 1) / (unigrams[pair // size] + size)) for pair in range(size ** 2)]
+        self.trigram = [log((trigrams[triple] + 1) / (bigrams[triple // size] + size)) for triple in range(size ** 3)]
+
+    def logProbability(self, context, symbol):
+        """
+        Returns the log-probability of a symbol following the given context,
+        which holds at most the last two symbols.
+        """
+        if len(context) == 0:
+            return self.unigram[symbol]
+        if len(context) == 1:
+            return self.bigram[context[0] * self.size + symbol]
+        return self.trigram[(context[-2] * self.size + context[-1]) * self.size + symbol]
+
+
+def recoverPrimer(ciphertext, period, alphabet=ALPHABET, *, words=None, candidates=5, beamWidth=BEAM_WIDTH):
+    """
+    Returns the most likely primers of the given length, best first. The
+    first `period` plaintext symbols are the only ones the primer affects,
+    and each primer symbol is the ciphertext symbol minus the plaintext
+    symbol it encrypted. Candidates are scored by how likely they make those
+    plaintext symbols under a trigram model learned from the rest of the
+    plaintext.
+
+    Given a list of words, every word of the right length is scored and the
+    right primer is found whenever it is in the list. Otherwise a beam
+    search looks for the primer, scoring it by the same model since primers
+    are usually words too. Short primers made of common letters tend to come
+    first, but the first `period` symbols carry too little information to
+    single out any primer, so the right one is often only among the
+    candidates or missed entirely.
+    """
+    ciphertext = _encoded(ciphertext, alphabet)
+    symbols = Alphabet(alphabet)
+    size = symbols.size
+    indexes = symbols.indexes(ciphertext)
+    if not 0 < period < len(indexes):
+        raise ValueError("Primer length must be positive and shorter than the ciphertext")
+    rest = lagDifferences(ciphertext, period, alphabet)
+    model = _TrigramModel(rest, size)
+
+    def plaintextScore(primer):
+        score = 0.0
+        context = ()
+        for symbol in [(indexes[position] - key) % size for (position, key) in enumerate(primer)] + list(rest[:2]):
+            score += model.logProbability(context[-2:], symbol)
+            context += (symbol,)
+        return score
+
+    if words is not None:
+        primers = set()
+        for word in words:
+            try:
+                encoded = symbols.indexes(symbols.encode(word))
+            except ValueError:
+                continue
+            if len(encoded) == period:
+                primers.add(tuple(encoded))
+        ranked = sorted(primers, key=lambda primer: (-plaintextScore(primer), primer))
+    else:
+        beam = [(0.0, (), ())]
+        for position in range(period):
+            extended = []
+            for (score, prefix, primer) in beam:
+                for symbol in range(size):
+                    key = (indexes[position] - symbol) % size
+                    extended.append((score + model.logProbability(prefix[-2:], symbol)
+                                     + model.logProbability(primer[-2:], key), prefix + (symbol,), primer + (key,)))
+            extended.sort(reverse=True)
+            beam = extended[:beamWidth]
+        finished = []
+        for (score, prefix, primer) in beam:
+            context = prefix
+            for symbol in rest[:2]:
+                score += model.logProbability(context[-2:], symbol)
+                context += (symbol,)
+            finished.append((-score, primer))
+        ranked = [primer for (_, primer) in sorted(finished)]
+    return [''.join(alphabet[key] for key in primer) for primer in ranked[:candidates]]
+
+
+def solve(ciphertext, alphabet=ALPHABET, frequencies=ENGLISH_FREQUENCIES, *, words=None, maxLength=MAX_KEY_LENGTH,
+          workers=None):
+    """
+    Finds the most likely primer of a ciphertext and returns it with the
+    plaintext it decrypts the ciphertext to. Only the first len(primer)
+    symbols of that plaintext depend on getting the primer right.
+    words: a list of words the primer may be, as for recoverPrimer
+    """
+    ciphertext = _encoded(ciphertext, alphabet)
+    ((period, _, _), *_) = rankKeyLengths(ciphertext, alphabet, frequencies, maxLength=maxLength, workers=workers)
+    primers = recoverPrimer(ciphertext, period, alphabet, words=words, candidates=1)
+    if not primers:
+        raise ValueError(f'No word of length {period} fits the ciphertext')
+    primer = primers[0]
+    return (primer, b''.join(AutokeyVigenere(primer, alphabet).decryptStream([ciphertext])).decode('latin-1'))
+
+
+def _encoded(ciphertext, alphabet):
+    """
+    Returns ciphertext given as a string or as encoded bytes as bytes.
+    """
+    if type(ciphertext) is str:
+        return Alphabet(alphabet).encode(ciphertext)
+    if type(ciphertext) is not bytes:
+        raise TypeError("Expected str or bytes")
+    return ciphertext
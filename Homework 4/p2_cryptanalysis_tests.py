@@ -0,0 +1,84 @@
+import unittest
+from unittest import mock
+import p2_cryptanalysis
+from p2 import *
+from p2_cryptanalysis import *
+
+TEST_PRIMER = "QUARK"
+TEST_TEXT = (
+    "It was the best of times, it was the worst of times, it was the age of wisdom, it was the age of foolishness, "
+    "it was the epoch of belief, it was the epoch of incredulity, it was the season of Light, it was the season of "
+    "Darkness, it was the spring of hope, it was the winter of despair, we had everything before us, we had nothing "
+    "before us, we were all going direct to Heaven, we were all going direct the other way. In short, the period "
+    "was so far like the present period, that some of its noisiest authorities insisted on its being received, for "
+    "good or for evil, in the superlative degree of comparison only. There were a king with a large jaw and a queen "
+    "with a plain face, on the throne of England; there were a king with a large jaw and a queen with a fair face, "
+    "on the throne of France. In both countries it was clearer than crystal to the lords of the State preserves of "
+    "loaves and fishes, that things in general were settled for ever."
+)
+TEST_PLAINTEXT = ''.join(letter for letter in TEST_TEXT.upper() if letter in ALPHABET)
+TEST_WORDS = ["QUACK", "QUARK", "QUART", "SPARK", "STARK", "QUIRK", "SHARK", "NOTAWORD", "lowercase"]
+
+
+class StatisticsTests(unittest.TestCase):
+    def test_index_of_coincidence(self):
+        self.assertEqual(indexOfCoincidence(b'\0\0\0\0', 26), 26.0)
+        self.assertEqual(indexOfCoincidence(bytes(range(26)), 26), 0.0)
+        self.assertEqual(indexOfCoincidence(b'\0', 26), 0.0)
+        english = Alphabet().indexes(TEST_PLAINTEXT.encode('latin-1'))
+        self.assertGreater(indexOfCoincidence(english, 26), 1.5)
+
+    def test_chi_squared(self):
+        english = Alphabet().indexes(TEST_PLAINTEXT.encode('latin-1'))
+        ciphertext = Alphabet().indexes(AutokeyVigenere(TEST_PRIMER).encrypt(TEST_PLAINTEXT).encode('latin-1'))
+        self.assertLess(chiSquared(english, ENGLISH_FREQUENCIES), chiSquared(ciphertext, ENGLISH_FREQUENCIES))
+        self.assertEqual(chiSquared(b'', ENGLISH_FREQUENCIES), float('inf'))
+
+    def test_kasiski(self):
+        self.assertEqual(kasiski(b'\1\2\3\0\0\1\2\3', maxPeriod=6), {5: 1})
+        self.assertEqual(kasiski(b'\1\2\3\4'), {})
+
+
+class SolverTests(unittest.TestCase):
+    def setUp(self):
+        self.ciphertext = AutokeyVigenere(TEST_PRIMER).encrypt(TEST_PLAINTEXT)
+
+    def test_ranks_primer_length_first(self):
+        self.assertEqual(rankKeyLengths(self.ciphertext, workers=1)[0][0], len(TEST_PRIMER))
+        self.assertEqual(rankKeyLengths(self.ciphertext, frequencies=None, workers=1)[0][0], len(TEST_PRIMER))
+
+    def test_pool_matches_in_process(self):
+        expected = rankKeyLengths(self.ciphertext, maxLength=8, workers=1)
+        with mock.patch.object(p2_cryptanalysis, 'PARALLEL_MIN_WORK', 0):
+            self.assertEqual(rankKeyLengths(self.ciphertext, maxLength=8, workers=2), expected)
+
+    def test_solve_with_words(self):
+        self.assertEqual(solve(self.ciphertext, words=TEST_WORDS, workers=1), (TEST_PRIMER, TEST_PLAINTEXT))
+
+    def test_recover_primer_candidates(self):
+        self.assertIn(TEST_PRIMER, recoverPrimer(self.ciphertext, len(TEST_PRIMER), words=TEST_WORDS))
+        self.assertEqual(recoverPrimer(self.ciphertext, 4, words=TEST_WORDS), [])
+        with self.assertRaises(ValueError):
+            recoverPrimer(self.ciphertext, 0)
+
+    def test_rejects_invalid_workers(self):
+        with self.assertRaises(TypeError):
+            rankKeyLengths(self.ciphertext, workers=1.0)
+        with self.assertRaises(ValueError):
+            rankKeyLengths(self.ciphertext, workers=0)
+
+    def test_rejects_invalid_frequencies(self):
+        with self.assertRaises(ValueError):
+            rankKeyLengths(self.ciphertext, frequencies=ENGLISH_FREQUENCIES[:25])
+        with self.assertRaises(ValueError):
+            rankKeyLengths(self.ciphertext, frequencies=(0.0,) + (1 / 25,) * 25)
+
+    def test_rejects_invalid_ciphertext(self):
+        with self.assertRaises(TypeError):
+            rankKeyLengths(None)
+        with self.assertRaises(ValueError):
+            rankKeyLengths("not upper case")
+
+
+if __name__ == '__main__':
+    unittest.main()
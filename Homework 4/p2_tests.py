@@ -0,0 +1,125 @@
+import random
+import unittest
+from unittest import mock
+import p2
+from p2 import *
+
+TEST_PRIMER = "QUARK"
+TEST_PLAINTEXT = "TAKEACOPYOFYOURPOLICYTONORMAWILCOXONTHETHIRDFLOOR"
+WIDE_ALPHABET = ''.join(map(chr, range(MAX_ALPHABET_SIZE)))
+BRANCHES = (None,) if p2.numpy is None else (None, p2.numpy)
+
+
+def legacyEncrypt(plaintext, primer, alphabet=ALPHABET):
+    """
+    Encrypts one symbol at a time, as the original demonstration did.
+    """
+    key = list(primer)
+    ciphertext = []
+    for (position, symbol) in enumerate(plaintext):
+        shifted = alphabet[(alphabet.index(symbol) + alphabet.index(key[position])) % len(alphabet)]
+        ciphertext.append(shifted)
+        key.append(shifted)
+    return ''.join(ciphertext)
+
+
+def randomText(length, alphabet, seed):
+    """
+    Returns a reproducible random string over an alphabet.
+    """
+    chooser = random.Random(seed)
+    return ''.join(chooser.choice(alphabet) for _ in range(length))
+
+
+def chunked(data, sizes):
+    """
+    Splits bytes into chunks of the given sizes in turn, repeating them until
+    the data runs out.
+    """
+    chunks = []
+    position = 0
+    while position < len(data):
+        size = sizes[len(chunks) % len(sizes)]
+        chunks.append(data[position:position + size])
+        position += size
+    return chunks
+
+
+class AutokeyVigenereTests(unittest.TestCase):
+    def assertMatchesLegacy(self, plaintext, primer, alphabet=ALPHABET, sizes=None):
+        cipher = AutokeyVigenere(primer, alphabet)
+        expected = legacyEncrypt(plaintext, primer, alphabet)
+        encodedPlaintext = plaintext.encode('latin-1')
+        encodedCiphertext = expected.encode('latin-1')
+        plainChunks = [encodedPlaintext] if sizes is None else chunked(encodedPlaintext, sizes)
+        cipherChunks = [encodedCiphertext] if sizes is None else chunked(encodedCiphertext, sizes)
+        self.assertEqual(b''.join(cipher.encryptStream(plainChunks)), encodedCiphertext)
+        self.assertEqual(b''.join(cipher.decryptStream(cipherChunks)), encodedPlaintext)
+
+    def test_demo_message(self):
+        for module in BRANCHES:
+            with mock.patch.object(p2, 'numpy', module):
+                self.assertEqual(AutokeyVigenere(TEST_PRIMER).encrypt(TEST_PLAINTEXT),
+                                 legacyEncrypt(TEST_PLAINTEXT, TEST_PRIMER))
+                self.assertEqual(AutokeyVigenere(TEST_PRIMER).decrypt(legacyEncrypt(TEST_PLAINTEXT, TEST_PRIMER)),
+                                 TEST_PLAINTEXT)
+
+    def test_chunk_boundaries(self):
+        plaintext = randomText(1000, ALPHABET, 1)
+        for module in BRANCHES:
+            with mock.patch.object(p2, 'numpy', module):
+                for sizes in ([1], [4], [5], [6], [3, 7, 1, 64], [999]):
+                    self.assertMatchesLegacy(plaintext, TEST_PRIMER, sizes=sizes)
+
+    def test_text_shorter_than_primer(self):
+        for module in BRANCHES:
+            with mock.patch.object(p2, 'numpy', module):
+                self.assertMatchesLegacy("ABC", TEST_PRIMER)
+                self.assertMatchesLegacy("", TEST_PRIMER)
+
+    def test_widest_alphabet(self):
+        plaintext = randomText(2000, WIDE_ALPHABET, 2)
+        primer = randomText(13, WIDE_ALPHABET, 3)
+        for module in BRANCHES:
+            with mock.patch.object(p2, 'numpy', module):
+                self.assertMatchesLegacy(plaintext, primer, WIDE_ALPHABET)
+                self.assertMatchesLegacy(plaintext, primer, WIDE_ALPHABET, sizes=[7, 100])
+
+    def test_primer_longer_than_chunks(self):
+        plaintext = randomText(500, ALPHABET, 4)
+        primer = randomText(50, ALPHABET, 5)
+        for module in BRANCHES:
+            with mock.patch.object(p2, 'numpy', module):
+                self.assertMatchesLegacy(plaintext, primer, sizes=[7])
+                self.assertMatchesLegacy(plaintext, primer, sizes=[1, 49, 51])
+
+    @unittest.skipIf(p2.numpy is None, "NumPy is not installed")
+    def test_numpy_branch_matches_pure_python(self):
+        for size in (2, 26, MAX_ALPHABET_SIZE):
+            alphabet = Alphabet(WIDE_ALPHABET[:size])
+            chooser = random.Random(size)
+            indexes = bytes(chooser.randrange(size) for _ in range(3000))
+            state = bytes(chooser.randrange(size) for _ in range(17))
+            keys = bytes(chooser.randrange(size) for _ in range(3000))
+            with mock.patch.object(p2, 'numpy', None):
+                expected = (p2._runningSums(indexes, state, size), p2._differences(indexes, keys, alphabet))
+            self.assertEqual((p2._runningSums(indexes, state, size), p2._differences(indexes, keys, alphabet)),
+                             expected)
+
+    def test_rejects_invalid_alphabet(self):
+        with self.assertRaises(TypeError):
+            Alphabet(None)
+        with self.assertRaises(ValueError):
+            Alphabet("AA")
+        with self.assertRaises(ValueError):
+            Alphabet(''.join(map(chr, range(MAX_ALPHABET_SIZE + 1))))
+
+    def test_rejects_symbols_outside_alphabet(self):
+        with self.assertRaises(ValueError):
+            AutokeyVigenere(TEST_PRIMER).encrypt("lowercase")
+        with self.assertRaises(ValueError):
+            AutokeyVigenere("")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,32 +1,362 @@
 # Author: Kieran Ahn
+# A small demonstration of RSA, with a streaming block framing so that inputs
+# of any length can be encrypted and decrypted in fixed-width blocks.
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import os
+import secrets
 
 p = 100392089237316158323570985008687907853269981005640569039457584007913129640081
 q = 90392089237316158323570985008687907853269981005640569039457584007913129640041
 e = 65537
-block_size = 60
 message = "Scaramouche, Scaramouche, will you do the Fandango? 💃🏽"
 
-N = p * q
-phi = (p - 1) * (q - 1)
+CHUNK_SIZE = 1 << 16
+LENGTH_SIZE = 2
+MILLER_RABIN_ROUNDS = 40
+ENCRYPT_BATCH_BLOCKS = 2048
+DECRYPT_BATCH_BLOCKS = 128
+
+
+class PrivateKey:
+    """
+    An RSA private key that keeps its primes, so that private-key operations
+    can work modulo p and q separately and recombine the results with the
+    Chinese Remainder Theorem. The CRT exponents dp and dq and the inverse
+    qInv are computed once, when the key is made.
+    """
+    __slots__ = ('p', 'q', 'e', 'N', 'd', 'dp', 'dq', 'qInv')
+
+    def __init__(self, p, q, e):
+        """
+        p, q: two distinct primes
+        e: the public exponent, which must be invertible modulo (p-1)(q-1)
+        """
+        for number in (p, q, e):
+            if type(number) is not int:
+                raise TypeError("Key parameters must be integers")
+        if p == q or min(p, q) < 3 or e < 3:
+            raise ValueError("Key parameters are invalid")
+        try:
+            self.d = pow(e, -1, (p - 1) * (q - 1))
+        except ValueError:
+            raise ValueError("Public exponent is not invertible for these primes")
+        self.p = p
+        self.q = q
+        self.e = e
+        self.N = p * q
+        self.dp = self.d % (p - 1)
+        self.dq = self.d % (q - 1)
+        self.qInv = pow(q, -1, p)
+
+    def decrypt(self, value):
+        """
+        Raises a value below N to the private exponent using the CRT. The
+        result is checked by raising it back to the public exponent, which
+        is cheap, so that a faulty computation is never returned.
+        """
+        if type(value) is not int:
+            raise TypeError("Expected int")
+        if not 0 <= value < self.N:
+            raise ValueError("Value is out of range for this key")
+        mp = pow(value, self.dp, self.p)
+        mq = pow(value, self.dq, self.q)
+        result = mq + (self.qInv * (mp - mq) % self.p) * self.q
+        if pow(result, self.e, self.N) != value:
+            raise ArithmeticError("CRT result failed verification")
+        return result
+
+    def sign(self, value):
+        """
+        Returns the signature of a value below N, which verify recovers the
+        value from using only the public key.
+        """
+        return self.decrypt(value)
+
+    def plainDecrypt(self, value):
+        """
+        Raises a value below N to the private exponent over the full modulus,
+        without the CRT. It is much slower than decrypt and kept as the
+        reference its results are checked against.
+        """
+        if type(value) is not int:
+            raise TypeError("Expected int")
+        if not 0 <= value < self.N:
+            raise ValueError("Value is out of range for this key")
+        return pow(value, self.d, self.N)
+
+
+def verify(signature, e, N):
+    """
+    Returns the value a signature made by PrivateKey.sign was made over.
+    """
+    if type(signature) is not int:
+        raise TypeError("Expected int")
+    if not 0 <= signature < N:
+        raise ValueError("Signature is out of range for this key")
+    return pow(signature, e, N)
+
+
+def isProbablePrime(n, rounds=MILLER_RABIN_ROUNDS):
+    """
+    Tests whether n is prime with the Miller-Rabin test, which wrongly
+    accepts a composite with probability at most 4 ** -rounds.
+    """
+    if n < 4:
+        return n in (2, 3)
+    if n % 2 == 0:
+        return False
+    (s, t) = (0, n - 1)
+    while t % 2 == 0:
+        (s, t) = (s + 1, t // 2)
+    for _ in range(rounds):
+        x = pow(secrets.randbelow(n - 3) + 2, t, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(s - 1):
+            x = pow(x, 2, n)
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def randomPrime(bits):
+    """
+    Returns a random prime of exactly the given number of bits.
+    """
+    while True:
+        candidate = secrets.randbits(bits) | (1 << (bits - 1)) | 1
+        if isProbablePrime(candidate):
+            return candidate
+
+
+def generatePrivateKey(bits, e=65537):
+    """
+    Returns a new PrivateKey whose modulus has exactly the given number of
+    bits.
+    """
+    if type(bits) is not int:
+        raise TypeError("Expected int")
+    if bits < 32:
+        raise ValueError("Key size is too small")
+    while True:
+        p = randomPrime(bits - bits // 2)
+        q = randomPrime(bits // 2)
+        if p != q and (p * q).bit_length() == bits and ((p - 1) * (q - 1)) % e != 0:
+            try:
+                return PrivateKey(p, q, e)
+            except ValueError:
+                continue
+
+
+privateKey = PrivateKey(p, q, e)
+N = privateKey.N
+d = privateKey.d
+
+
+def framedBlockSize(N):
+    """
+    Returns the size in bytes of a framed plaintext block for the modulus N:
+    the largest size whose every value is less than N.
+    """
+    return (N.bit_length() - 1) // 8
+
+
+def plaintextBlockSize(N):
+    """
+    Returns how many bytes of plaintext each block carries. Every framed
+    block starts with the length of its plaintext, so the last block of a
+    message can be short without any ambiguity.
+    """
+    size = framedBlockSize(N) - LENGTH_SIZE
+    if size < 1:
+        raise ValueError("Modulus is too small to frame a block")
+    return size
+
+
+def ciphertextBlockSize(N):
+    """
+    Returns the fixed width in bytes of every ciphertext block for the
+    modulus N.
+    """
+    return (N.bit_length() + 7) // 8
+
+
+def rechunked(chunks, size):
+    """
+    Regroups an iterable of byte strings of any lengths into blocks of the
+    given size. The last block is shorter if the input does not divide
+    evenly.
+    """
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        if len(buffer) >= size:
+            whole = len(buffer) - len(buffer) % size
+            view = memoryview(buffer)
+            for start in range(0, whole, size):
+                yield bytes(view[start:start + size])
+            view.release()
+            del buffer[:whole]
+    if buffer:
+        yield bytes(buffer)
+
+
+def encryptBlocks(chunks, e, N):
+    """
+    Encrypts a stream of plaintext byte strings, yielding one fixed-width
+    ciphertext block for every plaintext block.
+    """
+    framedSize = framedBlockSize(N)
+    cipherSize = ciphertextBlockSize(N)
+    for block in rechunked(chunks, plaintextBlockSize(N)):
+        framed = len(block).to_bytes(LENGTH_SIZE, 'big') + block.ljust(framedSize - LENGTH_SIZE, b'\0')
+        yield pow(int.from_bytes(framed, 'big'), e, N).to_bytes(cipherSize, 'big')
+
+
+def decryptBlocks(chunks, key):
+    """
+    Decrypts a stream of ciphertext byte strings produced by encryptBlocks
+    with a PrivateKey, yielding the plaintext of each block.
+    """
+    if type(key) is not PrivateKey:
+        raise TypeError("Expected PrivateKey")
+    framedSize = framedBlockSize(key.N)
+    cipherSize = ciphertextBlockSize(key.N)
+    dataSize = plaintextBlockSize(key.N)
+    for block in rechunked(chunks, cipherSize):
+        if len(block) != cipherSize:
+            raise ValueError("Ciphertext is truncated")
+        framed = key.decrypt(int.from_bytes(block, 'big'))
+        if framed.bit_length() > framedSize * 8:
+            raise ValueError("Ciphertext block is corrupt")
+        framed = framed.to_bytes(framedSize, 'big')
+        length = int.from_bytes(framed[:LENGTH_SIZE], 'big')
+        if length > dataSize:
+            raise ValueError("Ciphertext block is corrupt")
+        yield framed[LENGTH_SIZE:LENGTH_SIZE + length]
+
+
+def readChunks(path, chunkSize=CHUNK_SIZE):
+    """
+    Yields the contents of a file in chunks of the given size.
+    """
+    with open(path, 'rb') as file:
+        while True:
+            chunk = file.read(chunkSize)
+            if not chunk:
+                return
+            yield chunk
+
+
+def writeChunks(path, chunks):
+    """
+    Writes a stream of byte strings to a file, returning the number of bytes
+    written.
+    """
+    written = 0
+    with open(path, 'wb') as file:
+        for chunk in chunks:
+            file.write(chunk)
+            written += len(chunk)
+    return written
+
+
+def encryptFile(inputPath, outputPath, e, N, chunkSize=CHUNK_SIZE):
+    """
+    Encrypts a file into another, holding only one chunk in memory at a time.
+    """
+    return writeChunks(outputPath, encryptBlocks(readChunks(inputPath, chunkSize), e, N))
+
+
+def decryptFile(inputPath, outputPath, key, chunkSize=CHUNK_SIZE):
+    """
+    Decrypts a file written by encryptFile into another, holding only one
+    chunk in memory at a time.
+    """
+    return writeChunks(outputPath, decryptBlocks(readChunks(inputPath, chunkSize), key))
+
+
+def encryptMessage(message, e, N):
+    """
+    Encrypts a string, returning the concatenated ciphertext blocks.
+    """
+    return b''.join(encryptBlocks([message.encode('utf-8')], e, N))
+
+
+def decryptMessage(ciphertext, key):
+    """
+    Decrypts the ciphertext of a string encrypted with encryptMessage.
+    """
+    return b''.join(decryptBlocks([ciphertext], key)).decode('utf-8')
+
+
+def _encryptBatch(batch, e, N):
+    """
+    Encrypts one batch of whole plaintext blocks in a worker process.
+    """
+    return b''.join(encryptBlocks([batch], e, N))
+
+
+def _decryptBatch(batch, key):
+    """
+    Decrypts one batch of whole ciphertext blocks in a worker process.
+    """
+    return b''.join(decryptBlocks([batch], key))
+
+
+def _bulk(data, batchSize, workers, work, *args):
+    """
+    Splits data into batches of batchSize bytes and runs work over them in
+    a pool of worker processes, joining the results in order. Data that
+    would fill fewer than two batches, or a pool of one worker, is worked on
+    in this process, since starting workers would cost more than it saves.
+    """
+    if type(data) is not bytes:
+        raise TypeError("Expected bytes")
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    if type(workers) is not int:
+        raise TypeError("Expected int")
+    if workers < 1:
+        raise ValueError("At least one worker is required")
+    batches = [data[start:start + batchSize] for start in range(0, len(data), batchSize)]
+    if workers == 1 or len(batches) < 2:
+        return b''.join(map(work, batches, *(repeat(arg) for arg in args)))
+    with ProcessPoolExecutor(min(workers, len(batches))) as executor:
+        return b''.join(executor.map(work, batches, *(repeat(arg) for arg in args)))
+
 
-d = pow(e, -1, phi)
+def encryptBulk(data, e, N, *, workers=None, batchBlocks=ENCRYPT_BATCH_BLOCKS):
+    """
+    Encrypts bytes across a pool of worker processes, giving the same
+    ciphertext as encryptBlocks. Each worker is sent batchBlocks plaintext
+    blocks at a time, enough that the cost of pickling a batch is small next
+    to encrypting it.
+    workers: the number of worker processes, by default one per CPU
+    """
+    return _bulk(data, plaintextBlockSize(N) * batchBlocks, workers, _encryptBatch, e, N)
 
-# Encrypting
-utf8message = message.encode('utf-8').hex()
 
-messageBlocks = [utf8message[i:i+block_size*2] for i in range(0, len(utf8message), block_size*2)]
+def decryptBulk(data, key, *, workers=None, batchBlocks=DECRYPT_BATCH_BLOCKS):
+    """
+    Decrypts bytes encrypted with encryptBlocks or encryptBulk across a pool
+    of worker processes. Decrypting a block costs far more than encrypting
+    one, so the default batches are smaller.
+    workers: the number of worker processes, by default one per CPU
+    """
+    if type(key) is not PrivateKey:
+        raise TypeError("Expected PrivateKey")
+    return _bulk(data, ciphertextBlockSize(key.N) * batchBlocks, workers, _decryptBatch, key)
 
-numericMessageBlocks = [int(block, 16) for block in messageBlocks]
-ciphertexts = [pow(block, e, N) for block in numericMessageBlocks]
-hexCiphertexts = [hex(ciphertext) for ciphertext in ciphertexts]
-finalCipherText = "".join(hexCiphertexts)
 
-# Decrypting
-cipherTextInteger = int(finalCipherText, 16)
-decryptedCipherTextInteger = pow(cipherTextInteger, d, N)
+if __name__ == '__main__':
+    finalCipherText = encryptMessage(message, e, N)
 
-print(f'Original Message: {message}\n')
-print(f'N = {N}\n')
-print(f'd = {d}\n')
-print(f'Cipher text: {finalCipherText}\n')
-print(f'Decrypted message: {decryptedCipherTextInteger.to_bytes(block_size, "big").decode("utf-8")}')
+    print(f'Original Message: {message}\n')
+    print(f'N = {N}\n')
+    print(f'd = {d}\n')
+    print(f'Cipher text: {finalCipherText.hex()}\n')
+    print(f'Decrypted message: {decryptMessage(finalCipherText, privateKey)}')
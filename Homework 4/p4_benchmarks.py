@@ -0,0 +1,139 @@
+"""
+Benchmarks for p4.py. Run with `python3 p4_benchmarks.py`.
+"""
+
+import os
+import secrets
+import tempfile
+import time
+import tracemalloc
+from p4 import N, decryptBulk, decryptFile, e, encryptBulk, encryptFile, generatePrivateKey, privateKey, verify
+
+
+def reportThroughput(name, seconds, size, peak=None):
+    """
+    Prints the throughput of a benchmark in megabytes per second, and the
+    peak memory traced while it ran if it was traced.
+    """
+    traced = '' if peak is None else f' {peak / 1024:>8.0f} KiB peak'
+    print(f'{name:<48} {size / seconds / 1e6:>10.3f} MB/s{traced}')
+
+
+def reportRate(name, seconds, operations):
+    """
+    Prints the rate of a benchmark in operations per second.
+    """
+    print(f'{name:<48} {operations / seconds:>10.1f} ops/s')
+
+
+def writeRandomFile(path, size):
+    """
+    Writes a file of random bytes of the given size.
+    """
+    with open(path, 'wb') as file:
+        while size > 0:
+            file.write(os.urandom(min(size, 1 << 20)))
+            size -= 1 << 20
+
+
+def timedTraced(function, *args):
+    """
+    Calls a function, returning the seconds it took and the peak memory
+    traced while it ran.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    function(*args)
+    seconds = time.perf_counter() - start
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (seconds, peak)
+
+
+def benchmarkStreamingEncrypt(megabytes=(1, 4, 16)):
+    """
+    Encrypts multi-megabyte files through the streaming file API. The peak
+    memory stays near the chunk size however large the file is.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        plainPath = os.path.join(directory, 'plain')
+        cipherPath = os.path.join(directory, 'cipher')
+        for size in megabytes:
+            writeRandomFile(plainPath, size << 20)
+            (seconds, peak) = timedTraced(encryptFile, plainPath, cipherPath, e, N)
+            reportThroughput(f'encryptFile ({size} MB)', seconds, size << 20, peak)
+
+
+def benchmarkStreamingDecrypt(kilobytes=(256, 1024)):
+    """
+    Decrypts files through the streaming file API and checks the round trip.
+    Decryption raises to the private exponent, so it is far slower than
+    encryption and is run on smaller files.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        plainPath = os.path.join(directory, 'plain')
+        cipherPath = os.path.join(directory, 'cipher')
+        decryptedPath = os.path.join(directory, 'decrypted')
+        for size in kilobytes:
+            writeRandomFile(plainPath, size << 10)
+            encryptFile(plainPath, cipherPath, e, N)
+            (seconds, peak) = timedTraced(decryptFile, cipherPath, decryptedPath, privateKey)
+            with open(plainPath, 'rb') as original, open(decryptedPath, 'rb') as decrypted:
+                assert original.read() == decrypted.read()
+            reportThroughput(f'decryptFile ({size} KB)', seconds, size << 10, peak)
+
+
+def benchmarkPrivateKey(sizes=(512, 1024, 2048, 3072), operations=50):
+    """
+    Compares private-key operations over the full modulus with the CRT form
+    for keys of several sizes, checking that both give the same results.
+    """
+    for bits in sizes:
+        key = generatePrivateKey(bits)
+        values = [secrets.randbelow(key.N) for _ in range(operations)]
+        start = time.perf_counter()
+        plain = [key.plainDecrypt(value) for value in values]
+        plainSeconds = time.perf_counter() - start
+        start = time.perf_counter()
+        crt = [key.decrypt(value) for value in values]
+        crtSeconds = time.perf_counter() - start
+        assert crt == plain
+        start = time.perf_counter()
+        signatures = [key.sign(value) for value in values]
+        signSeconds = time.perf_counter() - start
+        assert [verify(signature, key.e, key.N) for signature in signatures] == values
+        reportRate(f'plainDecrypt ({bits}-bit)', plainSeconds, operations)
+        reportRate(f'decrypt, CRT ({bits}-bit)', crtSeconds, operations)
+        reportRate(f'sign, CRT ({bits}-bit)', signSeconds, operations)
+
+
+def benchmarkBulkScaling(encryptMegabytes=8, decryptKilobytes=512, maxWorkers=None):
+    """
+    Encrypts and decrypts in bulk with 1 up to maxWorkers worker processes
+    (by default one per CPU), checking that every pool size gives the same
+    output as one worker.
+    """
+    maxWorkers = (os.cpu_count() or 1) if maxWorkers is None else maxWorkers
+    plaintext = os.urandom(encryptMegabytes << 20)
+    expected = None
+    for workers in range(1, maxWorkers + 1):
+        start = time.perf_counter()
+        ciphertext = encryptBulk(plaintext, e, N, workers=workers)
+        seconds = time.perf_counter() - start
+        expected = ciphertext if expected is None else expected
+        assert ciphertext == expected
+        reportThroughput(f'encryptBulk ({encryptMegabytes} MB, {workers} workers)', seconds, len(plaintext))
+    plaintext = plaintext[:decryptKilobytes << 10]
+    ciphertext = encryptBulk(plaintext, e, N, workers=1)
+    for workers in range(1, maxWorkers + 1):
+        start = time.perf_counter()
+        assert decryptBulk(ciphertext, privateKey, workers=workers) == plaintext
+        seconds = time.perf_counter() - start
+        reportThroughput(f'decryptBulk ({decryptKilobytes} KB, {workers} workers)', seconds, len(plaintext))
+
+
+if __name__ == '__main__':
+    benchmarkStreamingEncrypt()
+    benchmarkStreamingDecrypt()
+    benchmarkPrivateKey()
+    benchmarkBulkScaling()
@@ -0,0 +1,133 @@
+import os
+import random
+import tempfile
+import unittest
+from p4 import *
+
+TEST_MESSAGE = "Scaramouche, Scaramouche, will you do the Fandango? 💃🏽"
+
+
+def chunked(data, size):
+    """
+    Splits bytes into chunks of the given size.
+    """
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+class FramingTests(unittest.TestCase):
+    def setUp(self):
+        self.blockSize = plaintextBlockSize(N)
+        self.cipherSize = ciphertextBlockSize(N)
+
+    def roundTrip(self, data):
+        ciphertext = b''.join(encryptBlocks(chunked(data, 7), e, N))
+        self.assertEqual(b''.join(decryptBlocks(chunked(ciphertext, 11), privateKey)), data)
+        return ciphertext
+
+    def test_empty_input(self):
+        self.assertEqual(self.roundTrip(b''), b'')
+        self.assertEqual(decryptMessage(encryptMessage("", e, N), privateKey), "")
+
+    def test_one_block(self):
+        self.assertEqual(len(self.roundTrip(b'x')), self.cipherSize)
+        self.assertEqual(len(self.roundTrip(os.urandom(self.blockSize))), self.cipherSize)
+
+    def test_many_blocks(self):
+        self.assertEqual(len(self.roundTrip(os.urandom(self.blockSize * 3 + 5))), self.cipherSize * 4)
+        self.assertEqual(len(self.roundTrip(os.urandom(self.blockSize * 3))), self.cipherSize * 3)
+
+    def test_message(self):
+        self.assertEqual(decryptMessage(encryptMessage(TEST_MESSAGE, e, N), privateKey), TEST_MESSAGE)
+
+    def test_file(self):
+        data = os.urandom(self.blockSize * 10 + 3)
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, name) for name in ("plain", "cipher", "decrypted")]
+            with open(paths[0], 'wb') as file:
+                file.write(data)
+            encryptFile(paths[0], paths[1], e, N, chunkSize=100)
+            self.assertEqual(decryptFile(paths[1], paths[2], privateKey, chunkSize=33), len(data))
+            with open(paths[2], 'rb') as file:
+                self.assertEqual(file.read(), data)
+
+    def test_rejects_truncated_ciphertext(self):
+        ciphertext = encryptMessage(TEST_MESSAGE, e, N)
+        with self.assertRaises(ValueError):
+            decryptMessage(ciphertext[:-1], privateKey)
+
+    def test_rejects_corrupt_ciphertext(self):
+        framedSize = framedBlockSize(N)
+        outOfRange = (N + 1).to_bytes(self.cipherSize, 'big')
+        tooWide = pow(256 ** framedSize + 1, e, N).to_bytes(self.cipherSize, 'big')
+        badLength = pow(int.from_bytes(b'\xff' * framedSize, 'big'), e, N).to_bytes(self.cipherSize, 'big')
+        for block in (outOfRange, tooWide, badLength):
+            with self.assertRaises(ValueError):
+                b''.join(decryptBlocks([block], privateKey))
+
+    def test_rejects_tiny_modulus(self):
+        with self.assertRaises(ValueError):
+            plaintextBlockSize(3 * 5 * 7)
+
+
+class PrivateKeyTests(unittest.TestCase):
+    def test_crt_matches_plain_decrypt(self):
+        for key in (privateKey, generatePrivateKey(512), generatePrivateKey(1024)):
+            chooser = random.Random(key.N)
+            for value in [0, 1, key.N - 1] + [chooser.randrange(key.N) for _ in range(20)]:
+                self.assertEqual(key.decrypt(value), key.plainDecrypt(value))
+
+    def test_sign_and_verify(self):
+        key = generatePrivateKey(512)
+        self.assertEqual(verify(key.sign(12345), key.e, key.N), 12345)
+
+    def test_generated_key_size(self):
+        self.assertEqual(generatePrivateKey(256).N.bit_length(), 256)
+
+    def test_rejects_faulty_crt_result(self):
+        key = generatePrivateKey(256)
+        key.dp += 1
+        with self.assertRaises(ArithmeticError):
+            key.decrypt(pow(42, key.e, key.N))
+
+    def test_rejects_invalid_values(self):
+        with self.assertRaises(TypeError):
+            privateKey.decrypt(1.0)
+        with self.assertRaises(ValueError):
+            privateKey.decrypt(N)
+        with self.assertRaises(ValueError):
+            privateKey.plainDecrypt(-1)
+        with self.assertRaises(ValueError):
+            PrivateKey(7, 7, 3)
+
+
+class BulkTests(unittest.TestCase):
+    def setUp(self):
+        self.data = os.urandom(plaintextBlockSize(N) * 9 + 4)
+        self.expected = b''.join(encryptBlocks([self.data], e, N))
+
+    def test_bulk_matches_in_process(self):
+        ciphertext = encryptBulk(self.data, e, N, workers=2, batchBlocks=2)
+        self.assertEqual(ciphertext, self.expected)
+        self.assertEqual(decryptBulk(ciphertext, privateKey, workers=2, batchBlocks=3), self.data)
+
+    def test_small_input_stays_in_process(self):
+        self.assertEqual(encryptBulk(self.data, e, N, workers=4), self.expected)
+        self.assertEqual(encryptBulk(self.data, e, N, workers=1, batchBlocks=2), self.expected)
+        self.assertEqual(decryptBulk(self.expected, privateKey, workers=4), self.data)
+        self.assertEqual(encryptBulk(b'', e, N), b'')
+
+    def test_bulk_rejects_truncated_ciphertext(self):
+        with self.assertRaises(ValueError):
+            decryptBulk(self.expected[:-1], privateKey, workers=2, batchBlocks=3)
+
+    def test_rejects_invalid_arguments(self):
+        with self.assertRaises(TypeError):
+            encryptBulk("text", e, N)
+        with self.assertRaises(TypeError):
+            decryptBulk(self.expected, (N, d))
+        with self.assertRaises(ValueError):
+            encryptBulk(self.data, e, N, workers=0)
+
+
+if __name__ == '__main__':
+    unittest.main()